@@ -0,0 +1,20 @@
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+
+from constants import BOT_TOKEN
+from handlers import common, admin, superadmin, student
+
+
+def create_bot() -> Bot:
+    """Бот с настройками по умолчанию (HTML-разметка сообщений)"""
+    return Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+
+
+def create_dispatcher(storage) -> Dispatcher:
+    """Диспетчер с зарегистрированными роутерами (main, воркеры супервизора и нагрузочный тест)"""
+    dp = Dispatcher(storage=storage)
+    dp.include_router(common.router)
+    dp.include_router(admin.router)
+    dp.include_router(superadmin.router)
+    dp.include_router(student.router)
+    return dp
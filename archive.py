@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from constants import ARCHIVE_HORIZON_DAYS, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveJob:
+    """Фоновый перенос истории в архивную базу.
+
+    Раз в interval секунд проведённые и отменённые уроки и сообщения
+    старше horizon_days дней переносятся из горячих таблиц в архив
+    (Database.archive_history), так что рабочие запросы читают только
+    актуальные данные. Архив читается лишь методами, вызванными с
+    include_history=True.
+    """
+
+    def __init__(self, horizon_days: int = ARCHIVE_HORIZON_DAYS, interval: float = ARCHIVE_INTERVAL,
+                 batch_size: int = ARCHIVE_BATCH_SIZE):
+        self.horizon_days = horizon_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.moved = {'lessons': 0, 'messages': 0}
+        self.last_run: Optional[float] = None
+        self.last_duration = 0.0
+
+    def start(self):
+        """Запустить периодический перенос"""
+        if self._task is not None or not Database._archive_path:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"🗄 Архивация истории запущена (старше {self.horizon_days} дн., раз в {self.interval:.0f} с)")
+
+    async def stop(self):
+        """Остановить перенос (текущая порция успевает зафиксироваться или откатывается)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Сбой одного запуска не должен останавливать архивацию до перезапуска процесса
+                logger.error(f"❌ Ошибка архивации истории: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> Dict[str, int]:
+        """Перенести в архив всё, что старше горизонта"""
+        started = time.perf_counter()
+        cutoff = int(time.time()) - self.horizon_days * 86400
+        # sent_at хранится как CURRENT_TIMESTAMP — строка в UTC
+        sent_cutoff = datetime.fromtimestamp(cutoff, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        moved = await Database.archive_history(cutoff, sent_cutoff, self.batch_size)
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - started
+        for table, count in moved.items():
+            self.moved[table] = self.moved.get(table, 0) + count
+        if any(moved.values()):
+            logger.info(f"🗄 В архив перенесено: уроков {moved.get('lessons', 0)}, "
+                        f"сообщений {moved.get('messages', 0)} за {self.last_duration * 1000:.0f} мс")
+        return moved
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика переносов"""
+        return {
+            'runs': self.runs,
+            'moved': dict(self.moved),
+            'last_run': self.last_run,
+            'last_duration_ms': round(self.last_duration * 1000, 1),
+        }
+
+
+# Глобальный экземпляр
+archive_job = ArchiveJob()
@@ -0,0 +1,254 @@
+import bisect
+import logging
+import time
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import TTLCache, MISSING
+from constants import (LESSON_DURATION_MINUTES, WORKING_HOURS_START, WORKING_HOURS_END, WORKING_DAYS,
+                       FREE_SLOT_STEP_MINUTES, AVAILABILITY_HORIZON_DAYS, AVAILABILITY_CACHE_SIZE,
+                       AVAILABILITY_CACHE_TTL)
+from database import Database
+from timezones import local_date_bounds, local_to_timestamp, parse_local_datetime, timestamp_to_local
+
+logger = logging.getLogger(__name__)
+
+# Полуоткрытый интервал [начало, конец) в UNIX-времени
+Interval = Tuple[int, int]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Отсортировать интервалы и слить пересекающиеся и смежные"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(base: List[Interval], cuts: List[Interval]) -> List[Interval]:
+    """Вычесть из слитых интервалов base слитые интервалы cuts (один проход по обоим)"""
+    result: List[Interval] = []
+    j = 0
+    for start, end in base:
+        while j < len(cuts) and cuts[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(cuts) and cuts[k][0] < end:
+            if cuts[k][0] > start:
+                result.append((start, cuts[k][0]))
+            start = max(start, cuts[k][1])
+            if start >= end:
+                break
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _day_start(day: date, zone: tzinfo) -> int:
+    return local_to_timestamp(datetime(day.year, day.month, day.day), zone)
+
+
+def working_intervals(date_from: date, date_to: date, zone: tzinfo) -> List[Interval]:
+    """Рабочее время по дням периода (включительно) в поясе репетитора"""
+    intervals = []
+    day = date_from
+    while day <= date_to:
+        if day.weekday() in WORKING_DAYS:
+            midnight = datetime(day.year, day.month, day.day)
+            intervals.append((local_to_timestamp(midnight + timedelta(hours=WORKING_HOURS_START), zone),
+                              local_to_timestamp(midnight + timedelta(hours=WORKING_HOURS_END), zone)))
+        day += timedelta(days=1)
+    return intervals
+
+
+class _Calendar:
+    """Занятость репетитора за загруженный период, в виде отсортированных массивов"""
+
+    __slots__ = ('date_from', 'date_to', 'busy', 'busy_ends', 'extra')
+
+    def __init__(self, date_from: date, date_to: date, busy: List[Interval], extra: List[Interval]):
+        self.date_from = date_from
+        self.date_to = date_to
+        # Слитые интервалы отсортированы и по началу, и по концу — по концам ищем бинарным поиском
+        self.busy = busy
+        self.busy_ends = [end for _, end in busy]
+        self.extra = extra
+
+    def covers(self, date_from: date, date_to: date) -> bool:
+        return self.date_from <= date_from and date_to <= self.date_to
+
+    def busy_between(self, start: int, end: int) -> List[Interval]:
+        """Интервалы занятости, пересекающие [start, end)"""
+        i = bisect.bisect_right(self.busy_ends, start)
+        j = bisect.bisect_left(self.busy, (end,), lo=i)
+        return self.busy[i:j]
+
+
+class AvailabilityEngine:
+    """Свободные окна репетиторов.
+
+    Свободное время = (рабочие часы ∪ добавленные слоты) − (уроки ∪
+    занятые слоты ∪ отпуска). Календарь репетитора загружается одним
+    обращением к базе на AVAILABILITY_HORIZON_DAYS вперёд и хранится в
+    кэше в виде слитых отсортированных интервалов; запрос окон — это
+    проход по интервалам периода. Кэш сбрасывается по событиям Database
+    (новый или отменённый урок, новый слот или отпуск, смена пояса репетитора).
+    Без start() календарь читается из базы при каждом запросе.
+    """
+
+    def __init__(self, cache_size: int = AVAILABILITY_CACHE_SIZE, ttl: float = AVAILABILITY_CACHE_TTL):
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._started = False
+        self._listeners = {
+            'lesson_added': self._on_tutor_event,
+            'lesson_cancelled': self._on_tutor_event,
+            'lessons_generated': self._on_tutor_event,
+            'slot_added': self._on_tutor_event,
+            'vacation_added': self._on_tutor_event,
+            'user_changed': self._on_user_changed,
+        }
+        self.loads = 0
+        self.load_time = 0.0
+
+    def start(self):
+        """Подписаться на изменения данных и включить кэш"""
+        if self._started:
+            return
+        for event, callback in self._listeners.items():
+            Database.add_listener(event, callback)
+        self._started = True
+        logger.info("🕐 Расчёт свободных окон запущен")
+
+    def stop(self):
+        """Отписаться от событий и очистить кэш"""
+        for event, callback in self._listeners.items():
+            Database.remove_listener(event, callback)
+        self._started = False
+        self._cache.clear()
+
+    def invalidate(self, tutor_id: Optional[int] = None):
+        """Сбросить календарь репетитора (без tutor_id — все)"""
+        if tutor_id is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(tutor_id)
+
+    def _on_tutor_event(self, tutor_id: Optional[int] = None, **_):
+        self.invalidate(tutor_id)
+
+    def _on_user_changed(self, user_id: int, **_):
+        # Пояс репетитора определяет, как читаются даты слотов и отпусков
+        self._cache.invalidate(user_id)
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика кэша и загрузок календарей"""
+        return {
+            **self._cache.stats(),
+            'loads': self.loads,
+            'avg_load_ms': round(self.load_time / self.loads * 1000, 2) if self.loads else 0.0,
+        }
+
+    async def _load(self, tutor_id: int, zone: tzinfo, date_from: date, date_to: date) -> _Calendar:
+        started = time.perf_counter()
+        start_ts = _day_start(date_from, zone)
+        end_ts = _day_start(date_to + timedelta(days=1), zone)
+        rows = await Database.get_tutor_calendar(tutor_id, start_ts, end_ts, date_from.isoformat(),
+                                                 date_to.isoformat())
+        duration = LESSON_DURATION_MINUTES * 60
+
+        busy = [(starts_at, starts_at + duration) for (starts_at,) in rows['lessons'] if starts_at is not None]
+        extra = []
+        for slot_date, slot_time, is_booked in rows['slots']:
+            local = parse_local_datetime(slot_date, slot_time)
+            if local is None:
+                continue
+            slot_ts = local_to_timestamp(local, zone)
+            (busy if is_booked else extra).append((slot_ts, slot_ts + duration))
+        for start_date, end_date in rows['vacations']:
+            bounds = local_date_bounds(start_date, end_date, zone)
+            if bounds is not None:
+                busy.append(bounds)
+
+        self.loads += 1
+        self.load_time += time.perf_counter() - started
+        return _Calendar(date_from, date_to, merge_intervals(busy), merge_intervals(extra))
+
+    async def _calendar(self, tutor_id: int, zone: tzinfo, date_from: date, date_to: date) -> _Calendar:
+        if not self._started:
+            return await self._load(tutor_id, zone, date_from, date_to)
+        cached = self._cache.get(tutor_id)
+        if cached is not MISSING and cached.covers(date_from, date_to):
+            return cached
+        # Загружаем с запасом, чтобы следующие запросы попадали в кэш
+        today = date.today()
+        load_from = min(date_from, today)
+        load_to = max(date_to, today + timedelta(days=AVAILABILITY_HORIZON_DAYS))
+        if cached is not MISSING:
+            load_from, load_to = min(load_from, cached.date_from), max(load_to, cached.date_to)
+        epoch = self._cache.epoch
+        calendar = await self._load(tutor_id, zone, load_from, load_to)
+        self._cache.set(tutor_id, calendar, epoch=epoch)
+        return calendar
+
+    async def _free_intervals(self, tutor_id: int, date_from: date, date_to: date,
+                              min_minutes: int) -> Tuple[tzinfo, List[Interval]]:
+        zone = await Database.get_user_zone(tutor_id)
+        calendar = await self._calendar(tutor_id, zone, date_from, date_to)
+        # Прошедшее время не предлагается
+        start = max(_day_start(date_from, zone), int(time.time()))
+        end = _day_start(date_to + timedelta(days=1), zone)
+        if start >= end:
+            return zone, []
+
+        extra = [(max(s, start), min(e, end)) for s, e in calendar.extra if s < end and e > start]
+        base = merge_intervals(working_intervals(date_from, date_to, zone) + extra)
+        base = [(max(s, start), e) for s, e in base if e > start]
+        free = subtract_intervals(base, calendar.busy_between(start, end))
+        min_length = min_minutes * 60
+        return zone, [(s, e) for s, e in free if e - s >= min_length]
+
+    async def get_free_windows(self, tutor_id: int, date_from: date, date_to: date,
+                               min_minutes: int = LESSON_DURATION_MINUTES) -> List[Tuple[datetime, datetime]]:
+        """Свободные окна репетитора за даты date_from..date_to включительно.
+
+        Окна короче min_minutes отбрасываются. Время — в поясе репетитора.
+        """
+        try:
+            zone, free = await self._free_intervals(tutor_id, date_from, date_to, min_minutes)
+            return [(timestamp_to_local(s, zone), timestamp_to_local(e, zone)) for s, e in free]
+        except Exception as e:
+            logger.error(f"❌ Ошибка расчёта свободных окон репетитора {tutor_id}: {e}")
+            return []
+
+    async def get_free_slots(self, tutor_id: int, date_from: date, date_to: date,
+                             duration: int = LESSON_DURATION_MINUTES, step: int = FREE_SLOT_STEP_MINUTES,
+                             limit: Optional[int] = None) -> List[datetime]:
+        """Возможное время начала урока длительностью duration минут (шаг step минут)"""
+        try:
+            zone, free = await self._free_intervals(tutor_id, date_from, date_to, duration)
+            slots: List[datetime] = []
+            for start, end in free:
+                local = timestamp_to_local(start, zone)
+                # Выравниваем начало по сетке step в местном времени
+                shift = (-(local.minute % step) * 60 - local.second) % (step * 60)
+                slot_ts = start + shift
+                while slot_ts + duration * 60 <= end:
+                    slots.append(timestamp_to_local(slot_ts, zone))
+                    if limit is not None and len(slots) >= limit:
+                        return slots
+                    slot_ts += step * 60
+            return slots
+        except Exception as e:
+            logger.error(f"❌ Ошибка расчёта свободного времени репетитора {tutor_id}: {e}")
+            return []
+
+
+# Глобальный экземпляр
+availability_engine = AvailabilityEngine()
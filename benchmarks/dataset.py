@@ -0,0 +1,290 @@
+"""Генератор синтетических данных в схеме bot_database.db.
+
+Заполняет все таблицы бота правдоподобными распределениями: популярность
+репетиторов по закону Ципфа, число уроков у студента — логнормальное,
+история уроков за полгода назад и расписание на два месяца вперёд.
+
+    python -m benchmarks.dataset --db bench.db --preset large
+    python -m benchmarks.dataset --db bench.db --tutors 200 --students 8000 --lessons 400000
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import string
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from database import Database
+from timezones import local_to_timestamp, resolve_zone
+
+PRESETS: Dict[str, Dict[str, int]] = {
+    'small': dict(tutors=50, students=2_000, lessons=100_000, homework=20_000, messages=100_000, requests=5_000),
+    'medium': dict(tutors=200, students=10_000, lessons=1_000_000, homework=100_000, messages=500_000,
+                   requests=20_000),
+    'large': dict(tutors=1_000, students=50_000, lessons=5_000_000, homework=500_000, messages=2_000_000,
+                  requests=100_000),
+}
+
+# Часовые пояса пользователей и их доли
+ZONES = [("Europe/Moscow", 60), ("Europe/Samara", 8), ("Asia/Yekaterinburg", 10), ("Asia/Novosibirsk", 6),
+         ("Asia/Vladivostok", 4), ("Europe/Kaliningrad", 4), ("Asia/Almaty", 4), ("МСК+2", 2), (None, 2)]
+SUBJECTS = ["Математика", "Физика", "Английский язык", "Русский язык", "Информатика", "Химия", "Биология",
+            "История", "Обществознание", "Литература"]
+LESSON_TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(8, 22) for minute in (0, 30)]
+CONTENT_TYPES = [("text", 50), ("photo", 25), ("file", 20), ("voice", 5)]
+PHRASES = ["Здравствуйте!", "Можно перенести урок?", "Домашнее задание готово", "Спасибо за урок",
+           "Во сколько завтра?", "Не получается решить задачу", "Отправил решение", "Хорошо, договорились"]
+
+TUTOR_ID_BASE = 100_000_000
+STUDENT_ID_BASE = 500_000_000
+HISTORY_DAYS = 180
+FUTURE_DAYS = 60
+CHUNK = 50_000
+
+
+def _weighted(pairs: Sequence[Tuple[object, int]], rng: random.Random, k: int) -> List:
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights, k=k)
+
+
+def _file_id(rng: random.Random) -> str:
+    return "BQAC" + "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=60))
+
+
+def _chunks(rows: Iterator[tuple], size: int = CHUNK) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class DatasetGenerator:
+    """Заполнение базы синтетическими данными (синхронный sqlite3 — это офлайн-инструмент)"""
+
+    def __init__(self, db_path: str, tutors: int, students: int, lessons: int, homework: int,
+                 messages: int, requests: int, seed: int = 42):
+        self.db_path = db_path
+        self.counts = dict(tutors=tutors, students=students, lessons=lessons, homework=homework,
+                           messages=messages, requests=requests)
+        self.rng = random.Random(seed)
+        self.now = datetime.now().replace(second=0, microsecond=0)
+        self.tutors: List[Tuple[int, str, float, str]] = []  # id, пояс, цена, предмет
+        self.students: List[Tuple[int, int, str]] = []  # id, репетитор, пояс
+        self.student_weights: List[float] = []
+
+    def run(self) -> Dict[str, float]:
+        """Создать схему и заполнить таблицы; возвращает время по таблицам"""
+        asyncio.run(self._init_schema())
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA recursive_triggers = ON")
+        timings = {}
+        try:
+            for name, step in (('users', self._users), ('standard_schedule', self._standard_schedule),
+                               ('lessons', self._lessons), ('homework', self._homework),
+                               ('messages', self._messages), ('student_requests', self._requests),
+                               ('groups', self._groups), ('available_slots', self._slots),
+                               ('vacation_periods', self._vacations)):
+                started = time.perf_counter()
+                rows = step(conn)
+                conn.commit()
+                timings[name] = time.perf_counter() - started
+                print(f"  {name}: {rows} строк за {timings[name]:.1f} с", flush=True)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        return timings
+
+    async def _init_schema(self):
+        Database._db_path = self.db_path
+        # Архив при генерации не нужен — подключаем временный, чтобы не создавать bot_archive.db
+        archive_dir = tempfile.mkdtemp(prefix='dataset-archive-')
+        Database._archive_path = os.path.join(archive_dir, 'archive.db')
+        try:
+            await Database.init_db()
+            await Database.close()
+        finally:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple]) -> int:
+        total = 0
+        for chunk in _chunks(rows):
+            conn.executemany(sql, chunk)
+            conn.commit()
+            total += len(chunk)
+        return total
+
+    def _users(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        tutor_zones = _weighted(ZONES, rng, self.counts['tutors'])
+        for i in range(self.counts['tutors']):
+            self.tutors.append((TUTOR_ID_BASE + i, tutor_zones[i], float(rng.randrange(800, 4001, 100)),
+                                rng.choice(SUBJECTS)))
+        # Популярность репетиторов по Ципфу: немногие ведут большую часть студентов
+        tutor_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(self.tutors))]
+        assigned = rng.choices(self.tutors, weights=tutor_weights, k=self.counts['students'])
+        student_zones = _weighted(ZONES, rng, self.counts['students'])
+        for i, tutor in enumerate(assigned):
+            self.students.append((STUDENT_ID_BASE + i, tutor[0], student_zones[i]))
+        self.student_weights = [rng.lognormvariate(0, 0.8) for _ in self.students]
+
+        users = [(tutor_id, f"tutor{tutor_id}", f"Репетитор {i}", 'admin', None, zone, subject, None)
+                 for i, (tutor_id, zone, _, subject) in enumerate(self.tutors)]
+        users += [(student_id, f"student{student_id}", f"Студент {i}",
+                   'archived' if rng.random() < 0.05 else 'student', tutor_id, zone, rng.choice(SUBJECTS),
+                   rng.randint(10, 40))
+                  for i, (student_id, tutor_id, zone) in enumerate(self.students)]
+        users.append((1, "superadmin", "Суперадмин", 'superadmin', None, None, None, None))
+        total = self._insert(conn, "INSERT INTO users (id, username, name, role, tutor_id, timezone, subject, age) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", iter(users))
+        self._insert(conn, "INSERT INTO tutors (id, name, username, subjects, cost, link) VALUES (?, ?, ?, ?, ?, ?)",
+                     ((tutor_id, f"Репетитор {i}", f"tutor{tutor_id}", subject, cost, f"https://t.me/tutor{tutor_id}")
+                      for i, (tutor_id, _, cost, subject) in enumerate(self.tutors)))
+        return total
+
+    def _standard_schedule(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        rows = ((tutor_id, student_id, rng.randrange(7), rng.choice(LESSON_TIMES), rng.choice(SUBJECTS))
+                for student_id, tutor_id, _ in self.students if rng.random() < 0.6
+                for _ in range(rng.randint(1, 2)))
+        return self._insert(conn, "INSERT INTO standard_schedule (tutor_id, student_id, day_of_week, time, subject) "
+                                  "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _lesson_rows(self) -> Iterator[tuple]:
+        rng = self.rng
+        tutors = {tutor_id: (resolve_zone(zone), cost, subject) for tutor_id, zone, cost, subject in self.tutors}
+        times = [(text, datetime.strptime(text, '%H:%M').time()) for text in LESSON_TIMES]
+        left = self.counts['lessons']
+        while left > 0:
+            k = min(CHUNK, left)
+            left -= k
+            for student_id, tutor_id, _ in rng.choices(self.students, weights=self.student_weights, k=k):
+                zone, cost, subject = tutors[tutor_id]
+                day = rng.randint(-HISTORY_DAYS, FUTURE_DAYS)
+                lesson_time, clock = rng.choice(times)
+                local = datetime.combine((self.now + timedelta(days=day)).date(), clock)
+                roll = rng.random()
+                if day < 0:
+                    status = 'completed' if roll < 0.8 else 'cancelled' if roll < 0.95 else 'scheduled'
+                else:
+                    status = 'cancelled' if roll < 0.05 else 'scheduled'
+                yield (student_id, tutor_id, local.strftime('%Y-%m-%d'), lesson_time, subject, status, cost,
+                       local_to_timestamp(local, zone))
+
+    def _lessons(self, conn: sqlite3.Connection) -> int:
+        return self._insert(conn, "INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, subject, "
+                                  "status, cost, starts_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._lesson_rows())
+
+    def _homework(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        students = rng.choices(self.students, weights=self.student_weights, k=self.counts['homework'])
+        content_types = _weighted(CONTENT_TYPES, rng, len(students))
+
+        def rows():
+            for (student_id, tutor_id, _), content_type in zip(students, content_types):
+                assigned = self.now - timedelta(days=rng.randint(0, HISTORY_DAYS), minutes=rng.randrange(1440))
+                content = rng.choice(PHRASES) if content_type == 'text' else _file_id(rng)
+                reminder_date = reminder_time = None
+                completed = rng.random() < 0.7
+                if not completed and rng.random() < 0.5:
+                    reminder_date = (self.now + timedelta(days=rng.randint(-3, 14))).strftime('%Y-%m-%d')
+                    reminder_time = rng.choice(LESSON_TIMES)
+                yield (student_id, tutor_id, content_type, content, f"Задание {rng.randint(1, 500)}",
+                       assigned.strftime('%Y-%m-%d %H:%M:%S'), reminder_date, reminder_time, int(completed))
+        return self._insert(conn, "INSERT INTO homework (student_id, tutor_id, content_type, content_data, "
+                                  "description, assigned_at, reminder_date, reminder_time, is_completed) "
+                                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+
+    def _messages(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        students = rng.choices(self.students, weights=self.student_weights, k=self.counts['messages'])
+
+        def rows():
+            for student_id, tutor_id, _ in students:
+                sender, recipient = (student_id, tutor_id) if rng.random() < 0.5 else (tutor_id, student_id)
+                sent_at = self.now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+                yield (sender, recipient, rng.choice(PHRASES), sent_at.strftime('%Y-%m-%d %H:%M:%S'),
+                       int(rng.random() < 0.9))
+        return self._insert(conn, "INSERT INTO messages (sender_id, recipient_id, content, sent_at, is_read) "
+                                  "VALUES (?, ?, ?, ?, ?)", rows())
+
+    def _requests(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        statuses = _weighted([('pending', 20), ('accepted', 60), ('rejected', 20)], rng, self.counts['requests'])
+        rows = ((student_id, rng.choice(self.tutors)[0] if rng.random() < 0.3 else tutor_id, status)
+                for (student_id, tutor_id, _), status in zip(rng.choices(self.students, k=len(statuses)), statuses))
+        return self._insert(conn, "INSERT INTO student_requests (student_id, tutor_id, status) VALUES (?, ?, ?)", rows)
+
+    def _groups(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        by_tutor: Dict[int, List[int]] = {}
+        for student_id, tutor_id, _ in self.students:
+            by_tutor.setdefault(tutor_id, []).append(student_id)
+        total = 0
+        for tutor_id, _, _, subject in self.tutors:
+            students = by_tutor.get(tutor_id, [])
+            for n in range(rng.randint(0, 3) if len(students) >= 3 else 0):
+                cursor = conn.execute("INSERT INTO groups (tutor_id, name, description) VALUES (?, ?, ?)",
+                                      (tutor_id, f"{subject} — группа {n + 1}", "Синтетическая группа"))
+                members = rng.sample(students, min(len(students), rng.randint(3, 8)))
+                conn.executemany("INSERT INTO group_members (group_id, student_id) VALUES (?, ?)",
+                                 [(cursor.lastrowid, student_id) for student_id in members])
+                total += 1
+        return total
+
+    def _slots(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+        rows = ((tutor_id, (self.now + timedelta(days=rng.randint(0, FUTURE_DAYS))).strftime('%Y-%m-%d'),
+                 rng.choice(LESSON_TIMES), int(rng.random() < 0.3))
+                for tutor_id, _, _, _ in self.tutors for _ in range(rng.randint(5, 30)))
+        return self._insert(conn, "INSERT INTO available_slots (tutor_id, slot_date, slot_time, is_booked) "
+                                  "VALUES (?, ?, ?, ?)", rows)
+
+    def _vacations(self, conn: sqlite3.Connection) -> int:
+        rng = self.rng
+
+        def rows():
+            for tutor_id, _, _, _ in self.tutors:
+                for _ in range(rng.choice((0, 0, 0, 1, 1, 2))):
+                    start = self.now + timedelta(days=rng.randint(-HISTORY_DAYS, FUTURE_DAYS))
+                    end = start + timedelta(days=rng.randint(1, 14))
+                    yield tutor_id, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), "Отпуск"
+        return self._insert(conn, "INSERT INTO vacation_periods (tutor_id, start_date, end_date, reason) "
+                                  "VALUES (?, ?, ?, ?)", rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные для бенчмарков")
+    parser.add_argument('--db', default='bench_database.db', help="файл базы (будет пересоздан)")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    for name in PRESETS['small']:
+        parser.add_argument(f'--{name}', type=int, help=f"переопределить {name} из пресета")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    counts = dict(PRESETS[args.preset])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    print(f"📦 Генерация {args.db}: {counts}")
+    started = time.perf_counter()
+    DatasetGenerator(args.db, seed=args.seed, **counts).run()
+    print(f"✅ Готово за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""Сквозной нагрузочный тест: апдейты через Dispatcher бота из main.py.
+
+Вместо Telegram Bot API подставляется сессия, которая ничего не
+отправляет, а записывает вызовы и отвечает правдоподобными объектами.
+Много пользователей работают параллельно (апдейты одного пользователя —
+последовательно, как их доставляет Telegram); в конце печатается
+пропускная способность, задержки по обработчикам и число SQL-запросов.
+
+    python -m benchmarks.load --users 500 --rounds 5
+    python -m benchmarks.load --db bench.db --users 2000 --concurrency 200 --api-latency 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, get_args, get_origin
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import ClientDecodeError
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from constants import ROLES
+from database import Database
+from db_metrics import count_statements, query_metrics
+
+BOT_ID = 123456
+BOT_TOKEN = f"{BOT_ID}:LOAD-TEST-TOKEN"
+
+# Сценарии по ролям: текст — сообщение, ('cb', data) — нажатие инлайн-кнопки
+SCENARIOS: Dict[str, List[Any]] = {
+    ROLES["STUDENT"]: ["/start", "📅 Мои уроки", "📚 Мои ДЗ", ('cb', "submit_cancel"), "ℹ️ Помощь",
+                       "🏠 Главное меню"],
+    ROLES["ADMIN"]: ["/start", "👥 Мои ученики", "📊 Управление расписанием", "🕐 Свободные окна",
+                     "📋 Заявки учеников", "📚 Задать ДЗ", ('cb', "hw_type_cancel"), "📈 Статистика",
+                     "🏠 Главное меню"],
+    ROLES["SUPERADMIN"]: ["/start", "👑 Суперадмин-меню", "📊 Статистика системы", "📋 Список репетиторов",
+                          "🏠 Главное меню"],
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class RecordingSession(BaseSession):
+    """Заглушка Bot API: записывает вызовы и возвращает синтетические ответы"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.failed: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._bot_user = {"id": BOT_ID, "is_bot": True, "first_name": "LoadBot", "username": "load_bot"}
+
+    def _result(self, method: TelegramMethod, returning: Any) -> Any:
+        origin = get_origin(returning)
+        if origin is list:
+            return [self._result(method, get_args(returning)[0])]
+        options = get_args(returning) or (returning,)
+        if Message in options:
+            chat_id = getattr(method, 'chat_id', None)
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": "private"},
+                "from": self._bot_user,
+                "text": getattr(method, 'text', None) or "",
+            }
+        if User in options:
+            return self._bot_user
+        if bool in options:
+            return True
+        if int in options:
+            return 0
+        if str in options:
+            return ""
+        return True
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = json.dumps({"ok": True, "result": self._result(method, method.__returning__)})
+        try:
+            return self.check_response(bot, method, 200, content).result
+        except ClientDecodeError:
+            # Ответ такого типа не синтезируется — обработчик получит None
+            self.failed[name] += 1
+            return None
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Время и число SQL-запросов каждого обработчика"""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.statements: Dict[str, int] = Counter()
+        self.errors: Counter = Counter()
+
+    async def __call__(self, handler: Callable[..., Awaitable], event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', None)
+        name = f"{getattr(callback, '__module__', '?')}.{getattr(callback, '__qualname__', '?')}"
+        started = time.perf_counter()
+        with count_statements() as statements:
+            try:
+                return await handler(event, data)
+            except Exception:
+                self.errors[name] += 1
+                raise
+            finally:
+                self.latency[name].append((time.perf_counter() - started) * 1000)
+                self.statements[name] += statements[0]
+
+
+class UpdateFactory:
+    """Синтетические апдейты Telegram от имени пользователя"""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self._callback_ids = itertools.count(1)
+
+    def build(self, user_id: int, step: Any) -> Update:
+        user = User(id=user_id, is_bot=False, first_name=f"User{user_id}", username=f"user{user_id}")
+        chat = Chat(id=user_id, type="private")
+        now = int(time.time())
+        if isinstance(step, tuple):
+            _, data = step
+            source = Message(message_id=next(self._message_ids), date=now, chat=chat,
+                             from_user=User(id=BOT_ID, is_bot=True, first_name="LoadBot"), text="…")
+            return Update(update_id=next(self._update_ids), callback_query=CallbackQuery(
+                id=str(next(self._callback_ids)), from_user=user, chat_instance=str(user_id), data=data,
+                message=source,
+            ))
+        return Update(update_id=next(self._update_ids), message=Message(
+            message_id=next(self._message_ids), date=now, chat=chat, from_user=user, text=step,
+        ))
+
+
+async def _pick_users(count: int, seed: int) -> List[Tuple[int, str]]:
+    """Пользователи из базы с ролями в пропорции реального бота"""
+    rng = random.Random(seed)
+    async with Database._acquire() as db:
+        users = []
+        for role, share in ((ROLES["STUDENT"], 0.9), (ROLES["ADMIN"], 0.09), (ROLES["SUPERADMIN"], 0.01)):
+            cursor = await db.execute("SELECT id FROM users WHERE role = ? ORDER BY random() LIMIT ?",
+                                      (role, max(1, int(count * share))))
+            users += [(row[0], role) for row in await cursor.fetchall()]
+    rng.shuffle(users)
+    return users[:count]
+
+
+async def run_load(dp: Dispatcher, bot: Bot, users: List[Tuple[int, str]], rounds: int,
+                   concurrency: int) -> Dict[str, Any]:
+    """Прогнать сценарии всех пользователей через dp.feed_update"""
+    timing = HandlerTimingMiddleware()
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+    factory = UpdateFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+    update_latency: List[float] = []
+    unhandled = Counter()
+    errors = Counter()
+
+    async def user_session(user_id: int, role: str):
+        for _ in range(rounds):
+            for step in SCENARIOS[role]:
+                update = factory.build(user_id, step)
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        result = await dp.feed_update(bot, update)
+                        if result is UNHANDLED:
+                            unhandled[step if isinstance(step, str) else step[1]] += 1
+                    except Exception as e:
+                        errors[type(e).__name__] += 1
+                    update_latency.append((time.perf_counter() - started) * 1000)
+
+    statements_before = query_metrics.statements
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(user_id, role) for user_id, role in users))
+    elapsed = time.perf_counter() - started
+
+    handlers = {
+        name: {
+            'calls': len(values),
+            'p50_ms': round(_percentile(values, 0.5), 3),
+            'p99_ms': round(_percentile(values, 0.99), 3),
+            'sql_per_call': round(timing.statements[name] / len(values), 2),
+            'errors': timing.errors[name],
+        }
+        for name, values in sorted(timing.latency.items(), key=lambda item: -sum(item[1]))
+    }
+    return {
+        'users': len(users),
+        'updates': len(update_latency),
+        'elapsed': round(elapsed, 3),
+        'updates_per_sec': round(len(update_latency) / elapsed, 1) if elapsed else 0.0,
+        'update_p50_ms': round(_percentile(update_latency, 0.5), 3),
+        'update_p99_ms': round(_percentile(update_latency, 0.99), 3),
+        'sql_statements': query_metrics.statements - statements_before,
+        'unhandled': dict(unhandled),
+        'errors': dict(errors),
+        'handlers': handlers,
+    }
+
+
+def _print_report(report: Dict[str, Any], api_calls: Counter, api_failed: Counter):
+    print(f"\n📈 {report['updates']} апдейтов от {report['users']} пользователей за {report['elapsed']} с: "
+          f"{report['updates_per_sec']} апдейтов/с, p50 {report['update_p50_ms']} мс, "
+          f"p99 {report['update_p99_ms']} мс, SQL-запросов {report['sql_statements']}")
+    print("\nОбработчики:")
+    for name, item in report['handlers'].items():
+        print(f"  {name:<60} {item['calls']:>7}  p50 {item['p50_ms']:>8.2f}  p99 {item['p99_ms']:>8.2f} мс  "
+              f"SQL/вызов {item['sql_per_call']:>5}  ошибок {item['errors']}")
+    print("\nВызовы Bot API: " + ", ".join(f"{name} {count}" for name, count in api_calls.most_common()))
+    if api_failed:
+        print("Не синтезированы ответы: " + ", ".join(f"{name} {count}" for name, count in api_failed.items()))
+    if report['unhandled']:
+        print(f"Без обработчика: {report['unhandled']}")
+    if report['errors']:
+        print(f"Ошибки: {report['errors']}")
+
+
+async def _main(args):
+    # Импорт здесь: app тянет роутеры и сервисы бота
+    from app import create_dispatcher
+    from fsm_storage import SQLiteStorage
+    from message_dispatcher import init_message_dispatcher
+    from notifications import init_notification_service
+
+    Database._db_path = args.work_db
+    Database._archive_path = os.path.join(os.path.dirname(args.work_db), 'archive.db')
+    await Database.init_db()
+    session = RecordingSession(latency=args.api_latency / 1000)
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    storage = SQLiteStorage()
+    dp = create_dispatcher(storage)
+    init_notification_service(bot)
+    dispatcher = init_message_dispatcher(bot)
+    dispatcher.start()
+    try:
+        users = await _pick_users(args.users, args.seed)
+        print(f"⏱ {len(users)} пользователей × {args.rounds} проходов сценария, параллельно до {args.concurrency}")
+        report = await run_load(dp, bot, users, args.rounds, args.concurrency)
+    finally:
+        await dispatcher.stop()
+        await storage.close()
+        await Database.close()
+    report['api_calls'] = dict(session.calls)
+    _print_report(report, session.calls, session.failed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результат: {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Dispatcher с заглушкой Bot API")
+    parser.add_argument('--db', help="база от benchmarks.dataset (не изменяется); без неё генерируется small")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3, help="сколько раз каждый пользователь проходит сценарий")
+    parser.add_argument('--concurrency', type=int, default=100, help="апдейтов в обработке одновременно")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help="записать отчёт в JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load-')
+    args.work_db = os.path.join(workdir, 'load.db')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, args.work_db)
+        else:
+            from benchmarks.dataset import PRESETS, DatasetGenerator
+            DatasetGenerator(args.work_db, seed=args.seed, **PRESETS['small']).run()
+        asyncio.run(_main(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""Микробенчмарки публичных методов Database.
+
+Каждый метод вызывается последовательно на копии сгенерированной базы
+(см. benchmarks.dataset), замеряются p50/p99; результат пишется в JSON,
+чтобы сравнивать коммиты между собой.
+
+    python -m benchmarks.run --db bench.db
+    python -m benchmarks.run --db bench.db --compare benchmarks/results/abc1234.json
+    python -m benchmarks.run --db bench.db --only get_user get_tutor_upcoming_lessons
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from database import Database
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+# Методы жизненного цикла не замеряются
+LIFECYCLE = {'init_db', 'close'}
+# Тяжёлые методы (полный проход по таблицам) вызываются реже
+HEAVY = {'rebuild_statistics_counters', 'generate_lessons_bulk', 'get_all_tutors', 'get_media_stats',
+         'get_archive_stats'}
+
+
+class BenchContext:
+    """Выборка реальных идентификаторов из базы для аргументов методов"""
+
+    def __init__(self, db_path: str, seed: int = 7):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(db_path)
+        try:
+            def column(sql: str, limit: int = 1000) -> List:
+                return [row[0] for row in conn.execute(f"{sql} ORDER BY random() LIMIT {limit}")]
+
+            self.tutors = column("SELECT id FROM tutors")
+            self.pairs = conn.execute(
+                "SELECT id, tutor_id FROM users WHERE role = 'student' AND tutor_id IS NOT NULL "
+                "ORDER BY random() LIMIT 1000"
+            ).fetchall()
+            self.lessons = column("SELECT id FROM lessons WHERE status = 'scheduled'", 5000)
+            self.homework = column("SELECT id FROM homework")
+            self.requests = column("SELECT id FROM student_requests WHERE status = 'pending'", 5000)
+            self.groups = column("SELECT id FROM groups") or [0]
+            self.counters = dict(conn.execute("SELECT name, value FROM stats_counters"))
+        finally:
+            conn.close()
+        self.created_users: List[int] = []
+        self.created_tutors: List[int] = []
+        self._next_id = 900_000_000
+
+    def pick(self, values: List):
+        return self.rng.choice(values)
+
+    def pair(self):
+        return self.rng.choice(self.pairs)
+
+    def take(self, values: List):
+        """Забрать значение, чтобы не использовать его повторно (отмена, одобрение)"""
+        return values.pop() if values else 0
+
+    def new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def future_date(self) -> str:
+        return (datetime.now() + timedelta(days=self.rng.randint(1, 60))).strftime('%Y-%m-%d')
+
+    def future_time(self) -> str:
+        return f"{self.rng.randint(8, 21):02d}:{self.rng.choice((0, 30)):02d}"
+
+
+def _new_user(ctx: BenchContext) -> Awaitable:
+    user_id = ctx.new_id()
+    ctx.created_users.append(user_id)
+    return Database.add_user(user_id, f"bench{user_id}", "Bench", timezone="Europe/Moscow")
+
+
+def _new_tutor(ctx: BenchContext) -> Awaitable:
+    tutor_id = ctx.new_id()
+    ctx.created_tutors.append(tutor_id)
+    return Database.add_tutor_with_username(tutor_id, "Bench", "Математика", 1500, username=f"bench{tutor_id}")
+
+
+def _since_now() -> int:
+    return int(time.time())
+
+
+# Метод -> фабрика вызова. Порядок важен: методы удаления используют созданные ранее записи
+CASES: Dict[str, Callable[[BenchContext], Awaitable]] = {
+    'get_user': lambda ctx: Database.get_user(ctx.pair()[0]),
+    'get_user_zone': lambda ctx: Database.get_user_zone(ctx.pair()[0]),
+    'get_tutor': lambda ctx: Database.get_tutor(ctx.pick(ctx.tutors)),
+    'get_all_tutors': lambda ctx: Database.get_all_tutors(),
+    'get_tutor_students': lambda ctx: Database.get_tutor_students(ctx.pick(ctx.tutors)),
+    'get_student_tutor': lambda ctx: Database.get_student_tutor(ctx.pair()[0]),
+    'get_tutor_students_and_groups': lambda ctx: Database.get_tutor_students_and_groups(ctx.pick(ctx.tutors)),
+    'get_lessons_between': lambda ctx: Database.get_lessons_between(
+        _since_now(), _since_now() + 7 * 86400, tutor_id=ctx.pick(ctx.tutors)),
+    'get_student_upcoming_lessons': lambda ctx: Database.get_student_upcoming_lessons(ctx.pair()[0]),
+    'get_tutor_upcoming_lessons': lambda ctx: Database.get_tutor_upcoming_lessons(ctx.pick(ctx.tutors)),
+    'get_lesson_by_id': lambda ctx: Database.get_lesson_by_id(ctx.pick(ctx.lessons)),
+    'get_scheduled_lessons_since': lambda ctx: Database.get_scheduled_lessons_since(
+        _since_now(), tutor_id=ctx.pick(ctx.tutors)),
+    'get_pending_homework_reminders': lambda ctx: Database.get_pending_homework_reminders(
+        datetime.now().strftime('%Y-%m-%d')),
+    'get_homework_for_student': lambda ctx: Database.get_homework_for_student(ctx.pair()[0]),
+    'get_homework_by_id': lambda ctx: Database.get_homework_by_id(ctx.pick(ctx.homework)),
+    'get_homework_for_tutor': lambda ctx: Database.get_homework_for_tutor(ctx.pick(ctx.tutors)),
+    'get_messages_page': lambda ctx: Database.get_messages_page(ctx.pair()[0]),
+    'get_conversation_page': lambda ctx: Database.get_conversation_page(*reversed(ctx.pair())),
+    'get_messages_for_user': lambda ctx: Database.get_messages_for_user(ctx.pair()[0]),
+    'get_recent_messages_for_user': lambda ctx: Database.get_recent_messages_for_user(ctx.pair()[0]),
+    'get_conversation_history': lambda ctx: Database.get_conversation_history(*reversed(ctx.pair())),
+    'get_student_requests_for_tutor': lambda ctx: Database.get_student_requests_for_tutor(ctx.pick(ctx.tutors)),
+    'get_student_request_by_id': lambda ctx: Database.get_student_request_by_id(ctx.pick(ctx.requests)),
+    'get_request_by_id': lambda ctx: Database.get_request_by_id(ctx.pick(ctx.requests)),
+    'get_tutor_groups': lambda ctx: Database.get_tutor_groups(ctx.pick(ctx.tutors)),
+    'get_group_by_id': lambda ctx: Database.get_group_by_id(ctx.pick(ctx.groups)),
+    'get_group_members': lambda ctx: Database.get_group_members(ctx.pick(ctx.groups)),
+    'get_student_schedule': lambda ctx: Database.get_student_schedule(*reversed(ctx.pair())),
+    'get_standard_schedule': lambda ctx: Database.get_standard_schedule(*reversed(ctx.pair())),
+    'get_group_schedule': lambda ctx: Database.get_group_schedule(ctx.pick(ctx.tutors), ctx.pick(ctx.groups)),
+    'get_available_slots': lambda ctx: Database.get_available_slots(ctx.pick(ctx.tutors)),
+    'get_vacation_periods': lambda ctx: Database.get_vacation_periods(ctx.pick(ctx.tutors)),
+    'get_tutor_calendar': lambda ctx: Database.get_tutor_calendar(
+        ctx.pick(ctx.tutors), _since_now(), _since_now() + 28 * 86400, datetime.now().strftime('%Y-%m-%d'),
+        (datetime.now() + timedelta(days=28)).strftime('%Y-%m-%d')),
+    'check_lesson_conflicts': lambda ctx: Database.check_lesson_conflicts(
+        ctx.pick(ctx.tutors), ctx.future_date(), ctx.future_time()),
+    'validate_lessons': lambda ctx: Database.validate_lessons(
+        [(ctx.pick(ctx.tutors), ctx.future_date(), ctx.future_time()) for _ in range(50)]),
+    'find_media': lambda ctx: Database.find_media(content_hash=f"bench{ctx.rng.randrange(1000)}"),
+    'get_media_stats': lambda ctx: Database.get_media_stats(),
+    'get_fsm_session': lambda ctx: Database.get_fsm_session(f"bench:{ctx.pair()[0]}"),
+    'get_system_statistics': lambda ctx: Database.get_system_statistics(),
+    'get_archive_stats': lambda ctx: Database.get_archive_stats(),
+    # Запись
+    'add_user': _new_user,
+    'update_user_role': lambda ctx: Database.update_user_role(ctx.pick(ctx.created_users or [0]), 'student'),
+    'add_tutor_with_username': _new_tutor,
+    'update_tutor_profile': lambda ctx: Database.update_tutor_profile(ctx.pick(ctx.tutors), cost=1500),
+    'add_lesson': lambda ctx: Database.add_lesson(*ctx.pair(), ctx.future_date(), ctx.future_time(), "Bench"),
+    'cancel_lesson': lambda ctx: Database.cancel_lesson(ctx.take(ctx.lessons)),
+    'submit_homework': lambda ctx: Database.submit_homework(*ctx.pair(), "text", "bench", "Bench"),
+    'assign_homework': lambda ctx: Database.assign_homework(
+        *ctx.pair(), "text", "bench", "Bench", ctx.future_date(), ctx.future_time()),
+    'send_message': lambda ctx: Database.send_message(*ctx.pair(), "bench"),
+    'add_student_request': lambda ctx: Database.add_student_request(*ctx.pair()),
+    'approve_student_request': lambda ctx: Database.approve_student_request(ctx.take(ctx.requests), 0),
+    'reject_student_request': lambda ctx: Database.reject_student_request(ctx.take(ctx.requests)),
+    'process_student_request': lambda ctx: Database.process_student_request(ctx.take(ctx.requests), 'accepted'),
+    'accept_student_request': lambda ctx: Database.accept_student_request(ctx.take(ctx.requests)),
+    'add_standard_schedule': lambda ctx: Database.add_standard_schedule(
+        *reversed(ctx.pair()), ctx.rng.randrange(7), ctx.future_time()),
+    'generate_lessons_from_standard_schedule': lambda ctx: Database.generate_lessons_from_standard_schedule(
+        *reversed(ctx.pair()), weeks=1),
+    'generate_lessons_bulk': lambda ctx: Database.generate_lessons_bulk(tutor_id=ctx.pick(ctx.tutors), weeks=1),
+    'add_available_slot': lambda ctx: Database.add_available_slot(
+        ctx.pick(ctx.tutors), ctx.future_date(), ctx.future_time()),
+    'add_vacation_period': lambda ctx: Database.add_vacation_period(
+        ctx.pick(ctx.tutors), *sorted((ctx.future_date(), ctx.future_date())), "Bench"),
+    'apply_vacation_period': lambda ctx: Database.apply_vacation_period(
+        ctx.pick(ctx.tutors), *sorted((ctx.future_date(), ctx.future_date())), "Bench", shift=True),
+    'save_media': lambda ctx: Database.save_media(
+        'document', file_id=f"bench{ctx.rng.randrange(1000)}", content_hash=f"bench{ctx.rng.randrange(1000)}"),
+    'save_fsm_sessions': lambda ctx: Database.save_fsm_sessions(
+        [(f"bench:{ctx.pair()[0]}", "BenchState:step", "{}", int(time.time()))], []),
+    'delete_expired_fsm_sessions': lambda ctx: Database.delete_expired_fsm_sessions(int(time.time()) - 86400),
+    'rebuild_statistics_counters': lambda ctx: Database.rebuild_statistics_counters(),
+    # Переносит только то, что ещё не в архиве: первый вызов — полный перенос, дальше — холостой проход
+    'archive_history': lambda ctx: Database.archive_history(
+        _since_now() - 180 * 86400, (datetime.utcnow() - timedelta(days=180)).strftime('%Y-%m-%d %H:%M:%S')),
+    'reload_schedule_index': lambda ctx: Database.reload_schedule_index(ctx.pick(ctx.tutors)),
+    'delete_tutor_info': lambda ctx: Database.delete_tutor_info(ctx.take(ctx.created_tutors)),
+    'delete_user': lambda ctx: Database.delete_user(ctx.take(ctx.created_users)),
+}
+
+
+def public_methods() -> List[str]:
+    """Публичные асинхронные методы Database (для проверки полноты CASES)"""
+    return sorted(
+        name for name, attr in vars(Database).items()
+        if not name.startswith('_') and isinstance(attr, (classmethod, staticmethod))
+        and inspect.iscoroutinefunction(attr.__func__) and name not in LIFECYCLE
+    )
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _measure(factory: Callable[[BenchContext], Awaitable], ctx: BenchContext, iterations: int,
+                   warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        await factory(ctx)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await factory(ctx)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'n': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 4),
+        'p50_ms': round(_percentile(samples, 0.5), 4),
+        'p99_ms': round(_percentile(samples, 0.99), 4),
+        'min_ms': round(samples[0], 4),
+        'max_ms': round(samples[-1], 4),
+    }
+
+
+async def run_benchmarks(db_path: str, iterations: int, warmup: int, only: Optional[List[str]] = None,
+                         seed: int = 7) -> Dict[str, Any]:
+    ctx = BenchContext(db_path, seed)
+    Database._db_path = db_path
+    Database._archive_path = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive.db')
+    await Database.init_db()
+    results, skipped = {}, []
+    try:
+        for name in public_methods():
+            if only and name not in only:
+                continue
+            if name not in CASES:
+                skipped.append(name)
+                continue
+            n = max(3, iterations // 20) if name in HEAVY else iterations
+            results[name] = await _measure(CASES[name], ctx, n, min(warmup, n))
+            print(f"  {name:<42} p50 {results[name]['p50_ms']:>9.3f} мс   p99 {results[name]['p99_ms']:>9.3f} мс",
+                  flush=True)
+    finally:
+        await Database.close()
+    return {'dataset': ctx.counters, 'results': results, 'skipped': skipped}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Таблица изменений p50/p99 относительно прошлого прогона"""
+    print(f"\nСравнение с {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, now in sorted(current['results'].items()):
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"  {name:<42} новый")
+            continue
+        changes = []
+        for key in ('p50_ms', 'p99_ms'):
+            delta = (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key[:3]} {before[key]:.3f} → {now[key]:.3f} ({delta:+.0f}%)")
+        print(f"  {name:<42} " + "   ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки методов Database")
+    parser.add_argument('--db', default='bench_database.db', help="база от benchmarks.dataset (не изменяется)")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', nargs='*', help="замерить только эти методы")
+    parser.add_argument('--output', help="файл результата (по умолчанию benchmarks/results/<коммит>.json)")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"нет базы {args.db}: сначала python -m benchmarks.dataset --db {args.db}")
+
+    # Методы записи меняют данные — работаем с копией, чтобы прогоны были сопоставимы
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    work_db = os.path.join(workdir, os.path.basename(args.db))
+    shutil.copyfile(args.db, work_db)
+    try:
+        print(f"⏱ Бенчмарки на копии {args.db} ({args.iterations} итераций)")
+        report = asyncio.run(run_benchmarks(work_db, args.iterations, args.warmup, args.only))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git_commit()
+    report.update({
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'iterations': args.iterations,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+    })
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if report['skipped']:
+        print(f"⚠️ Нет сценария для: {', '.join(report['skipped'])}")
+    print(f"💾 Результат: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
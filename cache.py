@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+# Маркер отсутствия значения в кэше (None — допустимое закэшированное значение)
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с ограничением времени жизни записей и счётчиками попаданий"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def epoch(self) -> int:
+        """Номер поколения; меняется при каждой инвалидации"""
+        return self._epoch
+
+    def get(self, key: Hashable) -> Any:
+        """Получить значение или MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, epoch: Optional[int] = None):
+        """Сохранить значение.
+
+        Если передан epoch, прочитанный до обращения к БД, и с тех пор была
+        инвалидация, значение могло устареть и не сохраняется.
+        """
+        if epoch is not None and epoch != self._epoch:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Удалить запись после изменения данных"""
+        self._epoch += 1
+        self.invalidations += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        self._epoch += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика использования кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
@@ -60,6 +60,78 @@ SUPERADMIN_IDS = [982741411]  # Замените на реальные ID
 # Настройки бота
 BOT_TOKEN = os.getenv("BOT_TOKEN", "мой токен")  # Замените на токен вашего бота
 
+# Настройки базы данных
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # Количество соединений в пуле
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # Ожидание блокировки SQLite
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))  # Записей в кэше профилей
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))  # Время жизни записи кэша, сек
+WRITE_QUEUE_WINDOW_MS = float(os.getenv("WRITE_QUEUE_WINDOW_MS", "5"))  # Окно группировки вставок, мс
+WRITE_QUEUE_MAX_BATCH = 256  # Вставок в одной транзакции
+WRITE_QUEUE_MAX_PENDING = 5000  # Предел очереди вставок (дальше вызывающие ждут)
+DB_METRICS_ENABLED = os.getenv("DB_METRICS", "1") != "0"  # Учёт задержек запросов
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))  # Порог медленного запроса, мс
+
+# Архив истории: старые уроки и сообщения переносятся в отдельный файл базы
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", "bot_archive.db")  # Пустая строка — архив отключён
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "180"))  # Старше скольких дней данные уходят в архив
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", str(6 * 3600)))  # Период запуска архивации, сек
+ARCHIVE_BATCH_SIZE = 1000  # Строк в одной транзакции переноса (держит блокировку записи ~0.1 с)
+
+# Выгрузка данных репетитора (CSV и Parquet)
+EXPORT_CHUNK_SIZE = 5000  # Строк, читаемых из базы за раз
+EXPORT_ROW_GROUP_SIZE = 50000  # Строк в группе Parquet (буфер в памяти)
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))  # Одновременных выгрузок
+EXPORT_MAX_DOCUMENT_MB = 50  # Предел размера документа Bot API; больший CSV сжимается в gzip
+
+# Часовой пояс, в котором вводятся даты и время уроков
+DEFAULT_TIMEZONE = os.getenv("BOT_TIMEZONE", "Europe/Moscow")
+LESSON_DURATION_MINUTES = 60  # Длительность урока
+UPCOMING_LESSONS_LIMIT = 20  # Сколько ближайших уроков показывать
+BULK_INSERT_CHUNK = 500  # Уроков в одном INSERT при генерации из расписания (7 параметров на урок)
+
+# Свободные окна репетиторов
+WORKING_HOURS_START = int(os.getenv("WORKING_HOURS_START", "9"))  # Начало рабочего дня (час, пояс репетитора)
+WORKING_HOURS_END = int(os.getenv("WORKING_HOURS_END", "21"))  # Конец рабочего дня
+WORKING_DAYS = (0, 1, 2, 3, 4, 5, 6)  # Рабочие дни недели (0 — понедельник)
+FREE_SLOT_STEP_MINUTES = 30  # Шаг предлагаемого времени начала урока
+AVAILABILITY_HORIZON_DAYS = 28  # На сколько дней вперёд загружается календарь репетитора
+AVAILABILITY_CACHE_SIZE = 2000  # Календарей репетиторов в кэше
+AVAILABILITY_CACHE_TTL = 600.0  # Время жизни календаря в кэше, сек
+VACATION_SHIFT_SEARCH_DAYS = 14  # Сколько дней после отпуска искать свободное время для переноса урока
+
+# Настройки напоминаний
+LESSON_REMINDER_LEAD_MINUTES = 60  # За сколько минут напоминать об уроке
+REMINDER_GRACE_MINUTES = 10  # Просроченные напоминания в пределах этого окна всё ещё отправляются
+
+# Хранилище состояний диалогов (FSM)
+FSM_SESSION_TTL = int(os.getenv("FSM_SESSION_TTL", str(7 * 24 * 3600)))  # Брошенный диалог забывается, сек
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))  # Период записи изменений в БД, сек
+FSM_HOT_SIZE = int(os.getenv("FSM_HOT_SIZE", "5000"))  # Сессий в памяти
+FSM_HOT_IDLE = 900  # Неактивная сессия выгружается из памяти через, сек
+
+# Ограничения исходящих сообщений (лимиты Bot API)
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))  # Параллельных отправителей
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "10000"))  # Максимальная длина очереди
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))  # Сообщений в секунду на бота
+SEND_PER_CHAT_RATE = 1.0  # Сообщений в секунду в один чат
+SEND_PER_CHAT_BURST = 3  # Допустимый всплеск сообщений в один чат
+SEND_MAX_RETRIES = 3  # Повторы при сетевых ошибках
+
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес сервера, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Заголовок X-Telegram-Bot-Api-Secret-Token; без него генерируется
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))  # Апдейтов в обработке одновременно
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Соединений Telegram к вебхуку
+WEBHOOK_DEDUPE_SIZE = 10000  # Сколько последних update_id помнить для отбрасывания повторов
+
+# Многопроцессный режим: апдейты распределяются по процессам по id пользователя
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))  # 1 — обычный однопроцессный запуск
+WORKER_STATS_INTERVAL = 10  # Период отчёта воркеров супервизору, сек
+
 # Обновленная структура SPECIAL_USERS
 SPECIAL_USERS: Dict[int, Dict[str, List[str] | str]] = {
     982741411: {
@@ -1,22 +1,196 @@
-import aiosqlite
 import logging
-from datetime import datetime, timedelta
-from typing import List, Tuple, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, tzinfo
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator, Callable
 import asyncio
+import time
+from contextvars import ContextVar
+
+from cache import TTLCache, MISSING
+from constants import (DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+                       LESSON_DURATION_MINUTES, UPCOMING_LESSONS_LIMIT, BULK_INSERT_CHUNK, ARCHIVE_DB_PATH,
+                       ARCHIVE_BATCH_SIZE, EXPORT_CHUNK_SIZE, VACATION_SHIFT_SEARCH_DAYS,
+                       WRITE_QUEUE_WINDOW_MS, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_PENDING)
+from db_metrics import format_summary, instrument, query_metrics
+from db_pool import ConnectionPool
+from media import is_file_type, media_hash
+from migrations import (ARCHIVED_COLUMNS, apply_migrations, collect_stats_counters, create_archive_schema,
+                        rebuild_stats_counters)
+from schedule_index import Conflict, ScheduleIndex, LESSON, SLOT, VACATION
+from timezones import local_date_bounds, parse_local_datetime, resolve_zone, to_utc_timestamp
+from write_queue import GroupCommitQueue
 
 logger = logging.getLogger(__name__)
 
 
+class TransactionError(Exception):
+    """Операция внутри Database.transaction() завершилась ошибкой, транзакция откатана"""
+
+
+class _Transaction:
+    __slots__ = ('db', 'active', 'failed', 'on_commit', 'on_rollback')
+
+    def __init__(self, db):
+        self.db = db
+        self.active = True
+        self.failed = False
+        # Действия после фиксации: сброс кэшей и события подписчикам
+        self.on_commit: List[Callable[[], None]] = []
+        # Действия после отката: возврат состояния в памяти (индекс расписания)
+        self.on_rollback: List[Callable[[], None]] = []
+
+
+# Транзакция, открытая в текущей задаче через Database.transaction()
+_current_transaction: ContextVar[Optional[_Transaction]] = ContextVar('database_transaction', default=None)
+
+
 class Database:
     _db_path = "bot_database.db"
-    _connection = None
+    # Архив истории, подключаемый к соединениям как схема archive (пустая строка — без архива)
+    _archive_path = ARCHIVE_DB_PATH
+    _pool: Optional[ConnectionPool] = None
     _lock = asyncio.Lock()
+    # Кэш профилей пользователей и репетиторов (инвалидируется методами записи)
+    _user_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+    _tutor_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+    # Ключ вложения (file_unique_id или хэш) -> id в media
+    _media_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+    # Версия таблицы репетиторов; увеличивается при каждом изменении
+    _tutors_version = 0
+    # Очередь вставок с групповой фиксацией (сообщения, сдача ДЗ, заявки)
+    _write_queue = GroupCommitQueue(
+        lambda: Database._acquire(),
+        window=WRITE_QUEUE_WINDOW_MS / 1000,
+        max_batch=WRITE_QUEUE_MAX_BATCH,
+        max_pending=WRITE_QUEUE_MAX_PENDING,
+    )
+    # Подписчики на события изменения данных: имя события -> обработчики
+    _listeners: Dict[str, List[Callable[..., None]]] = {}
+    # Предстоящая занятость репетиторов для проверки пересечений (строится в init_db)
+    _schedule = ScheduleIndex(LESSON_DURATION_MINUTES * 60)
+
+    @classmethod
+    async def _get_pool(cls) -> ConnectionPool:
+        """Получить (и при необходимости открыть) пул соединений"""
+        if cls._pool is None or cls._pool.closed:
+            async with cls._lock:
+                if cls._pool is None or cls._pool.closed:
+                    pool = ConnectionPool(cls._db_path, size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT_MS,
+                                          metrics=query_metrics,
+                                          attach={'archive': cls._archive_path} if cls._archive_path else None)
+                    await pool.open()
+                    cls._pool = pool
+        return cls._pool
+
+    @staticmethod
+    def _transaction() -> Optional[_Transaction]:
+        """Открытая в текущей задаче транзакция или None"""
+        tx = _current_transaction.get()
+        # Задачи, созданные внутри транзакции, наследуют контекст и после её завершения
+        return tx if tx is not None and tx.active else None
+
+    @classmethod
+    @asynccontextmanager
+    async def _acquire(cls):
+        """Взять соединение из общего пула (внутри transaction() — соединение транзакции)"""
+        tx = cls._transaction()
+        if tx is not None:
+            try:
+                yield tx.db
+            except BaseException:
+                # Методы перехватывают свои ошибки сами — запоминаем, что транзакцию нужно откатить
+                tx.failed = True
+                raise
+            return
+        pool = await cls._get_pool()
+        async with pool.acquire() as db:
+            yield db
+
+    @classmethod
+    @asynccontextmanager
+    async def transaction(cls):
+        """Единица работы: методы Database внутри блока используют одно
+        соединение и фиксируются одним COMMIT.
+
+            async with Database.transaction():
+                await Database.approve_student_request(request_id, tutor_id)
+                await Database.add_standard_schedule(tutor_id, student_id, 1, "18:00")
+
+        Транзакция открывается как BEGIN IMMEDIATE, поэтому прочитанное в
+        блоке не изменится до фиксации. Если любой метод внутри блока
+        завершился ошибкой (даже вернув False), при выходе всё откатывается
+        и выбрасывается TransactionError. Сброс кэшей и события подписчикам
+        выполняются только после успешной фиксации. Вложенный вызов
+        присоединяется к внешней транзакции.
+        """
+        if cls._transaction() is not None:
+            async with cls._acquire() as db:
+                yield db
+            return
+
+        pool = await cls._get_pool()
+        async with pool.acquire() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            tx = _Transaction(db)
+            token = _current_transaction.set(tx)
+            committed = False
+            try:
+                try:
+                    yield db
+                finally:
+                    tx.active = False
+                    _current_transaction.reset(token)
+                # При исключении откат выполнит пул при возврате соединения
+                if tx.failed:
+                    raise TransactionError("Операция в транзакции завершилась ошибкой, изменения отменены")
+                await db.commit()
+                committed = True
+            finally:
+                if not committed:
+                    for callback in tx.on_rollback:
+                        callback()
+
+        for callback in tx.on_commit:
+            callback()
+
+    @classmethod
+    async def _commit(cls, db):
+        """Зафиксировать изменения, если соединение не принадлежит transaction()"""
+        tx = cls._transaction()
+        if tx is None or tx.db is not db:
+            await db.commit()
+
+    @classmethod
+    def _after_commit(cls, callback: Callable[[], None]):
+        """Выполнить действие сразу или, внутри transaction(), после фиксации"""
+        tx = cls._transaction()
+        if tx is None:
+            callback()
+        else:
+            tx.on_commit.append(callback)
+
+    @classmethod
+    def _after_rollback(cls, callback: Callable[[], None]):
+        """Внутри transaction() — выполнить действие, если транзакция будет откатана"""
+        tx = cls._transaction()
+        if tx is not None:
+            tx.on_rollback.append(callback)
+
+    @classmethod
+    async def _queued_insert(cls, sql: str, params: tuple) -> int:
+        """Вставка через очередь групповой фиксации; возвращает lastrowid"""
+        if cls._transaction() is not None:
+            # Очередь фиксирует отдельно — внутри транзакции пишем в её соединение
+            async with cls._acquire() as db:
+                cursor = await db.execute(sql, params)
+                return cursor.lastrowid
+        return await cls._write_queue.insert(sql, params)
 
     @classmethod
     async def init_db(cls):
         """Инициализация базы данных"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute('''
                     CREATE TABLE IF NOT EXISTS users (
                         id INTEGER PRIMARY KEY,
@@ -172,8 +346,16 @@ class Database:
                     )
                 ''')
 
+                # Таблицы архивной базы (счётчикам статистики они нужны уже в миграциях)
+                await create_archive_schema(db)
+
                 await db.commit()
-                logger.info("✅ База данных успешно инициализирована")
+
+                # Индексы и последующие изменения схемы
+                version = await apply_migrations(db)
+                logger.info(f"✅ База данных успешно инициализирована (версия схемы {version})")
+
+                await cls._load_schedule_index(db)
 
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации базы данных: {e}")
@@ -181,22 +363,118 @@ class Database:
 
     @classmethod
     async def close(cls):
-        """Закрытие соединения с базой данных"""
-        if cls._connection:
-            await cls._connection.close()
-            cls._connection = None
+        """Закрытие пула соединений с базой данных"""
+        # Сначала дописываем отложенные вставки — им нужен пул
+        await cls._write_queue.close()
+        async with cls._lock:
+            if cls._pool:
+                await cls._pool.close()
+                cls._pool = None
+
+    @classmethod
+    def add_listener(cls, event: str, callback: Callable[..., None]):
+        """Подписаться на событие изменения данных (lesson_added, lesson_cancelled, ...)"""
+        cls._listeners.setdefault(event, []).append(callback)
+
+    @classmethod
+    def remove_listener(cls, event: str, callback: Callable[..., None]):
+        """Отписаться от события"""
+        callbacks = cls._listeners.get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    @classmethod
+    def _emit(cls, event: str, **payload):
+        """Уведомить подписчиков (внутри transaction() — после фиксации)"""
+        cls._after_commit(lambda: cls._notify(event, payload))
+
+    @classmethod
+    def _notify(cls, event: str, payload: Dict[str, Any]):
+        """Вызвать подписчиков; ошибки подписчиков не влияют на запись"""
+        for callback in list(cls._listeners.get(event, ())):
+            try:
+                callback(**payload)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика события {event}: {e}")
+
+    @classmethod
+    def get_tutors_version(cls) -> int:
+        """Версия таблицы репетиторов для инвалидации зависимых кэшей"""
+        return cls._tutors_version
+
+    @classmethod
+    def replay_event(cls, event: str, **payload):
+        """Уведомить подписчиков о событии, произошедшем в другом процессе"""
+        # Индекс расписания процесса обновляется так же, как при локальной записи
+        if event == 'lesson_added':
+            cls._schedule.add_lesson(payload['lesson_id'], payload['tutor_id'], payload['starts_at'],
+                                     payload.get('student_id'))
+        elif event == 'lesson_cancelled':
+            cls._schedule.remove_lesson(payload['lesson_id'])
+        elif event == 'slot_added':
+            cls._schedule.add_slot(payload['slot_id'], payload['tutor_id'], payload['starts_at'])
+        elif event == 'vacation_added':
+            cls._schedule.add_vacation(payload['tutor_id'], payload['starts_at'], payload['ends_at'])
+        elif event == 'lessons_generated':
+            asyncio.ensure_future(cls.reload_schedule_index(payload.get('tutor_id')))
+        cls._notify(event, payload)
+
+    @classmethod
+    def _tutors_changed(cls, tutor_id: int):
+        """Сбросить кэши после изменения репетитора"""
+        cls._after_commit(lambda: cls._invalidate_tutor(tutor_id))
+        cls._emit('tutor_changed', tutor_id=tutor_id)
+
+    @classmethod
+    def _invalidate_tutor(cls, tutor_id: int):
+        cls._tutor_cache.invalidate(tutor_id)
+        cls._tutors_version += 1
+
+    @classmethod
+    def _user_changed(cls, user_id: int):
+        """Сбросить кэш профиля после изменения пользователя"""
+        cls._after_commit(lambda: cls._user_cache.invalidate(user_id))
+        cls._emit('user_changed', user_id=user_id)
+
+    @classmethod
+    def invalidate_profile_cache(cls, user_id: int = None, tutor_id: int = None):
+        """Сбросить кэш профиля, изменённого другим процессом (без событий)"""
+        if user_id is not None:
+            cls._user_cache.invalidate(user_id)
+        if tutor_id is not None:
+            cls._invalidate_tutor(tutor_id)
+
+    @classmethod
+    def get_cache_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """Статистика кэшей профилей"""
+        return {
+            'users': cls._user_cache.stats(),
+            'tutors': cls._tutor_cache.stats(),
+            'media': cls._media_cache.stats(),
+            'schedule_index': cls._schedule.stats(),
+        }
 
     # Методы для работы с пользователями
     @classmethod
     async def get_user(cls, user_id: int) -> Optional[Tuple]:
         """Получить пользователя по ID"""
+        # Внутри транзакции кэш не используется: в нём нет незафиксированных изменений
+        in_transaction = cls._transaction() is not None
+        if not in_transaction:
+            cached = cls._user_cache.get(user_id)
+            if cached is not MISSING:
+                return cached
+        epoch = cls._user_cache.epoch
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, username, name, role, tutor_id, timezone, subject, age, created_at FROM users WHERE id = ?",
                     (user_id,)
                 )
-                return await cursor.fetchone()
+                user = await cursor.fetchone()
+            if not in_transaction:
+                cls._user_cache.set(user_id, user, epoch)
+            return user
         except Exception as e:
             logger.error(f"❌ Ошибка получения пользователя {user_id}: {e}")
             return None
@@ -206,13 +484,14 @@ class Database:
                        tutor_id: int = None, timezone: str = None, subject: str = None, age: int = None) -> bool:
         """Добавить нового пользователя"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "INSERT OR REPLACE INTO users (id, username, name, role, tutor_id, timezone, subject, age) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                     (user_id, username, full_name, role, tutor_id, timezone, subject, age)
                 )
-                await db.commit()
-                return True
+                await cls._commit(db)
+            cls._user_changed(user_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления пользователя {user_id}: {e}")
             return False
@@ -221,13 +500,14 @@ class Database:
     async def update_user_role(cls, user_id: int, role: str) -> bool:
         """Обновить роль пользователя"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "UPDATE users SET role = ? WHERE id = ?",
                     (role, user_id)
                 )
-                await db.commit()
-                return True
+                await cls._commit(db)
+            cls._user_changed(user_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка обновления роли пользователя {user_id}: {e}")
             return False
@@ -236,25 +516,42 @@ class Database:
     async def delete_user(cls, user_id: int) -> bool:
         """Удалить пользователя"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute("DELETE FROM users WHERE id = ?", (user_id,))
-                await db.commit()
-                return True
+                await cls._commit(db)
+            cls._user_changed(user_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка удаления пользователя {user_id}: {e}")
             return False
 
+    @classmethod
+    async def get_user_zone(cls, user_id: int) -> tzinfo:
+        """Часовой пояс пользователя (строка из users.timezone разбирается один раз)"""
+        user = await cls.get_user(user_id)
+        return resolve_zone(user[5] if user else None)
+
     # Методы для работы с репетиторами
     @classmethod
     async def get_tutor(cls, tutor_id: int) -> Optional[Tuple]:
         """Получить информацию о репетиторе"""
+        # Внутри транзакции кэш не используется: в нём нет незафиксированных изменений
+        in_transaction = cls._transaction() is not None
+        if not in_transaction:
+            cached = cls._tutor_cache.get(tutor_id)
+            if cached is not MISSING:
+                return cached
+        epoch = cls._tutor_cache.epoch
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, name, username, subjects, cost, link FROM tutors WHERE id = ?",
                     (tutor_id,)
                 )
-                return await cursor.fetchone()
+                tutor = await cursor.fetchone()
+            if not in_transaction:
+                cls._tutor_cache.set(tutor_id, tutor, epoch)
+            return tutor
         except Exception as e:
             logger.error(f"❌ Ошибка получения репетитора {tutor_id}: {e}")
             return None
@@ -263,7 +560,7 @@ class Database:
     async def get_all_tutors(cls) -> List[Tuple]:
         """Получить всех репетиторов"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, name, username, subjects, cost, link FROM tutors"
                 )
@@ -277,13 +574,14 @@ class Database:
                                       username: str = None) -> bool:
         """Добавить репетитора с username"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "INSERT OR REPLACE INTO tutors (id, name, username, subjects, cost, link) VALUES (?, ?, ?, ?, ?, ?)",
                     (tutor_id, name, username, subjects, cost, link)
                 )
-                await db.commit()
-                return True
+                await cls._commit(db)
+            cls._tutors_changed(tutor_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления репетитора {tutor_id}: {e}")
             return False
@@ -293,8 +591,8 @@ class Database:
                                    cost: float = None, link: str = None) -> bool:
         """Обновить профиль репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                # Получаем текущие данные
+            # Чтение и запись в одной транзакции: профиль не изменится между ними
+            async with cls.transaction() as db:
                 current = await cls.get_tutor(tutor_id)
                 if not current:
                     # Создаем новый профиль
@@ -315,8 +613,8 @@ class Database:
                             tutor_id
                         )
                     )
-                await db.commit()
-                return True
+                cls._tutors_changed(tutor_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка обновления профиля репетитора {tutor_id}: {e}")
             return False
@@ -325,12 +623,12 @@ class Database:
     async def delete_tutor_info(cls, tutor_id: int) -> bool:
         """Удалить информацию о репетиторе"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls.transaction() as db:
                 await db.execute("DELETE FROM tutors WHERE id = ?", (tutor_id,))
-                # Также обновляем роль пользователя
-                await db.execute("UPDATE users SET role = 'archived' WHERE id = ?", (tutor_id,))
-                await db.commit()
-                return True
+                cls._tutors_changed(tutor_id)
+                # Также архивируем пользователя
+                await cls.update_user_role(tutor_id, 'archived')
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка удаления репетитора {tutor_id}: {e}")
             return False
@@ -340,7 +638,7 @@ class Database:
     async def get_tutor_students(cls, tutor_id: int, include_archived: bool = False) -> List[Tuple]:
         """Получить студентов репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 if include_archived:
                     cursor = await db.execute(
                         """SELECT DISTINCT u.id, u.username, u.name, u.role 
@@ -366,7 +664,7 @@ class Database:
     async def get_student_tutor(cls, student_id: int) -> Optional[Tuple]:
         """Получить репетитора студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT DISTINCT u.id, u.username, u.name, u.role 
                        FROM users u 
@@ -396,51 +694,119 @@ class Database:
 
     # Методы для работы с уроками
     @classmethod
-    async def get_student_upcoming_lessons(cls, student_id: int) -> List[Tuple]:
-        """Получить предстоящие уроки студента"""
+    async def get_lessons_between(cls, start_ts: int, end_ts: int, tutor_id: int = None, student_id: int = None,
+                                  limit: int = None, include_cancelled: bool = False,
+                                  include_history: bool = False) -> List[Tuple]:
+        """Получить уроки, начинающиеся в интервале [start_ts, end_ts) (UNIX-время UTC).
+
+        С include_history в выборку попадают и уроки, перенесённые в архив.
+        """
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            conditions, params = ["starts_at >= ?", "starts_at < ?"], [start_ts, end_ts]
+            if tutor_id is not None:
+                conditions.insert(0, "tutor_id = ?")
+                params.insert(0, tutor_id)
+            if student_id is not None:
+                conditions.insert(0, "student_id = ?")
+                params.insert(0, student_id)
+            if not include_cancelled:
+                conditions.append("status != 'cancelled'")
+            async with cls._acquire() as db:
+                if include_history and cls._archive_path:
+                    # Каждая часть уже упорядочена и ограничена, объединяется не больше 2 * limit строк
+                    part = f"""SELECT * FROM (
+                                   SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status, starts_at 
+                                   FROM {{table}} 
+                                   WHERE {' AND '.join(conditions)} 
+                                   ORDER BY starts_at LIMIT ?)"""
+                    limit = limit if limit is not None else -1
+                    cursor = await db.execute(
+                        f"""SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status 
+                            FROM ({part.format(table='lessons')} UNION ALL {part.format(table='archive.lessons')}) 
+                            ORDER BY starts_at LIMIT ?""",
+                        (*params, limit, *params, limit, limit)
+                    )
+                    return await cursor.fetchall()
                 cursor = await db.execute(
-                    """SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status 
-                       FROM lessons 
-                       WHERE student_id = ? AND status != 'cancelled' 
-                       ORDER BY lesson_date, lesson_time""",
-                    (student_id,)
+                    f"""SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status 
+                        FROM lessons 
+                        WHERE {' AND '.join(conditions)} 
+                        ORDER BY starts_at LIMIT ?""",
+                    (*params, limit if limit is not None else -1)
                 )
                 return await cursor.fetchall()
         except Exception as e:
-            logger.error(f"❌ Ошибка получения уроков студента {student_id}: {e}")
+            logger.error(f"❌ Ошибка получения уроков за период: {e}")
             return []
 
     @classmethod
-    async def get_tutor_upcoming_lessons(cls, tutor_id: int) -> List[Tuple]:
+    def _upcoming_window(cls) -> Tuple[int, int]:
+        """Интервал «предстоящих» уроков: с начала идущего урока и без верхней границы"""
+        now = int(time.time())
+        return now - LESSON_DURATION_MINUTES * 60, 2 ** 62
+
+    @classmethod
+    async def get_student_upcoming_lessons(cls, student_id: int, limit: int = UPCOMING_LESSONS_LIMIT) -> List[Tuple]:
+        """Получить предстоящие уроки студента"""
+        start_ts, end_ts = cls._upcoming_window()
+        return await cls.get_lessons_between(start_ts, end_ts, student_id=student_id, limit=limit)
+
+    @classmethod
+    async def get_tutor_upcoming_lessons(cls, tutor_id: int, limit: int = UPCOMING_LESSONS_LIMIT) -> List[Tuple]:
         """Получить предстоящие уроки репетитора"""
-        try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                cursor = await db.execute(
-                    """SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status 
-                       FROM lessons 
-                       WHERE tutor_id = ? AND status != 'cancelled' 
-                       ORDER BY lesson_date, lesson_time""",
-                    (tutor_id,)
-                )
-                return await cursor.fetchall()
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения уроков репетитора {tutor_id}: {e}")
-            return []
+        start_ts, end_ts = cls._upcoming_window()
+        return await cls.get_lessons_between(start_ts, end_ts, tutor_id=tutor_id, limit=limit)
 
     @classmethod
     async def add_lesson(cls, student_id: int, tutor_id: int, lesson_date: str, lesson_time: str, subject: str = None,
                          cost: float = None) -> bool:
-        """Добавить урок"""
+        """Добавить урок (дата и время — в часовом поясе репетитора).
+
+        Урок, пересекающийся с другим уроком репетитора или его отпуском,
+        не добавляется (подробности — check_lesson_conflicts).
+        """
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    "INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, subject, cost) VALUES (?, ?, ?, ?, ?, ?)",
-                    (student_id, tutor_id, lesson_date, lesson_time, subject, cost)
-                )
-                await db.commit()
-                return True
+            starts_at = to_utc_timestamp(lesson_date, lesson_time, await cls.get_user_zone(tutor_id))
+            if starts_at is not None:
+                conflicts = cls._schedule.conflicts(tutor_id, starts_at)
+                if conflicts:
+                    logger.warning(f"⚠️ Урок репетитора {tutor_id} на {lesson_date} {lesson_time} не добавлен: "
+                                   f"пересечение ({', '.join(c.kind for c in conflicts)})")
+                    return False
+            # Время занимается до записи, чтобы параллельный вызов увидел пересечение
+            reservation = cls._schedule.reserve_lesson(tutor_id, starts_at, student_id)
+            duration = cls._schedule.duration
+            try:
+                async with cls._acquire() as db:
+                    # Индекс видит только уроки своего процесса — при нескольких воркерах
+                    # пересечение проверяется ещё и в базе, в том же операторе, что и вставка
+                    cursor = await db.execute(
+                        """INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, subject, cost, starts_at) 
+                           SELECT ?, ?, ?, ?, ?, ?, ? 
+                           WHERE ? IS NULL OR NOT EXISTS (
+                               SELECT 1 FROM lessons 
+                               WHERE tutor_id = ? AND starts_at > ? AND starts_at < ? AND status != 'cancelled')""",
+                        (student_id, tutor_id, lesson_date, lesson_time, subject, cost, starts_at,
+                         starts_at, tutor_id,
+                         starts_at - duration if starts_at is not None else None,
+                         starts_at + duration if starts_at is not None else None)
+                    )
+                    inserted = cursor.rowcount
+                    await cls._commit(db)
+            except Exception:
+                cls._schedule.remove_lesson(reservation)
+                raise
+            if not inserted:
+                cls._schedule.remove_lesson(reservation)
+                logger.warning(f"⚠️ Урок репетитора {tutor_id} на {lesson_date} {lesson_time} не добавлен: "
+                               f"пересечение с уроком, добавленным другим процессом")
+                return False
+            lesson_id = cursor.lastrowid
+            cls._schedule.confirm_lesson(reservation, lesson_id)
+            cls._after_rollback(lambda: cls._schedule.remove_lesson(lesson_id))
+            cls._emit('lesson_added', lesson_id=lesson_id, student_id=student_id, tutor_id=tutor_id,
+                      starts_at=starts_at, subject=subject)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления урока: {e}")
             return False
@@ -449,7 +815,7 @@ class Database:
     async def get_lesson_by_id(cls, lesson_id: int) -> Optional[Tuple]:
         """Получить урок по ID"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, student_id, tutor_id, lesson_date, lesson_time, subject, status, cost FROM lessons WHERE id = ?",
                     (lesson_id,)
@@ -463,29 +829,76 @@ class Database:
     async def cancel_lesson(cls, lesson_id: int) -> bool:
         """Отменить урок"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    "UPDATE lessons SET status = 'cancelled' WHERE id = ?",
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    "UPDATE lessons SET status = 'cancelled' WHERE id = ? RETURNING tutor_id",
                     (lesson_id,)
                 )
-                await db.commit()
-                return True
+                row = await cursor.fetchone()
+                await cls._commit(db)
+            cls._after_commit(lambda: cls._schedule.remove_lesson(lesson_id))
+            cls._emit('lesson_cancelled', lesson_id=lesson_id, tutor_id=row[0] if row else None)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка отмены урока {lesson_id}: {e}")
             return False
 
+    @classmethod
+    async def get_scheduled_lessons_since(cls, start_ts: int, tutor_id: int = None,
+                                          student_id: int = None) -> List[Tuple]:
+        """Получить запланированные уроки, начинающиеся не раньше start_ts (для напоминаний)"""
+        try:
+            conditions, params = ["status = 'scheduled'", "starts_at >= ?"], [start_ts]
+            if tutor_id is not None:
+                conditions.append("tutor_id = ?")
+                params.append(tutor_id)
+            if student_id is not None:
+                conditions.append("student_id = ?")
+                params.append(student_id)
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    f"""SELECT id, student_id, tutor_id, starts_at, subject 
+                        FROM lessons 
+                        WHERE {' AND '.join(conditions)}""",
+                    params
+                )
+                return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения запланированных уроков: {e}")
+            return []
+
     # Методы для работы с домашними заданиями
+    @classmethod
+    async def get_pending_homework_reminders(cls, from_date: str) -> List[Tuple]:
+        """Получить невыполненные ДЗ с напоминаниями начиная с даты (с часовым поясом студента)"""
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    """SELECT h.id, h.student_id, h.tutor_id, h.description, h.reminder_date, h.reminder_time, 
+                              u.timezone 
+                       FROM homework h 
+                       LEFT JOIN users u ON u.id = h.student_id 
+                       WHERE h.is_completed = 0 AND h.reminder_date >= ?""",
+                    (from_date,)
+                )
+                return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения напоминаний о ДЗ: {e}")
+            return []
+
     @classmethod
     async def get_homework_for_student(cls, student_id: int) -> List[Tuple]:
         """Получить домашние задания студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
-                    """SELECT id, student_id, tutor_id, content_type, content_data, description, 
-                              assigned_at, reminder_date, reminder_time, is_completed 
-                       FROM homework 
-                       WHERE student_id = ? 
-                       ORDER BY assigned_at DESC""",
+                    """SELECT h.id, h.student_id, h.tutor_id, h.content_type, 
+                              COALESCE(m.file_id, m.content, h.content_data), h.description, 
+                              h.assigned_at, h.reminder_date, h.reminder_time, h.is_completed 
+                       FROM homework h 
+                       LEFT JOIN media m ON m.id = h.media_id 
+                       WHERE h.student_id = ? 
+                       ORDER BY h.assigned_at DESC""",
                     (student_id,)
                 )
                 return await cursor.fetchall()
@@ -497,11 +910,14 @@ class Database:
     async def get_homework_by_id(cls, hw_id: int) -> Optional[Tuple]:
         """Получить домашнее задание по ID"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
-                    """SELECT id, student_id, tutor_id, content_type, content_data, description, 
-                              assigned_at, reminder_date, reminder_time, is_completed 
-                       FROM homework WHERE id = ?""",
+                    """SELECT h.id, h.student_id, h.tutor_id, h.content_type, 
+                              COALESCE(m.file_id, m.content, h.content_data), h.description, 
+                              h.assigned_at, h.reminder_date, h.reminder_time, h.is_completed 
+                       FROM homework h 
+                       LEFT JOIN media m ON m.id = h.media_id 
+                       WHERE h.id = ?""",
                     (hw_id,)
                 )
                 return await cursor.fetchone()
@@ -511,34 +927,39 @@ class Database:
 
     @classmethod
     async def submit_homework(cls, student_id: int, tutor_id: int, content_type: str, content_data: str,
-                              description: str) -> bool:
-        """Сдать домашнее задание"""
+                              description: str, file_unique_id: str = None) -> bool:
+        """Сдать домашнее задание (вложение сохраняется в media один раз)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    "INSERT INTO homework (student_id, tutor_id, content_type, content_data, description, is_completed) VALUES (?, ?, ?, ?, ?, 1)",
-                    (student_id, tutor_id, content_type, content_data, description)
-                )
-                await db.commit()
-                return True
+            media_id = await cls._homework_media(content_type, content_data, file_unique_id)
+            await cls._queued_insert(
+                "INSERT INTO homework (student_id, tutor_id, content_type, media_id, description, is_completed) VALUES (?, ?, ?, ?, ?, 1)",
+                (student_id, tutor_id, content_type, media_id, description)
+            )
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка сдачи ДЗ: {e}")
             return False
 
     @classmethod
     async def assign_homework(cls, student_id: int, tutor_id: int, content_type: str, content_data: str,
-                              description: str, reminder_date: str = None, reminder_time: str = None) -> bool:
-        """Задать домашнее задание"""
+                              description: str, reminder_date: str = None, reminder_time: str = None,
+                              file_unique_id: str = None) -> bool:
+        """Задать домашнее задание (одно вложение для многих студентов хранится один раз)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    """INSERT INTO homework (student_id, tutor_id, content_type, content_data, description, 
+            media_id = await cls._homework_media(content_type, content_data, file_unique_id)
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    """INSERT INTO homework (student_id, tutor_id, content_type, media_id, description, 
                                            reminder_date, reminder_time, is_completed) 
                        VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
-                    (student_id, tutor_id, content_type, content_data, description, reminder_date, reminder_time)
+                    (student_id, tutor_id, content_type, media_id, description, reminder_date, reminder_time)
                 )
-                await db.commit()
-                return True
+                await cls._commit(db)
+            if reminder_date:
+                cls._emit('homework_assigned', homework_id=cursor.lastrowid, student_id=student_id,
+                          tutor_id=tutor_id, description=description,
+                          reminder_date=reminder_date, reminder_time=reminder_time)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка задания ДЗ: {e}")
             return False
@@ -547,13 +968,15 @@ class Database:
     async def get_homework_for_tutor(cls, tutor_id: int) -> List[Tuple]:
         """Получить домашние задания репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
-                    """SELECT h.id, h.student_id, h.tutor_id, h.content_type, h.content_data, 
+                    """SELECT h.id, h.student_id, h.tutor_id, h.content_type, 
+                              COALESCE(m.file_id, m.content, h.content_data), 
                               h.description, h.assigned_at, h.reminder_date, h.reminder_time, 
                               h.is_completed, u.name as student_name
                        FROM homework h
                        JOIN users u ON h.student_id = u.id
+                       LEFT JOIN media m ON m.id = h.media_id
                        WHERE h.tutor_id = ? 
                        ORDER BY h.assigned_at DESC""",
                     (tutor_id,)
@@ -563,87 +986,246 @@ class Database:
             logger.error(f"❌ Ошибка получения ДЗ репетитора {tutor_id}: {e}")
             return []
 
+    # Методы для работы с вложениями (media)
+    @classmethod
+    async def save_media(cls, content_type: str, file_id: str = None, file_unique_id: str = None,
+                         content: str = None, content_hash: str = None, size: int = None) -> Optional[int]:
+        """Найти или создать вложение по file_unique_id или хэшу содержимого; возвращает id.
+
+        Для известного вложения обновляется file_id (последний рабочий) и
+        дописываются недостающие ключи.
+        """
+        if file_unique_id is None and content_hash is None:
+            content_hash = media_hash(content_type, file_id if is_file_type(content_type) else content)
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    "SELECT id FROM media WHERE file_unique_id = ? OR content_hash = ? LIMIT 1",
+                    (file_unique_id, content_hash)
+                )
+                row = await cursor.fetchone()
+                if row is None:
+                    cursor = await db.execute(
+                        """INSERT OR IGNORE INTO media (file_unique_id, content_hash, content_type, file_id, content, size) 
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (file_unique_id, content_hash, content_type, file_id, content, size)
+                    )
+                    if cursor.rowcount:
+                        media_id = cursor.lastrowid
+                    else:
+                        # Параллельная вставка того же вложения
+                        cursor = await db.execute(
+                            "SELECT id FROM media WHERE file_unique_id = ? OR content_hash = ? LIMIT 1",
+                            (file_unique_id, content_hash)
+                        )
+                        media_id = (await cursor.fetchone())[0]
+                else:
+                    media_id = row[0]
+                    await db.execute(
+                        """UPDATE OR IGNORE media SET file_id = COALESCE(?, file_id), 
+                               file_unique_id = COALESCE(file_unique_id, ?), content_hash = COALESCE(content_hash, ?), 
+                               size = COALESCE(size, ?) 
+                           WHERE id = ?""",
+                        (file_id, file_unique_id, content_hash, size, media_id)
+                    )
+                await cls._commit(db)
+            return media_id
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения вложения: {e}")
+            return None
+
+    @classmethod
+    async def find_media(cls, file_unique_id: str = None, content_hash: str = None) -> Optional[Tuple]:
+        """Вложение (id, content_type, file_id, file_unique_id, content) по одному из ключей"""
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    """SELECT id, content_type, file_id, file_unique_id, content FROM media 
+                       WHERE file_unique_id = ? OR content_hash = ? LIMIT 1""",
+                    (file_unique_id, content_hash)
+                )
+                return await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска вложения: {e}")
+            return None
+
+    @classmethod
+    async def _homework_media(cls, content_type: str, content_data: str, file_unique_id: str = None) -> int:
+        """id вложения для ДЗ; повторы одного вложения берутся из кэша без обращения к базе"""
+        key = ('u', file_unique_id) if file_unique_id else ('h', media_hash(content_type, content_data))
+        media_id = cls._media_cache.get(key)
+        if media_id is not MISSING:
+            return media_id
+        if is_file_type(content_type):
+            media_id = await cls.save_media(content_type, file_id=content_data, file_unique_id=file_unique_id)
+        else:
+            media_id = await cls.save_media(content_type, content=content_data, content_hash=key[1])
+        if media_id is None:
+            raise RuntimeError("вложение не сохранено")
+        # Внутри транзакции id может исчезнуть при откате — кэшируем только после фиксации
+        cls._after_commit(lambda: cls._media_cache.set(key, media_id))
+        return media_id
+
+    @classmethod
+    async def get_media_stats(cls) -> Dict[str, Any]:
+        """Статистика дедупликации вложений ДЗ"""
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute("SELECT COUNT(*), COALESCE(SUM(ref_count), 0), COALESCE(SUM(size), 0) FROM media")
+                files, references, size = await cursor.fetchone()
+            return {
+                'files': files,
+                'references': references,
+                'dedupe_ratio': round(references / files, 2) if files else 0.0,
+                'bytes': size,
+            }
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики вложений: {e}")
+            return {}
+
     # Методы для работы с сообщениями
     @classmethod
     async def send_message(cls, sender_id: int, recipient_id: int, content: str, message_type: str = "text", 
                           file_id: str = None) -> bool:
         """Отправить сообщение (только для системных уведомлений)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    "INSERT INTO messages (sender_id, recipient_id, content) VALUES (?, ?, ?)",
-                    (sender_id, recipient_id, content)
-                )
-                await db.commit()
-                return True
+            await cls._queued_insert(
+                "INSERT INTO messages (sender_id, recipient_id, content) VALUES (?, ?, ?)",
+                (sender_id, recipient_id, content)
+            )
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка отправки сообщения: {e}")
             return False
 
     @classmethod
-    async def get_messages_for_user(cls, user_id: int) -> List[Tuple]:
-        """Получить сообщения для пользователя"""
-        try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                cursor = await db.execute(
-                    """SELECT id, sender_id, recipient_id, content, sent_at, is_read 
-                       FROM messages 
-                       WHERE recipient_id = ? 
-                       ORDER BY sent_at DESC LIMIT 10""",
-                    (user_id,)
+    async def _fetch_message_page(cls, columns: str, where: str, params: tuple,
+                                  cursor: Optional[Tuple[str, int]], direction: str, limit: int,
+                                  include_history: bool = False) -> Dict[str, Any]:
+        """Страница сообщений по ключу (sent_at, id).
+
+        Сообщения возвращаются от новых к старым; в ответе курсоры для
+        перехода к более старой ('older') и более новой ('newer') странице.
+        С include_history страница собирается из горячей таблицы и архива.
+        """
+        newer = direction == 'newer'
+        conditions = [where]
+        params = list(params)
+        if cursor is not None:
+            conditions.append("(sent_at, id) > (?, ?)" if newer else "(sent_at, id) < (?, ?)")
+            params.extend(cursor)
+        order = "ASC" if newer else "DESC"
+        async with cls._acquire() as db:
+            if include_history and cls._archive_path:
+                part = f"""SELECT * FROM (
+                               SELECT id, sender_id, recipient_id, content, sent_at, is_read 
+                               FROM {{table}} 
+                               WHERE {' AND '.join(conditions)} 
+                               ORDER BY sent_at {order}, id {order} LIMIT ?)"""
+                db_cursor = await db.execute(
+                    f"""SELECT {columns} 
+                        FROM ({part.format(table='messages')} UNION ALL {part.format(table='archive.messages')}) 
+                        ORDER BY sent_at {order}, id {order} LIMIT ?""",
+                    (*params, limit + 1, *params, limit + 1, limit + 1)
                 )
-                return await cursor.fetchall()
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения сообщений пользователя {user_id}: {e}")
-            return []
+            else:
+                db_cursor = await db.execute(
+                    f"""SELECT {columns} 
+                        FROM messages 
+                        WHERE {' AND '.join(conditions)} 
+                        ORDER BY sent_at {order}, id {order} LIMIT ?""",
+                    (*params, limit + 1)
+                )
+            rows = await db_cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+        # Ключ страницы — (sent_at, id) крайних сообщений; их позиции в выборке
+        keys = [(row[-2], row[-1]) for row in rows]
+        older_cursor = newer_cursor = None
+        if keys:
+            if (has_more and not newer) or (newer and cursor is not None):
+                older_cursor = keys[-1]
+            if (has_more and newer) or (not newer and cursor is not None):
+                newer_cursor = keys[0]
+        return {
+            'messages': [row[:-2] for row in rows],
+            'older': older_cursor,
+            'newer': newer_cursor,
+        }
 
     @classmethod
-    async def get_recent_messages_for_user(cls, user_id: int) -> List[Tuple]:
-        """Получить недавние сообщения для пользователя"""
+    async def get_messages_page(cls, user_id: int, cursor: Optional[Tuple[str, int]] = None,
+                                direction: str = 'older', limit: int = 10,
+                                include_history: bool = False) -> Dict[str, Any]:
+        """Страница входящих сообщений пользователя (пагинация по курсору)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                cursor = await db.execute(
-                    """SELECT id, sender_id, recipient_id, 'text' as message_type, content, 
-                              NULL as file_id, sent_at, is_read, NULL as reply_to_id
-                       FROM messages 
-                       WHERE recipient_id = ? 
-                       ORDER BY sent_at DESC LIMIT 10""",
-                    (user_id,)
-                )
-                return await cursor.fetchall()
+            return await cls._fetch_message_page(
+                "id, sender_id, recipient_id, content, sent_at, is_read, sent_at, id",
+                "recipient_id = ?", (user_id,), cursor, direction, limit, include_history
+            )
         except Exception as e:
             logger.error(f"❌ Ошибка получения сообщений пользователя {user_id}: {e}")
-            return []
+            return {'messages': [], 'older': None, 'newer': None}
 
     @classmethod
-    async def get_conversation_history(cls, tutor_id: int, student_id: int) -> List[Tuple]:
-        """Получить историю переписки"""
+    async def get_conversation_page(cls, tutor_id: int, student_id: int, cursor: Optional[Tuple[str, int]] = None,
+                                    direction: str = 'older', limit: int = 20,
+                                    include_history: bool = False) -> Dict[str, Any]:
+        """Страница переписки репетитора и студента (пагинация по курсору)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                cursor = await db.execute(
-                    """SELECT id, sender_id, recipient_id, content, sent_at, is_read 
-                       FROM messages 
-                       WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?)
-                       ORDER BY sent_at DESC LIMIT 20""",
-                    (tutor_id, student_id, student_id, tutor_id)
-                )
-                return await cursor.fetchall()
+            return await cls._fetch_message_page(
+                "id, sender_id, recipient_id, content, sent_at, is_read, sent_at, id",
+                "conversation_key = ?", (cls.conversation_key(tutor_id, student_id),), cursor, direction, limit,
+                include_history
+            )
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории переписки: {e}")
+            return {'messages': [], 'older': None, 'newer': None}
+
+    @staticmethod
+    def conversation_key(first_id: int, second_id: int) -> str:
+        """Канонический ключ переписки двух пользователей (совпадает с messages.conversation_key)"""
+        return f"{min(first_id, second_id)}:{max(first_id, second_id)}"
+
+    @classmethod
+    async def get_messages_for_user(cls, user_id: int, limit: int = 10) -> List[Tuple]:
+        """Получить сообщения для пользователя"""
+        page = await cls.get_messages_page(user_id, limit=limit)
+        return page['messages']
+
+    @classmethod
+    async def get_recent_messages_for_user(cls, user_id: int, limit: int = 10) -> List[Tuple]:
+        """Получить недавние сообщения для пользователя"""
+        try:
+            page = await cls._fetch_message_page(
+                """id, sender_id, recipient_id, 'text' as message_type, content, 
+                   NULL as file_id, sent_at, is_read, NULL as reply_to_id, sent_at, id""",
+                "recipient_id = ?", (user_id,), None, 'older', limit
+            )
+            return page['messages']
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сообщений пользователя {user_id}: {e}")
             return []
 
+    @classmethod
+    async def get_conversation_history(cls, tutor_id: int, student_id: int, limit: int = 20,
+                                       include_history: bool = False) -> List[Tuple]:
+        """Получить историю переписки (с include_history — вместе с архивом)"""
+        page = await cls.get_conversation_page(tutor_id, student_id, limit=limit, include_history=include_history)
+        return page['messages']
+
     # Методы для работы с заявками
     @classmethod
     async def add_student_request(cls, student_id: int, tutor_id: int) -> Optional[int]:
         """Добавить заявку студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                cursor = await db.execute(
-                    "INSERT INTO student_requests (student_id, tutor_id) VALUES (?, ?)",
-                    (student_id, tutor_id)
-                )
-                await db.commit()
-                return cursor.lastrowid
+            return await cls._queued_insert(
+                "INSERT INTO student_requests (student_id, tutor_id) VALUES (?, ?)",
+                (student_id, tutor_id)
+            )
         except Exception as e:
             logger.error(f"❌ Ошибка добавления заявки: {e}")
             return None
@@ -652,7 +1234,7 @@ class Database:
     async def get_student_requests_for_tutor(cls, tutor_id: int) -> List[Tuple]:
         """Получить заявки студентов для репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT sr.id, sr.student_id, sr.tutor_id, sr.status, sr.created_at,
                               u.name, u.age, u.timezone, u.subject
@@ -671,7 +1253,7 @@ class Database:
     async def get_student_request_by_id(cls, request_id: int) -> Optional[Tuple]:
         """Получить заявку по ID"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, student_id, tutor_id, status, created_at FROM student_requests WHERE id = ?",
                     (request_id,)
@@ -685,27 +1267,53 @@ class Database:
     async def approve_student_request(cls, request_id: int, tutor_id: int) -> bool:
         """Одобрить заявку студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "UPDATE student_requests SET status = 'accepted' WHERE id = ?",
                     (request_id,)
                 )
-                await db.commit()
+                await cls._commit(db)
                 return True
         except Exception as e:
             logger.error(f"❌ Ошибка одобрения заявки {request_id}: {e}")
             return False
 
+    @classmethod
+    async def accept_student_request(cls, request_id: int, schedule: List[Tuple[int, str, Optional[str]]] = (),
+                                     weeks: int = 4) -> bool:
+        """Принять заявку: одобрить, закрепить студента за репетитором, записать
+        стандартное расписание (день недели, время, предмет) и создать уроки.
+
+        Всё выполняется одной транзакцией — при ошибке заявка остаётся в ожидании.
+        """
+        try:
+            async with cls.transaction() as db:
+                request = await cls.get_student_request_by_id(request_id)
+                if not request or request[3] != 'pending':
+                    return False
+                _, student_id, tutor_id = request[:3]
+                await cls.approve_student_request(request_id, tutor_id)
+                await db.execute("UPDATE users SET tutor_id = ? WHERE id = ?", (tutor_id, student_id))
+                cls._user_changed(student_id)
+                for day_of_week, lesson_time, subject in schedule:
+                    await cls.add_standard_schedule(tutor_id, student_id, day_of_week, lesson_time, subject)
+                if schedule:
+                    await cls.generate_lessons_bulk(tutor_id=tutor_id, student_id=student_id, weeks=weeks)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка принятия заявки {request_id}: {e}")
+            return False
+
     @classmethod
     async def reject_student_request(cls, request_id: int) -> bool:
         """Отклонить заявку студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "UPDATE student_requests SET status = 'rejected' WHERE id = ?",
                     (request_id,)
                 )
-                await db.commit()
+                await cls._commit(db)
                 return True
         except Exception as e:
             logger.error(f"❌ Ошибка отклонения заявки {request_id}: {e}")
@@ -715,12 +1323,12 @@ class Database:
     async def process_student_request(cls, request_id: int, status: str) -> bool:
         """Обработать заявку студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "UPDATE student_requests SET status = ? WHERE id = ?",
                     (status, request_id)
                 )
-                await db.commit()
+                await cls._commit(db)
                 return True
         except Exception as e:
             logger.error(f"❌ Ошибка обработки заявки {request_id}: {e}")
@@ -736,7 +1344,7 @@ class Database:
     async def get_tutor_groups(cls, tutor_id: int) -> List[Tuple]:
         """Получить группы репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, tutor_id, name, description, created_at FROM groups WHERE tutor_id = ?",
                     (tutor_id,)
@@ -750,7 +1358,7 @@ class Database:
     async def get_group_by_id(cls, group_id: int) -> Optional[Tuple]:
         """Получить группу по ID"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     "SELECT id, tutor_id, name, description, created_at FROM groups WHERE id = ?",
                     (group_id,)
@@ -764,7 +1372,7 @@ class Database:
     async def get_group_members(cls, group_id: int) -> List[Tuple]:
         """Получить участников группы"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT u.id, u.username, u.name, u.role 
                        FROM users u 
@@ -782,7 +1390,7 @@ class Database:
     async def get_student_schedule(cls, tutor_id: int, student_id: int) -> List[Tuple]:
         """Получить расписание студента"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT id, day_of_week, time, subject 
                        FROM standard_schedule 
@@ -804,12 +1412,12 @@ class Database:
                                     subject: str = None) -> bool:
         """Добавить стандартное расписание"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 await db.execute(
                     "INSERT INTO standard_schedule (tutor_id, student_id, day_of_week, time, subject) VALUES (?, ?, ?, ?, ?)",
                     (tutor_id, student_id, day_of_week, lesson_time, subject or "Не указан")
                 )
-                await db.commit()
+                await cls._commit(db)
                 return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления стандартного расписания: {e}")
@@ -818,37 +1426,120 @@ class Database:
     @classmethod
     async def generate_lessons_from_standard_schedule(cls, tutor_id: int, student_id: int, weeks: int = 4) -> bool:
         """Генерировать уроки из стандартного расписания"""
-        try:
-            schedule = await cls.get_standard_schedule(tutor_id, student_id)
-            if not schedule:
-                return False
-
-            # Получаем стоимость урока
-            tutor_info = await cls.get_tutor(tutor_id)
-            cost = tutor_info[4] if tutor_info else 1000
-
-            # Генерируем уроки на указанное количество недель
-            from datetime import datetime, timedelta
-            today = datetime.now()
-
-            for week in range(weeks):
-                for schedule_item in schedule:
-                    _, day_of_week, time, subject = schedule_item
+        result = await cls.generate_lessons_bulk(tutor_id=tutor_id, student_id=student_id, weeks=weeks)
+        return bool(result.get('schedules'))
 
-                    # Вычисляем дату урока
-                    days_ahead = day_of_week - today.weekday()
-                    if days_ahead <= 0:
-                        days_ahead += 7
-                    days_ahead += week * 7
-
-                    lesson_date = (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
-
-                    await cls.add_lesson(student_id, tutor_id, lesson_date, time, subject, cost)
-
-            return True
+    @classmethod
+    async def generate_lessons_bulk(cls, tutor_id: int = None, student_id: int = None,
+                                    weeks: int = 4) -> Dict[str, Any]:
+        """Генерировать уроки из стандартного расписания одной транзакцией.
+
+        Без tutor_id обрабатываются все репетиторы, без student_id — все
+        студенты репетитора. Уже существующие уроки (тот же студент,
+        репетитор, дата и время) повторно не создаются; уроки,
+        пересекающиеся с чужими уроками репетитора или его отпуском,
+        пропускаются: пакетная проверка по индексу расписания, а
+        пересечение с уроками других процессов — в самом INSERT.
+        """
+        started = time.perf_counter()
+        try:
+            conditions, params = [], []
+            if tutor_id is not None:
+                conditions.append("s.tutor_id = ?")
+                params.append(tutor_id)
+            if student_id is not None:
+                conditions.append("s.student_id = ?")
+                params.append(student_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    f"""SELECT s.tutor_id, s.student_id, s.day_of_week, s.time, s.subject, t.cost, u.timezone
+                        FROM standard_schedule s
+                        LEFT JOIN tutors t ON t.id = s.tutor_id
+                        LEFT JOIN users u ON u.id = s.tutor_id
+                        {where}""",
+                    params
+                )
+                schedule = await cursor.fetchall()
+                if not schedule:
+                    return {'schedules': 0, 'rows_written': 0, 'conflicts': 0,
+                            'elapsed': time.perf_counter() - started}
+
+                today = datetime.now()
+                rows = []
+                for week in range(weeks):
+                    for item_tutor_id, item_student_id, day_of_week, lesson_time, subject, cost, tz_name in schedule:
+                        # Вычисляем дату урока
+                        days_ahead = day_of_week - today.weekday()
+                        if days_ahead <= 0:
+                            days_ahead += 7
+                        days_ahead += week * 7
+
+                        lesson_date = (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+                        rows.append((
+                            item_student_id, item_tutor_id, lesson_date, lesson_time, subject,
+                            cost if cost is not None else 1000,
+                            to_utc_timestamp(lesson_date, lesson_time, resolve_zone(tz_name))
+                        ))
+
+                # Урок того же студента в то же время — не пересечение, а уже созданный урок
+                checks = iter(cls._schedule.check_many((row[1], row[6]) for row in rows if row[6] is not None))
+                accepted, conflicts, existing = [], 0, 0
+                for row in rows:
+                    found = next(checks) if row[6] is not None else []
+                    if any(c.student_id != row[0] or c.starts_at != row[6] for c in found):
+                        conflicts += 1
+                    else:
+                        accepted.append(row)
+                        existing += bool(found)
+
+                # Пересечения проверяются ещё и в базе тем же оператором, что и вставка
+                # (индекс видит только уроки своего процесса, см. add_lesson); id новых
+                # уроков берутся из RETURNING, а не из строк, вставленных другими соединениями
+                duration = cls._schedule.duration
+                created = []
+                for i in range(0, len(accepted), BULK_INSERT_CHUNK):
+                    chunk = accepted[i:i + BULK_INSERT_CHUNK]
+                    cursor = await db.execute(
+                        f"""WITH batch (student_id, tutor_id, lesson_date, lesson_time, subject, cost, starts_at) AS (
+                                VALUES {', '.join('(?, ?, ?, ?, ?, ?, ?)' for _ in chunk)})
+                            INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, subject, cost, starts_at)
+                            SELECT * FROM batch b
+                            WHERE NOT EXISTS (
+                                    SELECT 1 FROM lessons l
+                                    WHERE l.student_id = b.student_id AND l.tutor_id = b.tutor_id
+                                      AND l.lesson_date = b.lesson_date AND l.lesson_time = b.lesson_time)
+                              AND (b.starts_at IS NULL OR NOT EXISTS (
+                                    SELECT 1 FROM lessons l
+                                    WHERE l.tutor_id = b.tutor_id AND l.starts_at > b.starts_at - ?
+                                      AND l.starts_at < b.starts_at + ? AND l.status != 'cancelled'))
+                            RETURNING id, tutor_id, starts_at, student_id""",
+                        [value for row in chunk for value in row] + [duration, duration]
+                    )
+                    created.extend(await cursor.fetchall())
+                rows_written = len(created)
+                # Пропущенные базой строки, которых индекс не считал уже созданными, — уроки других процессов
+                conflicts += max(len(accepted) - rows_written - existing, 0)
+                await cls._commit(db)
+
+            for lesson_id, item_tutor_id, starts_at, item_student_id in created:
+                cls._schedule.add_lesson(lesson_id, item_tutor_id, starts_at, item_student_id)
+            cls._after_rollback(lambda: [cls._schedule.remove_lesson(row[0]) for row in created])
+
+            if rows_written:
+                cls._emit('lessons_generated', tutor_id=tutor_id, student_id=student_id)
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"📅 Сгенерировано уроков: {rows_written} из {len(rows)} "
+                f"({len(schedule)} слотов расписания, пересечений {conflicts}) за {elapsed * 1000:.1f} мс"
+            )
+            return {'schedules': len(schedule), 'rows_written': rows_written, 'conflicts': conflicts,
+                    'elapsed': elapsed}
         except Exception as e:
             logger.error(f"❌ Ошибка генерации уроков из расписания: {e}")
-            return False
+            return {}
 
     @classmethod
     async def get_group_schedule(cls, tutor_id: int, group_id: int) -> List[Tuple]:
@@ -865,7 +1556,7 @@ class Database:
     async def get_available_slots(cls, tutor_id: int) -> List[Tuple]:
         """Получить доступные слоты репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT id, tutor_id, slot_date, slot_time, is_booked 
                        FROM available_slots 
@@ -880,15 +1571,60 @@ class Database:
 
     @classmethod
     async def add_available_slot(cls, tutor_id: int, slot_date: str, slot_time: str) -> bool:
-        """Добавить доступный слот"""
+        """Добавить доступный слот (не пересекающийся с уроками, слотами и отпусками репетитора)"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                await db.execute(
-                    "INSERT INTO available_slots (tutor_id, slot_date, slot_time) VALUES (?, ?, ?)",
-                    (tutor_id, slot_date, slot_time)
+            starts_at = to_utc_timestamp(slot_date, slot_time, await cls.get_user_zone(tutor_id))
+            if starts_at is not None:
+                conflicts = cls._schedule.conflicts(tutor_id, starts_at, kinds=(LESSON, SLOT, VACATION))
+                if conflicts:
+                    logger.warning(f"⚠️ Слот репетитора {tutor_id} на {slot_date} {slot_time} не добавлен: "
+                                   f"пересечение ({', '.join(c.kind for c in conflicts)})")
+                    return False
+            reservation = cls._schedule.reserve_slot(tutor_id, starts_at)
+            duration = cls._schedule.duration
+            guard, guard_params = "", ()
+            if starts_at is not None:
+                # Как в add_lesson: пересечения с занятостью других процессов проверяются
+                # в самом INSERT. Слоты и отпуска хранятся в местном времени репетитора
+                local = parse_local_datetime(slot_date, slot_time)
+                guard = """WHERE NOT EXISTS (
+                               SELECT 1 FROM lessons 
+                               WHERE tutor_id = ? AND starts_at > ? AND starts_at < ? AND status != 'cancelled')
+                             AND NOT EXISTS (
+                               SELECT 1 FROM available_slots 
+                               WHERE tutor_id = ? AND is_booked = 0 AND slot_date BETWEEN ? AND ? 
+                                 AND ABS(strftime('%s', slot_date || ' ' || slot_time) - strftime('%s', ?)) < ?)
+                             AND NOT EXISTS (
+                               SELECT 1 FROM vacation_periods 
+                               WHERE tutor_id = ? AND start_date <= ? AND end_date >= ?)"""
+                guard_params = (
+                    tutor_id, starts_at - duration, starts_at + duration,
+                    tutor_id, (local - timedelta(days=1)).strftime('%Y-%m-%d'),
+                    (local + timedelta(days=1)).strftime('%Y-%m-%d'), local.strftime('%Y-%m-%d %H:%M'), duration,
+                    tutor_id, (local + timedelta(seconds=duration - 1)).strftime('%Y-%m-%d'), slot_date,
                 )
-                await db.commit()
-                return True
+            try:
+                async with cls._acquire() as db:
+                    cursor = await db.execute(
+                        f"""INSERT INTO available_slots (tutor_id, slot_date, slot_time) 
+                            SELECT ?, ?, ? {guard}""",
+                        (tutor_id, slot_date, slot_time, *guard_params)
+                    )
+                    inserted = cursor.rowcount
+                    await cls._commit(db)
+            except Exception:
+                cls._schedule.remove_slot(reservation)
+                raise
+            if not inserted:
+                cls._schedule.remove_slot(reservation)
+                logger.warning(f"⚠️ Слот репетитора {tutor_id} на {slot_date} {slot_time} не добавлен: "
+                               f"пересечение с занятостью, добавленной другим процессом")
+                return False
+            slot_id = cursor.lastrowid
+            cls._schedule.confirm_slot(reservation, slot_id)
+            cls._after_rollback(lambda: cls._schedule.remove_slot(slot_id))
+            cls._emit('slot_added', slot_id=slot_id, tutor_id=tutor_id, starts_at=starts_at)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка добавления доступного слота: {e}")
             return False
@@ -898,7 +1634,7 @@ class Database:
     async def get_vacation_periods(cls, tutor_id: int) -> List[Tuple]:
         """Получить периоды отпуска репетитора"""
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
+            async with cls._acquire() as db:
                 cursor = await db.execute(
                     """SELECT id, tutor_id, start_date, end_date, reason, created_at 
                        FROM vacation_periods 
@@ -911,64 +1647,508 @@ class Database:
             logger.error(f"❌ Ошибка получения периодов отпуска репетитора {tutor_id}: {e}")
             return []
 
-    # Методы для статистики
     @classmethod
-    async def get_system_statistics(cls) -> Dict[str, Any]:
-        """Получить статистику системы"""
+    async def add_vacation_period(cls, tutor_id: int, start_date: str, end_date: str,
+                                  reason: str = None) -> Optional[int]:
+        """Добавить период отпуска (даты включительно, в поясе репетитора); возвращает id"""
+        try:
+            bounds = local_date_bounds(start_date, end_date, await cls.get_user_zone(tutor_id))
+            if bounds is None or bounds[0] >= bounds[1]:
+                logger.warning(f"⚠️ Некорректный период отпуска {start_date} — {end_date}")
+                return None
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    "INSERT INTO vacation_periods (tutor_id, start_date, end_date, reason) VALUES (?, ?, ?, ?)",
+                    (tutor_id, start_date, end_date, reason)
+                )
+                await cls._commit(db)
+            vacation_id = cursor.lastrowid
+            cls._schedule.add_vacation(tutor_id, *bounds)
+            # Отпуск в индексе не удаляется по одному — при откате индекс репетитора перечитывается
+            cls._after_rollback(lambda: asyncio.ensure_future(cls.reload_schedule_index(tutor_id)))
+            cls._emit('vacation_added', vacation_id=vacation_id, tutor_id=tutor_id,
+                      starts_at=bounds[0], ends_at=bounds[1])
+            return vacation_id
+        except Exception as e:
+            logger.error(f"❌ Ошибка добавления отпуска репетитора {tutor_id}: {e}")
+            return None
+
+    @classmethod
+    async def apply_vacation_period(cls, tutor_id: int, start_date: str, end_date: str, reason: str = None,
+                                    shift: bool = False) -> Dict[str, Any]:
+        """Записать отпуск и разом отменить или перенести попавшие в него уроки.
+
+        Уроки выбираются одним диапазонным запросом по (tutor_id, starts_at).
+        С shift=True урок переносится в то же время на первый день после
+        отпуска, где у репетитора свободно (поиск на VACATION_SHIFT_SEARCH_DAYS
+        дней вперёд, с учётом уже перенесённых уроков; день проверяется по
+        индексу расписания и по базе); если такого дня нет — отменяется. Всё выполняется одной транзакцией. Возвращает id отпуска, отменённые и
+        перенесённые уроки (id, student_id, subject, старое и новое starts_at).
+        """
+        started = time.perf_counter()
         try:
-            async with aiosqlite.connect(cls._db_path) as db:
-                stats = {}
+            zone = await cls.get_user_zone(tutor_id)
+            async with cls.transaction() as db:
+                vacation_id = await cls.add_vacation_period(tutor_id, start_date, end_date, reason)
+                if vacation_id is None:
+                    raise ValueError("отпуск не записан")
+                vacation_start, vacation_end = local_date_bounds(start_date, end_date, zone)
+                # +status: без него планировщик берёт idx_lessons_status_starts и проходит
+                # уроки всех репетиторов за период вместо диапазона idx_lessons_tutor_starts
+                cursor = await db.execute(
+                    """SELECT id, student_id, lesson_date, lesson_time, subject, starts_at FROM lessons 
+                       WHERE tutor_id = ? AND starts_at > ? AND starts_at < ? AND +status = 'scheduled' 
+                       ORDER BY starts_at""",
+                    (tutor_id, vacation_start - LESSON_DURATION_MINUTES * 60, vacation_end)
+                )
+                lessons = await cursor.fetchall()
+                selected = time.perf_counter()
+
+                first_day = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+                cancelled, shifted, moves = [], [], []
+                for lesson_id, student_id, lesson_date, lesson_time, subject, starts_at in lessons:
+                    new_starts_at = None
+                    if shift:
+                        # Еженедельный урок того же студента занимает тот же день недели через неделю,
+                        # поэтому ищем первый свободный день в то же время, а не только тот же день недели
+                        for offset in range(VACATION_SHIFT_SEARCH_DAYS):
+                            new_date = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+                            candidate = to_utc_timestamp(new_date, lesson_time, zone)
+                            if candidate is None or cls._schedule.conflicts(tutor_id, candidate):
+                                continue
+                            # Индекс видит только свой процесс — перепроверяем по базе (транзакция держит
+                            # блокировку записи). Уроки этого отпуска ещё на старых местах, их пропускаем
+                            cursor = await db.execute(
+                                """SELECT 1 FROM lessons 
+                                   WHERE tutor_id = ? AND starts_at > ? AND starts_at < ? AND status != 'cancelled' 
+                                     AND NOT (starts_at > ? AND starts_at < ? AND status = 'scheduled') 
+                                   UNION ALL 
+                                   SELECT 1 FROM vacation_periods 
+                                   WHERE tutor_id = ? AND start_date <= ? AND end_date >= ? 
+                                   LIMIT 1""",
+                                (tutor_id, candidate - LESSON_DURATION_MINUTES * 60,
+                                 candidate + LESSON_DURATION_MINUTES * 60,
+                                 vacation_start - LESSON_DURATION_MINUTES * 60, vacation_end,
+                                 tutor_id, new_date, new_date)
+                            )
+                            if await cursor.fetchone() is None:
+                                new_starts_at = candidate
+                                break
+                    if new_starts_at is None:
+                        cancelled.append((lesson_id, student_id, subject, starts_at, None))
+                        continue
+                    # Новое время занимается сразу, чтобы следующие переносы его учитывали
+                    cls._schedule.remove_lesson(lesson_id)
+                    cls._schedule.add_lesson(lesson_id, tutor_id, new_starts_at, student_id)
+                    shifted.append((lesson_id, student_id, subject, starts_at, new_starts_at))
+                    moves.append((new_date, lesson_time, new_starts_at, lesson_id))
+
+                await db.executemany("UPDATE lessons SET status = 'cancelled' WHERE id = ?",
+                                     [(item[0],) for item in cancelled])
+                await db.executemany("UPDATE lessons SET lesson_date = ?, lesson_time = ?, starts_at = ? WHERE id = ?",
+                                     moves)
+                cls._after_rollback(lambda: asyncio.ensure_future(cls.reload_schedule_index(tutor_id)))
+                for lesson_id, student_id, subject, starts_at, new_starts_at in cancelled + shifted:
+                    if new_starts_at is None:
+                        cls._after_commit(lambda lesson_id=lesson_id: cls._schedule.remove_lesson(lesson_id))
+                    cls._emit('lesson_cancelled', lesson_id=lesson_id, tutor_id=tutor_id)
+                    if new_starts_at is not None:
+                        cls._emit('lesson_added', lesson_id=lesson_id, student_id=student_id, tutor_id=tutor_id,
+                                  starts_at=new_starts_at, subject=subject)
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"🏖 Отпуск репетитора {tutor_id} {start_date} — {end_date}: уроков {len(lessons)}, "
+                f"отменено {len(cancelled)}, перенесено {len(shifted)} "
+                f"(выборка {(selected - started) * 1000:.1f} мс, всего {elapsed * 1000:.1f} мс)"
+            )
+            return {'vacation_id': vacation_id, 'cancelled': cancelled, 'shifted': shifted, 'elapsed': elapsed}
+        except Exception as e:
+            logger.error(f"❌ Ошибка применения отпуска репетитора {tutor_id}: {e}")
+            return {}
 
-                # Общее количество пользователей
-                cursor = await db.execute("SELECT COUNT(*) FROM users")
-                stats['total_users'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def get_tutor_calendar(cls, tutor_id: int, start_ts: int, end_ts: int, start_date: str,
+                                 end_date: str) -> Dict[str, List[Tuple]]:
+        """Занятость репетитора за период (для расчёта свободных окон).
 
-                # Количество по ролям
-                cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-                stats['tutors'] = (await cursor.fetchone())[0]
+        Уроки — по starts_at в [start_ts, end_ts), слоты и отпуска — по
+        локальным датам start_date..end_date включительно.
+        """
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    """SELECT starts_at FROM lessons 
+                       WHERE tutor_id = ? AND starts_at >= ? AND starts_at < ? AND status != 'cancelled' 
+                       ORDER BY starts_at""",
+                    (tutor_id, start_ts - LESSON_DURATION_MINUTES * 60, end_ts)
+                )
+                lessons = await cursor.fetchall()
+                cursor = await db.execute(
+                    """SELECT slot_date, slot_time, is_booked FROM available_slots 
+                       WHERE tutor_id = ? AND slot_date BETWEEN ? AND ?""",
+                    (tutor_id, start_date, end_date)
+                )
+                slots = await cursor.fetchall()
+                cursor = await db.execute(
+                    """SELECT start_date, end_date FROM vacation_periods 
+                       WHERE tutor_id = ? AND start_date <= ? AND end_date >= ?""",
+                    (tutor_id, end_date, start_date)
+                )
+                vacations = await cursor.fetchall()
+            return {'lessons': lessons, 'slots': slots, 'vacations': vacations}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения календаря репетитора {tutor_id}: {e}")
+            return {'lessons': [], 'slots': [], 'vacations': []}
 
-                cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'student'")
-                stats['students'] = (await cursor.fetchone())[0]
+    # Проверка пересечений в расписании
+    @classmethod
+    async def check_lesson_conflicts(cls, tutor_id: int, lesson_date: str, lesson_time: str) -> List[Conflict]:
+        """Уроки и отпуска репетитора, с которыми пересечётся урок в это время"""
+        starts_at = to_utc_timestamp(lesson_date, lesson_time, await cls.get_user_zone(tutor_id))
+        if starts_at is None:
+            return []
+        return cls._schedule.conflicts(tutor_id, starts_at)
 
-                cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'superadmin'")
-                stats['superadmins'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def validate_lessons(cls, lessons: List[Tuple[int, str, str]]) -> List[List[Conflict]]:
+        """Проверить пачку уроков (tutor_id, дата, время) с расписанием и между собой.
+
+        Для каждого урока возвращается список пересечений (пустой — урок
+        можно добавить).
+        """
+        items = []
+        for tutor_id, lesson_date, lesson_time in lessons:
+            items.append((tutor_id, to_utc_timestamp(lesson_date, lesson_time, await cls.get_user_zone(tutor_id))))
+        results: List[List[Conflict]] = [[] for _ in items]
+        valid = [i for i, (_, starts_at) in enumerate(items) if starts_at is not None]
+        for i, found in zip(valid, cls._schedule.check_many(items[i] for i in valid)):
+            results[i] = found
+        return results
 
-                cursor = await db.execute("SELECT COUNT(*) FROM users WHERE role = 'archived'")
-                stats['archived'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def _load_schedule_index(cls, db, tutor_id: int = None):
+        """Заполнить индекс расписания предстоящими уроками, слотами и отпусками"""
+        started = time.perf_counter()
+        since = int(time.time()) - LESSON_DURATION_MINUTES * 60
+        since_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        params = (tutor_id,) if tutor_id is not None else ()
+
+        def only_tutor(column: str) -> str:
+            return f"AND {column} = ?" if tutor_id is not None else ""
+
+        cursor = await db.execute(
+            f"""SELECT id, tutor_id, starts_at, student_id FROM lessons 
+                WHERE status = 'scheduled' AND starts_at >= ? {only_tutor('tutor_id')}""",
+            (since, *params)
+        )
+        lessons = await cursor.fetchall()
+        cursor = await db.execute(
+            f"""SELECT s.id, s.tutor_id, s.slot_date, s.slot_time, u.timezone 
+                FROM available_slots s LEFT JOIN users u ON u.id = s.tutor_id 
+                WHERE s.is_booked = 0 AND s.slot_date >= ? {only_tutor('s.tutor_id')}""",
+            (since_date, *params)
+        )
+        slots = await cursor.fetchall()
+        cursor = await db.execute(
+            f"""SELECT v.tutor_id, v.start_date, v.end_date, u.timezone 
+                FROM vacation_periods v LEFT JOIN users u ON u.id = v.tutor_id 
+                WHERE v.end_date >= ? {only_tutor('v.tutor_id')}""",
+            (since_date, *params)
+        )
+        vacations = await cursor.fetchall()
+
+        if tutor_id is None:
+            cls._schedule.clear()
+        else:
+            cls._schedule.clear_tutor(tutor_id)
+        for lesson_id, item_tutor_id, starts_at, student_id in lessons:
+            cls._schedule.add_lesson(lesson_id, item_tutor_id, starts_at, student_id)
+        for slot_id, item_tutor_id, slot_date, slot_time, tz_name in slots:
+            cls._schedule.add_slot(slot_id, item_tutor_id, to_utc_timestamp(slot_date, slot_time, resolve_zone(tz_name)))
+        for item_tutor_id, start_date, end_date, tz_name in vacations:
+            bounds = local_date_bounds(start_date, end_date, resolve_zone(tz_name))
+            if bounds is not None:
+                cls._schedule.add_vacation(item_tutor_id, *bounds)
+        logger.info(f"📅 Индекс расписания: {len(lessons)} уроков, {len(slots)} слотов, "
+                    f"{len(vacations)} отпусков за {(time.perf_counter() - started) * 1000:.1f} мс")
 
-                # Статистика уроков
-                cursor = await db.execute("SELECT COUNT(*) FROM lessons")
-                stats['total_lessons'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def reload_schedule_index(cls, tutor_id: int = None) -> bool:
+        """Перестроить индекс расписания по базе (для репетитора или целиком)"""
+        try:
+            async with cls._acquire() as db:
+                await cls._load_schedule_index(db, tutor_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки индекса расписания: {e}")
+            return False
 
-                cursor = await db.execute("SELECT COUNT(*) FROM lessons WHERE status = 'completed'")
-                stats['completed_lessons'] = (await cursor.fetchone())[0]
+    # Методы для хранилища состояний FSM
+    @classmethod
+    async def get_fsm_session(cls, key: str) -> Optional[Tuple]:
+        """Получить сохранённое состояние диалога (state, data, updated_at)"""
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute(
+                    "SELECT state, data, updated_at FROM fsm_sessions WHERE key = ?",
+                    (key,)
+                )
+                return await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения состояния FSM {key}: {e}")
+            return None
 
-                cursor = await db.execute("SELECT COUNT(*) FROM lessons WHERE status = 'scheduled'")
-                stats['paid_lessons'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def save_fsm_sessions(cls, upserts: List[Tuple[str, Optional[str], str, int]],
+                                deletes: List[str]) -> bool:
+        """Записать пачку состояний диалогов одной транзакцией"""
+        try:
+            async with cls._acquire() as db:
+                if upserts:
+                    await db.executemany(
+                        """INSERT INTO fsm_sessions (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                           ON CONFLICT (key) DO UPDATE SET 
+                               state = excluded.state, data = excluded.data, updated_at = excluded.updated_at""",
+                        upserts
+                    )
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_sessions WHERE key = ?", [(key,) for key in deletes])
+                await cls._commit(db)
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения состояний FSM: {e}")
+            return False
 
-                # Статистика домашних заданий
-                cursor = await db.execute("SELECT COUNT(*) FROM homework")
-                stats['homework_assigned'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def delete_expired_fsm_sessions(cls, before_ts: int) -> int:
+        """Удалить состояния диалогов, не менявшиеся с before_ts"""
+        try:
+            async with cls._acquire() as db:
+                cursor = await db.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (before_ts,))
+                await cls._commit(db)
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки состояний FSM: {e}")
+            return 0
 
-                cursor = await db.execute("SELECT COUNT(*) FROM homework WHERE is_completed = 1")
-                stats['homework_submitted'] = (await cursor.fetchone())[0]
+    # Потоковое чтение для выгрузок
+    @classmethod
+    async def _stream(cls, queries: List[Tuple[str, tuple]], chunk_size: int) -> AsyncIterator[List[Tuple]]:
+        """Строки запросов по очереди, порциями по chunk_size.
+
+        Чтение идёт через отдельное соединение (пул не занимается) в одной
+        транзакции чтения: выгрузка согласована, даже если во время неё
+        данные меняются или уходят в архив. В памяти — одна порция.
+        """
+        pool = await cls._get_pool()
+        async with pool.dedicated() as db:
+            await db.execute("BEGIN")
+            try:
+                # Снимок в WAL фиксируется первым чтением файла — читаем обе базы сразу,
+                # иначе строка, перенесённая в архив между запросами, потерялась бы
+                await db.execute("SELECT COUNT(*) FROM sqlite_master")
+                if cls._archive_path:
+                    await db.execute("SELECT COUNT(*) FROM archive.sqlite_master")
+                for sql, params in queries:
+                    cursor = await db.execute(sql, params)
+                    while True:
+                        rows = await cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield rows
+                    await cursor.close()
+            finally:
+                await db.rollback()
 
-                # Статистика сообщений
-                cursor = await db.execute("SELECT COUNT(*) FROM messages")
-                stats['total_messages'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def iter_tutor_lessons(cls, tutor_id: int, statuses: Tuple[str, ...] = None, include_history: bool = True,
+                                 chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Tuple]]:
+        """Уроки репетитора от старых к новым, порциями (с include_history — начиная с архива).
+
+        Строка: id, lesson_date, lesson_time, student_id, имя студента, subject, status, cost.
+        """
+        condition, params = "l.tutor_id = ?", (tutor_id,)
+        if statuses:
+            condition += f" AND l.status IN ({', '.join('?' for _ in statuses)})"
+            params += tuple(statuses)
+        tables = ['archive.lessons', 'lessons'] if include_history and cls._archive_path else ['lessons']
+        queries = [(f"""SELECT l.id, l.lesson_date, l.lesson_time, l.student_id, u.name, l.subject, l.status, l.cost 
+                        FROM {table} l 
+                        LEFT JOIN users u ON u.id = l.student_id 
+                        WHERE {condition} 
+                        ORDER BY l.starts_at""", params) for table in tables]
+        async for rows in cls._stream(queries, chunk_size):
+            yield rows
 
-                # Статистика заявок
-                cursor = await db.execute("SELECT COUNT(*) FROM student_requests WHERE status = 'pending'")
-                stats['pending_requests'] = (await cursor.fetchone())[0]
+    @classmethod
+    async def iter_tutor_homework(cls, tutor_id: int,
+                                  chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Tuple]]:
+        """Домашние задания репетитора от старых к новым, порциями.
+
+        Строка: id, assigned_at, student_id, имя студента, content_type, содержимое,
+        description, reminder_date, reminder_time, is_completed.
+        """
+        query = ("""SELECT h.id, h.assigned_at, h.student_id, u.name, h.content_type, 
+                           COALESCE(m.file_id, m.content, h.content_data), h.description, 
+                           h.reminder_date, h.reminder_time, h.is_completed 
+                    FROM homework h 
+                    LEFT JOIN users u ON u.id = h.student_id 
+                    LEFT JOIN media m ON m.id = h.media_id 
+                    WHERE h.tutor_id = ? 
+                    ORDER BY h.assigned_at, h.id""", (tutor_id,))
+        async for rows in cls._stream([query], chunk_size):
+            yield rows
+
+    # Архив истории
+    @classmethod
+    async def archive_history(cls, lessons_before: int, messages_before: str,
+                              batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+        """Перенести в архивную базу проведённые и отменённые уроки, начавшиеся
+        до lessons_before (UNIX-время), и сообщения, отправленные до
+        messages_before ('YYYY-MM-DD HH:MM:SS', UTC).
+
+        Перенос идёт порциями по batch_size строк. Фиксация не атомарна
+        между основной и подключённой базой в режиме WAL, поэтому порция
+        сначала копируется и фиксируется в архиве, а затем отдельной
+        транзакцией из горячей таблицы удаляются только строки, копия
+        которых в архиве совпадает с оригиналом. После сбоя между шагами
+        строка временно есть в обеих базах и будет перенесена повторно.
+        Счётчики статистики при переносе не меняются. Возвращает число
+        перенесённых строк по таблицам.
+        """
+        moved = {'lessons': 0, 'messages': 0}
+        if not cls._archive_path:
+            return moved
+        selections = {
+            'lessons': ("SELECT id FROM lessons WHERE status IN ('completed', 'cancelled') AND starts_at < ? LIMIT ?",
+                        lessons_before),
+            # id растут вместе с sent_at: старые сообщения находятся в начале таблицы
+            'messages': ("SELECT id FROM messages WHERE sent_at < ? ORDER BY id LIMIT ?", messages_before),
+        }
+        archived_at = int(time.time())
+        try:
+            for table, (select_sql, before) in selections.items():
+                columns = ', '.join(ARCHIVED_COLUMNS[table])
+                # Строка, изменённая после копирования, остаётся в горячей таблице до следующей порции
+                same_copy = ' AND '.join(f"a.{column} IS {table}.{column}" for column in ARCHIVED_COLUMNS[table])
+                while True:
+                    # Шаг 1: копия порции фиксируется в архиве (запись только в архивную базу)
+                    async with cls._acquire() as db:
+                        cursor = await db.execute(select_sql, (before, batch_size))
+                        ids = [(row[0],) for row in await cursor.fetchall()]
+                        if ids:
+                            await db.executemany(
+                                f"""INSERT OR REPLACE INTO archive.{table} ({columns}, archived_at) 
+                                    SELECT {columns}, {archived_at} FROM {table} WHERE id = ?""",
+                                ids
+                            )
+                            await cls._commit(db)
+                    if not ids:
+                        break
+                    # Шаг 2: удаление подтверждённых копий (запись только в основную базу)
+                    async with cls.transaction() as db:
+                        # Пока в archive_moving есть строка таблицы, триггеры удаления не трогают счётчики
+                        await db.execute("INSERT INTO archive_moving (table_name) VALUES (?)", (table,))
+                        cursor = await db.executemany(
+                            f"""DELETE FROM {table} 
+                                WHERE id = ? AND EXISTS (SELECT 1 FROM archive.{table} a 
+                                                         WHERE a.id = {table}.id AND {same_copy})""",
+                            ids
+                        )
+                        moved[table] += cursor.rowcount
+                        await db.execute("DELETE FROM archive_moving WHERE table_name = ?", (table,))
+                    if len(ids) < batch_size:
+                        break
+                    # Между порциями даём выполниться другим задачам
+                    await asyncio.sleep(0)
+            return moved
+        except Exception as e:
+            logger.error(f"❌ Ошибка переноса истории в архив: {e}")
+            return moved
 
-                # Финансовая статистика
-                cursor = await db.execute("SELECT SUM(cost) FROM lessons WHERE status = 'completed'")
-                result = await cursor.fetchone()
-                stats['total_revenue'] = result[0] if result[0] else 0
+    @classmethod
+    async def get_archive_stats(cls) -> Dict[str, int]:
+        """Число строк в горячих таблицах и в архиве"""
+        if not cls._archive_path:
+            return {}
+        try:
+            stats = {}
+            async with cls._acquire() as db:
+                for table in ARCHIVED_COLUMNS:
+                    cursor = await db.execute(
+                        f"SELECT (SELECT COUNT(*) FROM {table}), (SELECT COUNT(*) FROM archive.{table})"
+                    )
+                    stats[table], stats[f"archived_{table}"] = await cursor.fetchone()
+            return stats
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики архива: {e}")
+            return {}
 
-                stats['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Методы для статистики
+    @classmethod
+    async def get_system_statistics(cls, use_counters: bool = True) -> Dict[str, Any]:
+        """Получить статистику системы.
 
-                return stats
+        По умолчанию читает счётчики stats_counters, которые поддерживают
+        триггеры; с use_counters=False считает по данным — один агрегирующий
+        запрос на таблицу.
+        """
+        try:
+            async with cls._acquire() as db:
+                if use_counters:
+                    cursor = await db.execute("SELECT name, value FROM stats_counters")
+                    counters = dict(await cursor.fetchall())
+                else:
+                    counters = await collect_stats_counters(db)
+
+            def count(name: str) -> int:
+                return int(counters.get(name) or 0)
+
+            return {
+                # Пользователи по ролям
+                'total_users': count('users'),
+                'tutors': count('users.role.admin'),
+                'students': count('users.role.student'),
+                'superadmins': count('users.role.superadmin'),
+                'archived': count('users.role.archived'),
+                # Статистика уроков
+                'total_lessons': count('lessons'),
+                'completed_lessons': count('lessons.status.completed'),
+                'paid_lessons': count('lessons.status.scheduled'),
+                # Статистика домашних заданий
+                'homework_assigned': count('homework'),
+                'homework_submitted': count('homework.completed'),
+                # Статистика сообщений и заявок
+                'total_messages': count('messages'),
+                'pending_requests': count('requests.status.pending'),
+                # Финансовая статистика
+                'total_revenue': counters.get('lessons.revenue') or 0,
+                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                # Задержки и нагрузка слоя данных (форматирование — get_query_stats_text)
+                'db_metrics': query_metrics.summary(),
+            }
         except Exception as e:
             logger.error(f"❌ Ошибка получения статистики системы: {e}")
             return {}
+
+    @classmethod
+    def get_query_stats_text(cls, top: int = 5) -> str:
+        """Сводка задержек запросов для раздела «📊 Статистика системы»"""
+        return format_summary(query_metrics.summary(top), top)
+
+    @classmethod
+    async def rebuild_statistics_counters(cls) -> bool:
+        """Пересчитать счётчики статистики по данным (если таблицы менялись в обход триггеров)"""
+        try:
+            async with cls._acquire() as db:
+                await rebuild_stats_counters(db)
+                await cls._commit(db)
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчёта счётчиков статистики: {e}")
+            return False
+
+
+# Учёт времени каждого публичного метода (см. db_metrics)
+instrument(Database, query_metrics)
@@ -0,0 +1,270 @@
+import functools
+import inspect
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from constants import DB_METRICS_ENABLED, DB_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек, мс (последняя корзина — всё, что больше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Один и тот же медленный запрос разбирается через EXPLAIN не чаще раза в этот интервал, сек
+EXPLAIN_INTERVAL = 300
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+# Счётчик запросов текущей задачи (см. count_statements)
+_statement_scope: ContextVar[Optional[List[int]]] = ContextVar('statement_scope', default=None)
+
+
+@contextmanager
+def count_statements():
+    """Считать SQL-запросы, выполненные в текущей задаче внутри блока.
+
+    Вставки через очередь групповой фиксации выполняются её задачей и не учитываются.
+    """
+    counter = [0]
+    token = _statement_scope.set(counter)
+    try:
+        yield counter
+    finally:
+        _statement_scope.reset(token)
+
+
+class MethodStats:
+    """Статистика одного метода Database"""
+
+    __slots__ = ('calls', 'errors', 'rows', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed: float, rows: int, error: bool):
+        self.calls += 1
+        self.rows += rows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if error:
+            self.errors += 1
+        elapsed_ms = elapsed * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины), мс"""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                break
+        max_ms = round(self.max * 1000, 2)
+        return min(float(LATENCY_BUCKETS_MS[i]), max_ms) if i < len(LATENCY_BUCKETS_MS) else max_ms
+
+
+class QueryMetrics:
+    """Задержки методов Database и журнал медленных запросов.
+
+    Методы учитываются обёрткой instrument(), отдельные SQL-запросы —
+    соединениями пула (TimedConnection). Запросы дольше slow_ms пишутся
+    в лог вместе с EXPLAIN QUERY PLAN.
+    """
+
+    def __init__(self, slow_ms: float = DB_SLOW_QUERY_MS, enabled: bool = DB_METRICS_ENABLED,
+                 keep_slow: int = 20):
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self.methods: Dict[str, MethodStats] = {}
+        self.statements = 0
+        self.statement_errors = 0
+        self.statement_time = 0.0
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=keep_slow)
+        self._explained: Dict[str, float] = {}
+        self.started = time.monotonic()
+
+    def reset(self):
+        """Обнулить накопленную статистику"""
+        self.methods.clear()
+        self.statements = self.statement_errors = 0
+        self.statement_time = 0.0
+        self.slow.clear()
+        self._explained.clear()
+        self.started = time.monotonic()
+
+    def record_method(self, name: str, elapsed: float, rows: int = 0, error: bool = False):
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = MethodStats()
+        stats.record(elapsed, rows, error)
+
+    def record_statement(self, elapsed: float, error: bool = False):
+        scope = _statement_scope.get()
+        if scope is not None:
+            scope[0] += 1
+        self.statements += 1
+        self.statement_time += elapsed
+        if error:
+            self.statement_errors += 1
+
+    def is_slow(self, elapsed: float) -> bool:
+        return elapsed * 1000 >= self.slow_ms
+
+    async def log_slow(self, conn, sql: str, params: Any, elapsed: float):
+        """Записать медленный запрос и, раз в EXPLAIN_INTERVAL, его план"""
+        text = " ".join(sql.split())
+        plan: Optional[List[str]] = None
+        now = time.monotonic()
+        explainable = text.upper().startswith(_EXPLAINABLE)
+        if explainable and now - self._explained.get(text, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL:
+            self._explained[text] = now
+            try:
+                cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}", params if params is not None else ())
+                plan = [row[-1] for row in await cursor.fetchall()]
+            except Exception as e:
+                plan = [f"EXPLAIN недоступен: {e}"]
+        self.slow.append({'sql': text[:300], 'ms': round(elapsed * 1000, 1), 'plan': plan, 'at': time.time()})
+        message = f"🐢 Медленный запрос {elapsed * 1000:.1f} мс: {text[:300]}"
+        if plan:
+            message += "\n    " + "\n    ".join(plan)
+        elif explainable:
+            message += " (план записан ранее или пуст)"
+        logger.warning(message)
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """Сводка: самые затратные методы (по суммарному времени) и общие показатели"""
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        ranked = sorted(self.methods.items(), key=lambda item: item[1].total, reverse=True)
+        methods = []
+        for name, stats in ranked[:top]:
+            methods.append({
+                'method': name,
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'rows': stats.rows,
+                'per_min': round(stats.calls / uptime * 60, 2),
+                'avg_ms': round(stats.total / stats.calls * 1000, 2),
+                'p50_ms': stats.percentile(0.5),
+                'p95_ms': stats.percentile(0.95),
+                'p99_ms': stats.percentile(0.99),
+                'max_ms': round(stats.max * 1000, 2),
+            })
+        return {
+            'uptime': round(uptime, 1),
+            'calls': sum(stats.calls for stats in self.methods.values()),
+            'statements': self.statements,
+            'statement_errors': self.statement_errors,
+            'statement_ms': round(self.statement_time * 1000, 1),
+            'slow_queries': len(self.slow),
+            'slow_threshold_ms': self.slow_ms,
+            'methods': methods,
+        }
+
+
+def _count_rows(result: Any) -> int:
+    """Число строк в результате метода: список строк или одна строка"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        return 1
+    return 0
+
+
+def _timed(name: str, func, metrics: QueryMetrics):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return await func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException:
+            metrics.record_method(name, time.perf_counter() - started, error=True)
+            raise
+        metrics.record_method(name, time.perf_counter() - started, _count_rows(result))
+        return result
+    return wrapper
+
+
+def instrument(cls, metrics: QueryMetrics):
+    """Обернуть публичные асинхронные методы класса учётом времени"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or not isinstance(attr, (classmethod, staticmethod)):
+            continue
+        func = attr.__func__
+        if inspect.iscoroutinefunction(func):
+            setattr(cls, name, type(attr)(_timed(name, func, metrics)))
+    return cls
+
+
+class TimedConnection:
+    """Обёртка соединения aiosqlite, замеряющая каждый запрос"""
+
+    def __init__(self, conn, metrics: QueryMetrics):
+        self._conn = conn
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _timed(self, method, sql: str, params: Any, explain_params: Any):
+        if not self._metrics.enabled:
+            return await method(sql, params)
+        started = time.perf_counter()
+        try:
+            cursor = await method(sql, params)
+        except BaseException:
+            self._metrics.record_statement(time.perf_counter() - started, error=True)
+            raise
+        elapsed = time.perf_counter() - started
+        self._metrics.record_statement(elapsed)
+        if self._metrics.is_slow(elapsed):
+            await self._metrics.log_slow(self._conn, sql, explain_params, elapsed)
+        return cursor
+
+    async def execute(self, sql: str, parameters: Sequence[Any] = None):
+        return await self._timed(self._conn.execute, sql, parameters, parameters)
+
+    async def executemany(self, sql: str, parameters):
+        first = parameters[0] if isinstance(parameters, (list, tuple)) and parameters else None
+        return await self._timed(self._conn.executemany, sql, parameters, first)
+
+    async def commit(self):
+        started = time.perf_counter()
+        await self._conn.commit()
+        if self._metrics.enabled:
+            self._metrics.record_statement(time.perf_counter() - started)
+
+
+def format_summary(summary: Dict[str, Any], top: int = 5) -> str:
+    """Текст для раздела «📊 Статистика системы»"""
+    if not summary or not summary.get('calls'):
+        return "🗄 База данных: запросов ещё не было"
+    lines = [
+        f"🗄 База данных: {summary['calls']} вызовов, {summary['statements']} SQL-запросов "
+        f"(ошибок: {summary['statement_errors']}), медленных (≥{summary['slow_threshold_ms']:g} мс): "
+        f"{summary['slow_queries']}"
+    ]
+    for item in summary['methods'][:top]:
+        lines.append(
+            f"• {item['method']}: {item['calls']} ({item['per_min']}/мин), "
+            f"p50 {item['p50_ms']:g} / p99 {item['p99_ms']:g} мс, строк {item['rows']}"
+        )
+    return "\n".join(lines)
+
+
+# Общие метрики слоя данных
+query_metrics = QueryMetrics()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+from db_metrics import QueryMetrics, TimedConnection
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с SQLite"""
+
+    def __init__(self, db_path: str, size: int = 4, busy_timeout: int = 5000,
+                 cached_statements: int = 256, metrics: Optional[QueryMetrics] = None,
+                 attach: Optional[Dict[str, str]] = None):
+        self._db_path = db_path
+        # Дополнительные файлы базы, подключаемые к каждому соединению: схема -> путь
+        self._attach = dict(attach or {})
+        self._metrics = metrics
+        self._size = max(1, size)
+        self._busy_timeout = busy_timeout
+        self._cached_statements = cached_statements
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._closed = True
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def open(self):
+        """Открыть все соединения пула"""
+        if not self._closed:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self._size):
+            conn = await self._connect()
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+        self._closed = False
+        logger.info(f"✅ Пул соединений открыт ({self._size} соединений, {self._db_path})")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Создать соединение и применить настройки PRAGMA"""
+        conn = await aiosqlite.connect(self._db_path, cached_statements=self._cached_statements)
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout)}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        # INSERT OR REPLACE должен вызывать DELETE-триггеры (счётчики статистики)
+        await conn.execute("PRAGMA recursive_triggers = ON")
+        for schema, path in self._attach.items():
+            await conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            await conn.execute(f"PRAGMA {schema}.journal_mode = WAL")
+            await conn.execute(f"PRAGMA {schema}.synchronous = NORMAL")
+        return TimedConnection(conn, self._metrics) if self._metrics is not None else conn
+
+    async def _reset(self, conn: aiosqlite.Connection) -> aiosqlite.Connection:
+        """Вернуть соединение в чистое состояние перед возвратом в пул"""
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+            return conn
+        except Exception as e:
+            logger.error(f"❌ Соединение пула повреждено, переподключение: {e}")
+            self._connections.remove(conn)
+            try:
+                await conn.close()
+            except Exception:
+                pass
+            conn = await self._connect()
+            self._connections.append(conn)
+            return conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Взять соединение из пула на время блока"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            conn = await self._reset(conn)
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def dedicated(self):
+        """Отдельное соединение с теми же настройками, не занимающее пул (долгие чтения)"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        conn = await self._connect()
+        try:
+            await conn.execute("PRAGMA query_only = ON")
+            yield conn
+        finally:
+            await conn.close()
+
+    async def close(self):
+        """Дождаться возврата всех соединений и закрыть их"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(len(self._connections)):
+            conn = await self._idle.get()
+            await conn.close()
+        self._connections.clear()
+        self._idle = None
+        logger.info("✅ Пул соединений закрыт")
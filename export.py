@@ -0,0 +1,215 @@
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import aclosing
+from datetime import date
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.types import FSInputFile
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet — необязательная зависимость, без неё доступен только CSV
+    pyarrow = None
+
+import message_dispatcher
+from constants import EXPORT_CHUNK_SIZE, EXPORT_ROW_GROUP_SIZE, EXPORT_MAX_CONCURRENT, EXPORT_MAX_DOCUMENT_MB
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class Column(NamedTuple):
+    """Колонка выгрузки: заголовок и тип значения ('int', 'float', 'str')"""
+    name: str
+    kind: str
+
+
+class ExportFile(NamedTuple):
+    path: str
+    filename: str
+    rows: int
+    elapsed: float
+
+
+LESSON_COLUMNS = (
+    Column('id', 'int'), Column('date', 'str'), Column('time', 'str'), Column('student_id', 'int'),
+    Column('student', 'str'), Column('subject', 'str'), Column('status', 'str'), Column('cost', 'float'),
+)
+HOMEWORK_COLUMNS = (
+    Column('id', 'int'), Column('assigned_at', 'str'), Column('student_id', 'int'), Column('student', 'str'),
+    Column('content_type', 'str'), Column('content', 'str'), Column('description', 'str'),
+    Column('reminder_date', 'str'), Column('reminder_time', 'str'), Column('is_completed', 'int'),
+)
+REVENUE_COLUMNS = (Column('month', 'str'), Column('lessons', 'int'), Column('revenue', 'float'))
+
+
+async def _revenue_rows(tutor_id: int, chunk_size: int) -> AsyncIterator[List[Tuple]]:
+    """Выручка по месяцам из потока проведённых уроков (в памяти — только итоги месяцев)"""
+    months: Dict[str, List] = {}
+    async with aclosing(Database.iter_tutor_lessons(tutor_id, statuses=('completed',),
+                                                    chunk_size=chunk_size)) as chunks:
+        async for rows in chunks:
+            for row in rows:
+                total = months.setdefault((row[1] or '')[:7], [0, 0.0])
+                total[0] += 1
+                total[1] += row[7] or 0
+    if months:
+        yield [(month, count, revenue) for month, (count, revenue) in sorted(months.items())]
+
+
+# Вид выгрузки -> (колонки, источник порций строк, подпись)
+EXPORTS: Dict[str, Tuple[Tuple[Column, ...], Callable[[int, int], AsyncIterator[List[Tuple]]], str]] = {
+    'lessons': (LESSON_COLUMNS,
+                lambda tutor_id, chunk_size: Database.iter_tutor_lessons(tutor_id, chunk_size=chunk_size),
+                "Уроки"),
+    'homework': (HOMEWORK_COLUMNS,
+                 lambda tutor_id, chunk_size: Database.iter_tutor_homework(tutor_id, chunk_size=chunk_size),
+                 "Домашние задания"),
+    'revenue': (REVENUE_COLUMNS, _revenue_rows, "Выручка по месяцам"),
+}
+
+
+class _CsvWriter:
+    def __init__(self, path: str, columns: Tuple[Column, ...]):
+        # BOM — чтобы Excel открыл кириллицу без выбора кодировки
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column.name for column in columns])
+
+    def write(self, rows: List[Tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Parquet с явной схемой; строки копятся до группы EXPORT_ROW_GROUP_SIZE"""
+
+    def __init__(self, path: str, columns: Tuple[Column, ...]):
+        types = {'int': pyarrow.int64(), 'float': pyarrow.float64(), 'str': pyarrow.string()}
+        self._schema = pyarrow.schema([(column.name, types[column.kind]) for column in columns])
+        self._floats = [i for i, column in enumerate(columns) if column.kind == 'float']
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression='zstd')
+        self._buffer: List[Tuple] = []
+
+    def write(self, rows: List[Tuple]):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= EXPORT_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = [list(values) for values in zip(*self._buffer)]
+        # SQLite отдаёт целую стоимость как int — приводим к типу колонки
+        for i in self._floats:
+            columns[i] = [float(value) if value is not None else None for value in columns[i]]
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, self._schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        try:
+            self._flush()
+        finally:
+            self._writer.close()
+
+
+_WRITERS = {'csv': _CsvWriter, 'parquet': _ParquetWriter}
+# Каждая выгрузка держит отдельное соединение с базой
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+def available_formats() -> Tuple[str, ...]:
+    """Форматы, доступные в этой установке"""
+    return ('csv', 'parquet') if pyarrow is not None else ('csv',)
+
+
+def _gzip(path: str) -> str:
+    """Сжать файл потоково, исходный удалить"""
+    target = path + '.gz'
+    with open(path, 'rb') as source, gzip.open(target, 'wb', compresslevel=6) as compressed:
+        shutil.copyfileobj(source, compressed, 1024 * 1024)
+    os.remove(path)
+    return target
+
+
+async def export_tutor_data(tutor_id: int, kind: str, fmt: str = 'csv',
+                            directory: str = None) -> Optional[ExportFile]:
+    """Записать выгрузку репетитора во временный файл.
+
+    Строки читаются из базы порциями (Database.iter_tutor_*), запись
+    порции в файл идёт в пуле потоков — цикл событий не блокируется,
+    а память не зависит от числа строк. CSV больше предела Bot API
+    сжимается в gzip. Файл удаляет вызывающий.
+    """
+    if kind not in EXPORTS or fmt not in _WRITERS:
+        logger.error(f"❌ Неизвестная выгрузка {kind} ({fmt})")
+        return None
+    if fmt not in available_formats():
+        logger.warning("⚠️ Выгрузка в Parquet недоступна: не установлен pyarrow")
+        return None
+    columns, source, _ = EXPORTS[kind]
+    filename = f"{kind}_{tutor_id}_{date.today():%Y%m%d}.{fmt}"
+    loop = asyncio.get_running_loop()
+    async with _slots:
+        started = time.perf_counter()
+        fd, path = tempfile.mkstemp(prefix='export-', suffix=f'.{fmt}', dir=directory)
+        os.close(fd)
+        rows_written = 0
+        try:
+            writer = await loop.run_in_executor(None, _WRITERS[fmt], path, columns)
+            try:
+                async with aclosing(source(tutor_id, EXPORT_CHUNK_SIZE)) as chunks:
+                    async for rows in chunks:
+                        await loop.run_in_executor(None, writer.write, rows)
+                        rows_written += len(rows)
+            finally:
+                await loop.run_in_executor(None, writer.close)
+            if fmt == 'csv' and os.path.getsize(path) > EXPORT_MAX_DOCUMENT_MB * 1024 * 1024:
+                path = await loop.run_in_executor(None, _gzip, path)
+                filename += '.gz'
+        except Exception as e:
+            logger.error(f"❌ Ошибка выгрузки {kind} репетитора {tutor_id}: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+    elapsed = time.perf_counter() - started
+    logger.info(f"📤 Выгрузка {kind} репетитора {tutor_id}: {rows_written} строк, "
+                f"{os.path.getsize(path) / 1024:.0f} КБ за {elapsed * 1000:.0f} мс")
+    return ExportFile(path, filename, rows_written, elapsed)
+
+
+async def send_tutor_export(chat_id: int, tutor_id: int, kind: str, fmt: str = 'csv') -> bool:
+    """Сформировать выгрузку и отправить её документом через диспетчер сообщений"""
+    dispatcher = message_dispatcher.message_dispatcher
+    if dispatcher is None:
+        logger.error("❌ Диспетчер сообщений не запущен, выгрузка не отправлена")
+        return False
+    result = await export_tutor_data(tutor_id, kind, fmt)
+    if result is None:
+        await dispatcher.send_message(chat_id, "❌ Не удалось сформировать выгрузку")
+        return False
+    try:
+        if os.path.getsize(result.path) > EXPORT_MAX_DOCUMENT_MB * 1024 * 1024:
+            await dispatcher.send_message(
+                chat_id, f"⚠️ Выгрузка больше {EXPORT_MAX_DOCUMENT_MB} МБ и не может быть отправлена в Telegram"
+            )
+            return False
+        await dispatcher.call('send_document', chat_id,
+                              document=FSInputFile(result.path, filename=result.filename),
+                              caption=f"📤 {EXPORTS[kind][2]}: {result.rows} строк")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки выгрузки репетитору {tutor_id}: {e}")
+        return False
+    finally:
+        os.remove(result.path)
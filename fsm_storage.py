@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from constants import FSM_SESSION_TTL, FSM_FLUSH_INTERVAL, FSM_HOT_SIZE, FSM_HOT_IDLE
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class _Session:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, touched: float = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = touched or time.time()
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в базе бота вместо MemoryStorage.
+
+    Активные диалоги держатся в памяти (горячий слой, LRU), изменения
+    накапливаются и раз в FSM_FLUSH_INTERVAL записываются в таблицу
+    fsm_sessions одной транзакцией. Сессии, не менявшиеся дольше
+    FSM_SESSION_TTL, считаются брошенными и удаляются; неактивные
+    сессии выгружаются из памяти, так что её расход ограничен.
+    """
+
+    def __init__(self, ttl: int = FSM_SESSION_TTL, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 hot_size: int = FSM_HOT_SIZE, hot_idle: float = FSM_HOT_IDLE):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.hot_size = hot_size
+        self.hot_idle = hot_idle
+        self._hot: "OrderedDict[str, _Session]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _session(self, key: StorageKey) -> _Session:
+        """Сессия из памяти или из базы"""
+        db_key = self._key(key)
+        session = self._hot.get(db_key)
+        if session is None:
+            row = await Database.get_fsm_session(db_key)
+            # Пока шёл запрос, сессию могли создать параллельно
+            session = self._hot.get(db_key)
+            if session is None:
+                session = _Session()
+                if row and row[2] >= time.time() - self.ttl:
+                    try:
+                        session = _Session(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+                    except ValueError as e:
+                        logger.error(f"❌ Повреждены данные FSM {db_key}: {e}")
+                self._hot[db_key] = session
+        elif session.touched < time.time() - self.ttl:
+            # Брошенный диалог: начинаем с чистого состояния
+            session.state, session.data = None, {}
+            self._dirty.add(db_key)
+            self._ensure_flusher()
+        self._hot.move_to_end(db_key)
+        return session
+
+    def _touch(self, key: StorageKey, session: _Session):
+        session.touched = time.time()
+        self._dirty.add(self._key(key))
+        self._ensure_flusher()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        session = await self._session(key)
+        session.state = state.state if isinstance(state, State) else state
+        self._touch(key, session)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._session(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        session = await self._session(key)
+        session.data = dict(data)
+        self._touch(key, session)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._session(key)).data)
+
+    async def flush(self):
+        """Записать накопленные изменения в базу"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for db_key in dirty:
+            session = self._hot.get(db_key)
+            if session is None or session.empty:
+                deletes.append(db_key)
+                continue
+            try:
+                upserts.append((db_key, session.state, json.dumps(session.data, ensure_ascii=False),
+                                int(session.touched)))
+            except (TypeError, ValueError) as e:
+                logger.error(f"❌ Данные FSM {db_key} не сериализуются в JSON: {e}")
+        saved = False
+        try:
+            saved = await Database.save_fsm_sessions(upserts, deletes)
+        finally:
+            if not saved:
+                # Повторим при следующей записи (в том числе если запись прервана отменой)
+                self._dirty |= dirty
+
+    def _evict(self):
+        """Выгрузить из памяти неактивные и лишние сессии (только уже записанные)"""
+        idle_before = time.time() - self.hot_idle
+        for db_key in list(self._hot):
+            if len(self._hot) <= self.hot_size and self._hot[db_key].touched >= idle_before:
+                break
+            if db_key not in self._dirty:
+                del self._hot[db_key]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict()
+                if time.time() - self._last_cleanup > 3600:
+                    self._last_cleanup = time.time()
+                    removed = await Database.delete_expired_fsm_sessions(int(time.time() - self.ttl))
+                    if removed:
+                        logger.info(f"🧹 Удалено брошенных диалогов: {removed}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи состояний FSM: {e}")
+
+    async def close(self) -> None:
+        """Остановить фоновую запись и сохранить всё накопленное"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
@@ -2,11 +2,42 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMar
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 from database import Database
 from constants import ROLES
+from functools import lru_cache, wraps
+from typing import Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Клавиатура репетиторов вместе с версией таблицы, из которой она построена
+_tutors_keyboard: Optional[Tuple[int, InlineKeyboardMarkup]] = None
 
+
+def _copy_markup(markup):
+    """Копия клавиатуры со своими рядами и кнопками"""
+    field = 'inline_keyboard' if isinstance(markup, InlineKeyboardMarkup) else 'keyboard'
+    rows = [[button.model_copy() for button in row] for row in getattr(markup, field)]
+    return markup.model_copy(update={field: rows})
+
+
+def _cached_keyboard(build):
+    """Строить статическую клавиатуру один раз, а отдавать копию.
+
+    Разметка aiogram изменяема (TelegramObject не frozen): отдай мы
+    всем один объект, правка рядов или кнопок у одного вызывающего
+    попала бы во все следующие сообщения. Копия готовой разметки
+    примерно в шесть раз дешевле сборки через builder.
+    """
+    cached = lru_cache(maxsize=None)(build)
+
+    @wraps(build)
+    def wrapper(*args, **kwargs):
+        return _copy_markup(cached(*args, **kwargs))
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+@_cached_keyboard
 def get_main_menu_keyboard(role: str) -> ReplyKeyboardMarkup:
     """Получить главное меню в зависимости от роли"""
     builder = ReplyKeyboardBuilder()
@@ -35,6 +66,7 @@ def get_main_menu_keyboard(role: str) -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@_cached_keyboard
 def get_admin_homework_content_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора типа домашнего задания"""
     builder = InlineKeyboardBuilder()
@@ -57,6 +89,7 @@ def get_admin_homework_content_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@_cached_keyboard
 def get_student_homework_content_keyboard(include_cancel: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура для выбора типа сдачи ДЗ студентом"""
     builder = InlineKeyboardBuilder()
@@ -83,6 +116,11 @@ def get_student_homework_content_keyboard(include_cancel: bool = False) -> Inlin
 
 async def get_tutors_keyboard() -> InlineKeyboardMarkup:
     """Получить клавиатуру со списком репетиторов"""
+    global _tutors_keyboard
+    version = Database.get_tutors_version()
+    if _tutors_keyboard is not None and _tutors_keyboard[0] == version:
+        return _copy_markup(_tutors_keyboard[1])
+
     try:
         tutors = await Database.get_all_tutors()
         builder = InlineKeyboardBuilder()
@@ -102,7 +140,13 @@ async def get_tutors_keyboard() -> InlineKeyboardMarkup:
                 ))
         
         builder.adjust(1)
-        return builder.as_markup()
+        markup = builder.as_markup()
+        # get_all_tutors при ошибке базы тоже возвращает [] — пустой список не кэшируем,
+        # иначе один сбой скрыл бы всех репетиторов до следующего изменения таблицы
+        if tutors:
+            _tutors_keyboard = (version, markup)
+            return _copy_markup(markup)
+        return markup
         
     except Exception as e:
         logger.error(f"❌ Ошибка создания клавиатуры репетиторов: {e}")
@@ -114,6 +158,7 @@ async def get_tutors_keyboard() -> InlineKeyboardMarkup:
         return builder.as_markup()
 
 
+@_cached_keyboard
 def get_superadmin_menu_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура меню суперадмина"""
     builder = ReplyKeyboardBuilder()
@@ -127,6 +172,7 @@ def get_superadmin_menu_keyboard() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@_cached_keyboard
 def get_cancel_button() -> ReplyKeyboardMarkup:
     """Кнопка отмены"""
     builder = ReplyKeyboardBuilder()
@@ -146,6 +192,7 @@ def get_confirmation_keyboard(action: str, item_id: int) -> InlineKeyboardMarkup
     return builder.as_markup()
 
 
+@_cached_keyboard
 def get_role_selection_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора роли"""
     builder = InlineKeyboardBuilder()
@@ -178,3 +225,44 @@ async def get_tutors_for_deletion_keyboard(tutors) -> InlineKeyboardMarkup:
     
     builder.adjust(1)
     return builder.as_markup()
+
+
+def encode_message_cursor(cursor: Tuple[str, int]) -> str:
+    """Курсор (sent_at, id) в компактную строку для callback_data"""
+    sent_at, message_id = cursor
+    return f"{''.join(ch for ch in str(sent_at) if ch.isdigit())}.{message_id}"
+
+
+def decode_message_cursor(value: str) -> Optional[Tuple[str, int]]:
+    """Строка из callback_data обратно в курсор (sent_at, id)"""
+    try:
+        digits, message_id = value.split('.')
+        sent_at = (f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} "
+                   f"{digits[8:10]}:{digits[10:12]}:{digits[12:14]}")
+        return sent_at, int(message_id)
+    except (ValueError, IndexError):
+        return None
+
+
+def get_messages_pagination_keyboard(prefix: str, page: dict) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки «старше/новее» для страницы сообщений.
+
+    callback_data имеет вид "{prefix}_older_{курсор}" / "{prefix}_newer_{курсор}".
+    """
+    buttons = []
+    if page.get('older'):
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Старше",
+            callback_data=f"{prefix}_older_{encode_message_cursor(page['older'])}"
+        ))
+    if page.get('newer'):
+        buttons.append(InlineKeyboardButton(
+            text="Новее ➡️",
+            callback_data=f"{prefix}_newer_{encode_message_cursor(page['newer'])}"
+        ))
+    if not buttons:
+        return None
+
+    builder = InlineKeyboardBuilder()
+    builder.row(*buttons)
+    return builder.as_markup()
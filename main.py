@@ -1,12 +1,16 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from app import create_bot, create_dispatcher
+from archive import archive_job
+from availability import availability_engine
 from database import Database
-from constants import BOT_TOKEN
-from handlers import common, admin, superadmin, student
+from fsm_storage import SQLiteStorage
+from constants import BOT_MODE, BOT_WORKERS
 from notifications import init_notification_service
+from message_dispatcher import init_message_dispatcher
 from scheduler import init_scheduler
+from supervisor import run_supervisor
+from webhook import run_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,38 +23,44 @@ logger = logging.getLogger(__name__)
 async def main():
     """Главная функция запуска бота"""
     try:
-        # Инициализация бота и диспетчера
-        bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
+        # Инициализация бота
+        bot = create_bot()
         
         # Инициализация базы данных
         await Database.init_db()
         logger.info("✅ База данных инициализирована")
-        
+
+        # Диспетчер с хранилищем состояний диалогов в базе
+        storage = SQLiteStorage()
+        dp = create_dispatcher(storage)
+        logger.info("✅ Роутеры зарегистрированы")
+
         # Инициализация сервисов
         init_notification_service(bot)
+        dispatcher = init_message_dispatcher(bot)
+        dispatcher.start()
         scheduler = init_scheduler(bot)
-        
-        # Регистрация роутеров
-        dp.include_router(common.router)
-        dp.include_router(admin.router)
-        dp.include_router(superadmin.router)
-        dp.include_router(student.router)
-        
-        logger.info("✅ Роутеры зарегистрированы")
+        availability_engine.start()
+        archive_job.start()
         
         # Запуск планировщика в фоне
         scheduler_task = asyncio.create_task(scheduler.start())
         
         # Запуск бота
-        logger.info("🚀 Запуск бота...")
+        logger.info(f"🚀 Запуск бота (режим {BOT_MODE})...")
         try:
-            await dp.start_polling(bot)
+            if BOT_MODE == "webhook":
+                await run_webhook(bot, dp)
+            else:
+                await dp.start_polling(bot)
         finally:
             # Остановка планировщика при завершении
             await scheduler.stop()
             scheduler_task.cancel()
+            await archive_job.stop()
+            availability_engine.stop()
+            await dispatcher.stop()
+            await storage.close()
             await Database.close()
             
     except Exception as e:
@@ -60,7 +70,10 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if BOT_WORKERS > 1:
+            asyncio.run(run_supervisor(BOT_WORKERS))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
     except Exception as e:
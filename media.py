@@ -0,0 +1,34 @@
+import hashlib
+from typing import Any, Optional, Tuple, Union
+
+# Типы вложений, у которых content_data — file_id Telegram; остальные хранятся как текст
+FILE_TYPES = ('photo', 'document', 'video', 'audio', 'voice', 'animation', 'video_note')
+
+
+def is_file_type(content_type: Optional[str]) -> bool:
+    return content_type in FILE_TYPES
+
+
+def content_hash(data: Union[bytes, str]) -> str:
+    """SHA-256 содержимого (hex)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def media_hash(content_type: Optional[str], content_data: Optional[str]) -> str:
+    """Ключ вложения без file_unique_id: хэш типа и содержимого (текста или file_id)"""
+    return content_hash(f"{content_type or ''}\0{content_data or ''}")
+
+
+def extract_file(message: Any) -> Optional[Tuple[str, str, str, Optional[int]]]:
+    """Вложение сообщения aiogram: (тип, file_id, file_unique_id, размер) или None"""
+    for content_type in FILE_TYPES:
+        item = getattr(message, content_type, None)
+        if not item:
+            continue
+        # Фото приходит набором размеров — берём самый большой
+        if isinstance(item, list):
+            item = item[-1]
+        return content_type, item.file_id, item.file_unique_id, getattr(item, 'file_size', None)
+    return None
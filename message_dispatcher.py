@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram.types import BufferedInputFile
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from constants import (
+    SEND_WORKERS,
+    SEND_QUEUE_SIZE,
+    SEND_GLOBAL_RATE,
+    SEND_PER_CHAT_RATE,
+    SEND_PER_CHAT_BURST,
+    SEND_MAX_RETRIES,
+)
+from database import Database
+from media import content_hash, extract_file
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов: не более rate операций в секунду со всплеском до capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        """Ведро заполнено полностью — состояние можно не хранить"""
+        self._refill()
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+    def try_acquire(self) -> float:
+        """Забрать токен без ожидания: 0 — токен взят, иначе через сколько секунд он появится"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Job:
+    __slots__ = ('method', 'chat_id', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, method: str, chat_id: int, kwargs: Dict[str, Any], future: Optional[asyncio.Future]):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class MessageDispatcher:
+    """Очередь исходящих сообщений с пулом отправителей и ограничением частоты.
+
+    Глобальное ведро держит общий лимит Bot API (~30 сообщений в секунду),
+    вёдра по чатам — лимит на один чат. У каждого чата своя очередь,
+    сообщения чата отправляются по порядку. Чат, исчерпавший свой лимит,
+    откладывается по таймеру и не занимает отправителя, поэтому всплеск
+    в один чат не задерживает остальные. При TelegramRetryAfter отправка
+    приостанавливается для всех отправителей на указанное время, а
+    сообщение повторяется.
+    """
+
+    def __init__(self, bot, workers: int = SEND_WORKERS, queue_size: int = SEND_QUEUE_SIZE,
+                 global_rate: float = SEND_GLOBAL_RATE, per_chat_rate: float = SEND_PER_CHAT_RATE,
+                 per_chat_burst: float = SEND_PER_CHAT_BURST, max_retries: int = SEND_MAX_RETRIES):
+        self.bot = bot
+        self._workers_count = workers
+        # Не больше queue_size неотправленных заданий: дальше вызывающие ждут
+        self._capacity = asyncio.Semaphore(queue_size)
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Очереди чатов; чат с заданиями находится ровно в одном месте: в _ready, в таймере или у отправителя
+        self._chats: Dict[int, Deque[_Job]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._global_bucket = TokenBucket(global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._max_retries = max_retries
+        self._paused_until = 0.0
+        self._workers: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0
+        self.uploads_skipped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество сообщений, ожидающих отправки"""
+        return self._pending
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики отправки"""
+        return {
+            'queue_depth': self.queue_depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'deferred': self.deferred,
+            'uploads_skipped': self.uploads_skipped,
+            'chat_buckets': len(self._chat_buckets),
+        }
+
+    def start(self):
+        """Запустить отправителей"""
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+        logger.info(f"📨 Диспетчер сообщений запущен ({self._workers_count} отправителей)")
+
+    async def stop(self, drain: bool = True):
+        """Остановить отправителей, по умолчанию дождавшись опустошения очереди.
+
+        Без drain неотправленные задания отбрасываются, а ожидающие их
+        call() получают RuntimeError.
+        """
+        if drain and self._workers:
+            await self._idle.wait()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for handle in self._timers:
+            handle.cancel()
+        self._timers.clear()
+        dropped = 0
+        for queue in self._chats.values():
+            for job in queue:
+                if job.future is not None and not job.future.done():
+                    job.future.set_exception(RuntimeError("Диспетчер сообщений остановлен"))
+                self._done()
+                dropped += 1
+        self._chats.clear()
+        self._ready = asyncio.Queue()
+        if dropped:
+            logger.warning(f"⚠️ Диспетчер сообщений остановлен, не отправлено сообщений: {dropped}")
+        logger.info("📨 Диспетчер сообщений остановлен")
+
+    async def submit(self, method: str, chat_id: int, **kwargs):
+        """Поставить вызов Bot API в очередь без ожидания результата"""
+        await self._enqueue(_Job(method, chat_id, kwargs, None))
+
+    async def call(self, method: str, chat_id: int, **kwargs) -> Any:
+        """Поставить вызов в очередь и дождаться результата"""
+        future = asyncio.get_running_loop().create_future()
+        await self._enqueue(_Job(method, chat_id, kwargs, future))
+        return await future
+
+    async def send_message(self, chat_id: int, text: str, wait: bool = False, **kwargs) -> Any:
+        """Отправить текстовое сообщение через очередь"""
+        if wait:
+            return await self.call('send_message', chat_id, text=text, **kwargs)
+        await self.submit('send_message', chat_id, text=text, **kwargs)
+
+    async def send_many(self, messages: Iterable[Tuple[int, str]], **kwargs) -> int:
+        """Поставить в очередь пачку сообщений (chat_id, текст); возвращает их число"""
+        count = 0
+        for chat_id, text in messages:
+            await self._enqueue(_Job('send_message', chat_id, {'text': text, **kwargs}, None))
+            count += 1
+        return count
+
+    async def send_media(self, chat_id: int, content_type: str, data: bytes, filename: str, **kwargs) -> Any:
+        """Отправить файл (photo, document, ...) через очередь и дождаться результата.
+
+        Файл с уже отправленным содержимым не загружается повторно — берётся
+        сохранённый в media file_id; после первой загрузки file_id
+        запоминается по хэшу содержимого.
+        """
+        digest = content_hash(data)
+        known = await Database.find_media(content_hash=digest)
+        if known is not None and known[2]:
+            self.uploads_skipped += 1
+            return await self.call(f'send_{content_type}', chat_id, **{content_type: known[2]}, **kwargs)
+        message = await self.call(f'send_{content_type}', chat_id,
+                                  **{content_type: BufferedInputFile(data, filename)}, **kwargs)
+        uploaded = extract_file(message)
+        if uploaded is not None:
+            _, file_id, file_unique_id, size = uploaded
+            await Database.save_media(content_type, file_id=file_id, file_unique_id=file_unique_id,
+                                      content_hash=digest, size=size or len(data))
+        return message
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Не даём словарю расти бесконечно: вёдра с полным запасом ничего не хранят
+            if len(self._chat_buckets) >= 10000:
+                self._chat_buckets = {cid: b for cid, b in self._chat_buckets.items() if not b.idle}
+            bucket = TokenBucket(self._per_chat_rate, self._per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _enqueue(self, job: _Job):
+        await self._capacity.acquire()
+        self._pending += 1
+        self._idle.clear()
+        queue = self._chats.get(job.chat_id)
+        if queue is None:
+            self._chats[job.chat_id] = deque([job])
+            self._ready.put_nowait(job.chat_id)
+        else:
+            queue.append(job)
+
+    def _done(self):
+        self._pending -= 1
+        self._capacity.release()
+        if not self._pending:
+            self._idle.set()
+
+    def _later(self, delay: float, chat_id: int):
+        """Вернуть чат в очередь готовых через delay секунд"""
+        def wake():
+            self._timers.discard(handle)
+            self._ready.put_nowait(chat_id)
+        handle = asyncio.get_running_loop().call_later(delay, wake)
+        self._timers.add(handle)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._chats[chat_id]
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait > 0:
+                # Лимит чата исчерпан — откладываем чат, отправитель берёт следующий
+                self.deferred += 1
+                self._later(wait, chat_id)
+                continue
+            job = queue.popleft()
+            try:
+                delay = await self._attempt(job)
+            except asyncio.CancelledError:
+                queue.appendleft(job)
+                raise
+            if delay is not None:
+                # Повтор: задание остаётся первым в очереди своего чата
+                queue.appendleft(job)
+                self._later(delay, chat_id)
+                continue
+            self._done()
+            if queue:
+                self._ready.put_nowait(chat_id)
+            else:
+                del self._chats[chat_id]
+
+    async def _attempt(self, job: _Job) -> Optional[float]:
+        """Одна попытка вызова; возвращает задержку до повтора или None, если задание завершено"""
+        await self._global_bucket.acquire()
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+        job.attempts += 1
+        try:
+            result = await getattr(self.bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except TelegramRetryAfter as e:
+            # Лимит превышен: приостанавливаем всех отправителей и повторяем без учёта попыток
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self.retried += 1
+            job.attempts -= 1
+            logger.warning(f"⏳ Flood control, пауза {e.retry_after} с (чат {job.chat_id})")
+            return e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if job.attempts < self._max_retries:
+                self.retried += 1
+                return 2 ** job.attempts
+            self._fail(job, e)
+            return None
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Пользователь заблокировал бота или запрос некорректен — повтор не поможет
+            self._fail(job, e)
+            return None
+        except Exception as e:
+            self._fail(job, e)
+            return None
+
+        self.sent += 1
+        if job.future is not None and not job.future.done():
+            job.future.set_result(result)
+        return None
+
+    def _fail(self, job: _Job, error: Exception):
+        self.failed += 1
+        logger.error(f"❌ Не удалось выполнить {job.method} для чата {job.chat_id}: {error}")
+        if job.future is not None and not job.future.done():
+            job.future.set_exception(error)
+
+
+# Глобальный экземпляр диспетчера
+message_dispatcher: Optional[MessageDispatcher] = None
+
+
+def init_message_dispatcher(bot, **options) -> MessageDispatcher:
+    """Инициализация диспетчера исходящих сообщений (options — параметры MessageDispatcher)"""
+    global message_dispatcher
+    message_dispatcher = MessageDispatcher(bot, **options)
+    return message_dispatcher
@@ -0,0 +1,412 @@
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+import aiosqlite
+
+from media import is_file_type, media_hash
+from timezones import resolve_zone, to_utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Шаг миграции: SQL-запрос или асинхронная функция, получающая соединение
+MigrationStep = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+
+def _bump(name_sql: str, delta_sql: str) -> str:
+    """Оператор триггера, изменяющий счётчик статистики на delta"""
+    return (f"INSERT INTO stats_counters (name, value) VALUES ({name_sql}, {delta_sql}) "
+            f"ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;")
+
+
+# Архивная база (схема archive): перенесённые уроки и сообщения.
+# Колонки совпадают с горячими таблицами, archived_at — время переноса
+ARCHIVED_COLUMNS = {
+    'lessons': ('id', 'student_id', 'tutor_id', 'lesson_date', 'lesson_time', 'subject', 'status', 'cost',
+                'created_at', 'starts_at'),
+    'messages': ('id', 'sender_id', 'recipient_id', 'content', 'sent_at', 'is_read'),
+}
+
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS archive.lessons (
+           id INTEGER PRIMARY KEY,
+           student_id INTEGER,
+           tutor_id INTEGER,
+           lesson_date TEXT,
+           lesson_time TEXT,
+           subject TEXT,
+           status TEXT,
+           cost REAL,
+           created_at TIMESTAMP,
+           starts_at INTEGER,
+           archived_at INTEGER
+       )""",
+    "CREATE INDEX IF NOT EXISTS archive.idx_lessons_tutor_starts ON lessons (tutor_id, starts_at, status, student_id)",
+    """CREATE INDEX IF NOT EXISTS archive.idx_lessons_student_starts
+       ON lessons (student_id, starts_at, status, tutor_id)""",
+    """CREATE TABLE IF NOT EXISTS archive.messages (
+           id INTEGER PRIMARY KEY,
+           sender_id INTEGER,
+           recipient_id INTEGER,
+           content TEXT,
+           sent_at TIMESTAMP,
+           is_read BOOLEAN,
+           archived_at INTEGER,
+           conversation_key TEXT
+               GENERATED ALWAYS AS (MIN(sender_id, recipient_id) || ':' || MAX(sender_id, recipient_id)) VIRTUAL
+       )""",
+    "CREATE INDEX IF NOT EXISTS archive.idx_messages_conversation_sent ON messages (conversation_key, sent_at)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_messages_recipient_sent ON messages (recipient_id, sent_at)",
+]
+
+
+async def archive_attached(db: aiosqlite.Connection) -> bool:
+    """Подключена ли к соединению архивная база"""
+    cursor = await db.execute("SELECT 1 FROM pragma_database_list WHERE name = 'archive'")
+    return await cursor.fetchone() is not None
+
+
+async def create_archive_schema(db: aiosqlite.Connection):
+    """Создать таблицы архива, если база подключена (без commit)"""
+    if await archive_attached(db):
+        for statement in ARCHIVE_SCHEMA:
+            await db.execute(statement)
+
+
+async def collect_stats_counters(db: aiosqlite.Connection) -> Dict[str, float]:
+    """Посчитать счётчики статистики по данным — один агрегирующий запрос на таблицу.
+
+    Перенесённые в архив уроки и сообщения тоже учитываются.
+    """
+    counters: Dict[str, float] = {}
+    archived = await archive_attached(db)
+    lessons = "(SELECT status, cost FROM lessons UNION ALL SELECT status, cost FROM archive.lessons)" \
+        if archived else "lessons"
+    messages = "(SELECT id FROM messages UNION ALL SELECT id FROM archive.messages)" if archived else "messages"
+
+    cursor = await db.execute("SELECT role, COUNT(*) FROM users GROUP BY role")
+    for role, count in await cursor.fetchall():
+        counters[f"users.role.{role or ''}"] = count
+    counters['users'] = sum(v for k, v in counters.items() if k.startswith('users.role.'))
+
+    cursor = await db.execute(f"SELECT status, COUNT(*), SUM(cost) FROM {lessons} GROUP BY status")
+    counters['lessons'] = 0
+    counters['lessons.revenue'] = 0
+    for status, count, cost in await cursor.fetchall():
+        counters[f"lessons.status.{status or ''}"] = count
+        counters['lessons'] += count
+        if status == 'completed':
+            counters['lessons.revenue'] = cost or 0
+
+    cursor = await db.execute("SELECT COUNT(*), COALESCE(SUM(is_completed = 1), 0) FROM homework")
+    counters['homework'], counters['homework.completed'] = await cursor.fetchone()
+
+    cursor = await db.execute(f"SELECT COUNT(*) FROM {messages}")
+    counters['messages'] = (await cursor.fetchone())[0]
+
+    cursor = await db.execute("SELECT status, COUNT(*) FROM student_requests GROUP BY status")
+    for status, count in await cursor.fetchall():
+        counters[f"requests.status.{status or ''}"] = count
+
+    return counters
+
+
+async def rebuild_stats_counters(db: aiosqlite.Connection) -> Dict[str, float]:
+    """Пересчитать таблицу stats_counters по данным (без commit)"""
+    counters = await collect_stats_counters(db)
+    await db.execute("DELETE FROM stats_counters")
+    await db.executemany("INSERT INTO stats_counters (name, value) VALUES (?, ?)", list(counters.items()))
+    return counters
+
+
+async def _backfill_lesson_starts_at(db: aiosqlite.Connection):
+    """Заполнить lessons.starts_at по lesson_date/lesson_time (миграция 5, пояс по умолчанию)"""
+    last_id = 0
+    while True:
+        cursor = await db.execute(
+            "SELECT id, lesson_date, lesson_time FROM lessons WHERE id > ? ORDER BY id LIMIT 5000",
+            (last_id,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        await db.executemany(
+            "UPDATE lessons SET starts_at = ? WHERE id = ?",
+            [(to_utc_timestamp(lesson_date, lesson_time), lesson_id) for lesson_id, lesson_date, lesson_time in rows]
+        )
+
+
+async def _backfill_lesson_starts_at_tutor_zone(db: aiosqlite.Connection):
+    """Пересчитать lessons.starts_at в часовом поясе репетитора (миграция 6)"""
+    last_id = 0
+    while True:
+        cursor = await db.execute(
+            """SELECT l.id, l.lesson_date, l.lesson_time, u.timezone
+               FROM lessons l
+               LEFT JOIN users u ON u.id = l.tutor_id
+               WHERE l.id > ? ORDER BY l.id LIMIT 5000""",
+            (last_id,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        await db.executemany(
+            "UPDATE lessons SET starts_at = ? WHERE id = ?",
+            [(to_utc_timestamp(lesson_date, lesson_time, resolve_zone(tz_name)), lesson_id)
+             for lesson_id, lesson_date, lesson_time, tz_name in rows]
+        )
+
+
+async def _move_homework_content_to_media(db: aiosqlite.Connection):
+    """Перенести содержимое ДЗ в media: одинаковые вложения — одна строка"""
+    last_id = 0
+    while True:
+        cursor = await db.execute(
+            """SELECT id, content_type, content_data FROM homework
+               WHERE id > ? AND media_id IS NULL AND content_data IS NOT NULL ORDER BY id LIMIT 5000""",
+            (last_id,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        keyed = [(hw_id, media_hash(content_type, content_data), content_type, content_data)
+                 for hw_id, content_type, content_data in rows]
+        await db.executemany(
+            "INSERT OR IGNORE INTO media (content_hash, content_type, file_id, content) VALUES (?, ?, ?, ?)",
+            [(key, content_type, content_data if is_file_type(content_type) else None,
+              None if is_file_type(content_type) else content_data)
+             for _, key, content_type, content_data in keyed]
+        )
+        await db.executemany(
+            """UPDATE homework SET media_id = (SELECT id FROM media WHERE content_hash = ?), content_data = NULL
+               WHERE id = ?""",
+            [(key, hw_id) for hw_id, key, _, _ in keyed]
+        )
+    await db.execute("UPDATE media SET ref_count = (SELECT COUNT(*) FROM homework WHERE media_id = media.id)")
+
+
+# Версионированные миграции схемы: (версия, описание, шаги).
+# Базовые таблицы создаются в Database.init_db, здесь — всё, что добавлено позже.
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "Индексы для основных запросов", [
+        # Уроки: предстоящие уроки репетитора/студента (WHERE ... ORDER BY lesson_date, lesson_time)
+        """CREATE INDEX IF NOT EXISTS idx_lessons_tutor_date
+           ON lessons (tutor_id, lesson_date, lesson_time, status, student_id, subject)""",
+        """CREATE INDEX IF NOT EXISTS idx_lessons_student_date
+           ON lessons (student_id, lesson_date, lesson_time, status, tutor_id, subject)""",
+        # Домашние задания студента и репетитора (ORDER BY assigned_at DESC)
+        "CREATE INDEX IF NOT EXISTS idx_homework_student_assigned ON homework (student_id, assigned_at)",
+        "CREATE INDEX IF NOT EXISTS idx_homework_tutor_assigned ON homework (tutor_id, assigned_at)",
+        # Сообщения: входящие и переписка
+        "CREATE INDEX IF NOT EXISTS idx_messages_recipient_sent ON messages (recipient_id, sent_at)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender_recipient_sent ON messages (sender_id, recipient_id, sent_at)",
+        # Заявки студентов
+        """CREATE INDEX IF NOT EXISTS idx_requests_tutor_status_created
+           ON student_requests (tutor_id, status, created_at)""",
+        # Группы, расписание, слоты, отпуска
+        "CREATE INDEX IF NOT EXISTS idx_groups_tutor ON groups (tutor_id)",
+        "CREATE INDEX IF NOT EXISTS idx_group_members_group ON group_members (group_id, student_id)",
+        "CREATE INDEX IF NOT EXISTS idx_standard_schedule_tutor_student ON standard_schedule (tutor_id, student_id)",
+        """CREATE INDEX IF NOT EXISTS idx_slots_tutor_free
+           ON available_slots (tutor_id, is_booked, slot_date, slot_time)""",
+        "CREATE INDEX IF NOT EXISTS idx_vacations_tutor_start ON vacation_periods (tutor_id, start_date)",
+    ]),
+    (2, "Индексы для загрузки напоминаний", [
+        "CREATE INDEX IF NOT EXISTS idx_lessons_status_date ON lessons (status, lesson_date, lesson_time)",
+        """CREATE INDEX IF NOT EXISTS idx_homework_reminders
+           ON homework (is_completed, reminder_date, reminder_time)""",
+    ]),
+    (3, "Счётчики статистики, поддерживаемые триггерами", [
+        """CREATE TABLE IF NOT EXISTS stats_counters (
+               name TEXT PRIMARY KEY,
+               value REAL NOT NULL DEFAULT 0
+           )""",
+        # Триггеры пользователей (INSERT OR REPLACE вызывает DELETE-триггер при recursive_triggers)
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+                {_bump("'users'", "1")}
+                {_bump("'users.role.' || COALESCE(NEW.role, '')", "1")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+                {_bump("'users'", "-1")}
+                {_bump("'users.role.' || COALESCE(OLD.role, '')", "-1")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_users_role AFTER UPDATE OF role ON users BEGIN
+                {_bump("'users.role.' || COALESCE(OLD.role, '')", "-1")}
+                {_bump("'users.role.' || COALESCE(NEW.role, '')", "1")}
+            END""",
+        # Триггеры уроков: количество по статусам и выручка по проведённым
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_lessons_insert AFTER INSERT ON lessons BEGIN
+                {_bump("'lessons'", "1")}
+                {_bump("'lessons.status.' || COALESCE(NEW.status, '')", "1")}
+                {_bump("'lessons.revenue'", "CASE WHEN NEW.status = 'completed' THEN COALESCE(NEW.cost, 0) ELSE 0 END")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_lessons_delete AFTER DELETE ON lessons BEGIN
+                {_bump("'lessons'", "-1")}
+                {_bump("'lessons.status.' || COALESCE(OLD.status, '')", "-1")}
+                {_bump("'lessons.revenue'", "CASE WHEN OLD.status = 'completed' THEN -COALESCE(OLD.cost, 0) ELSE 0 END")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_lessons_update AFTER UPDATE OF status, cost ON lessons BEGIN
+                {_bump("'lessons.status.' || COALESCE(OLD.status, '')", "-1")}
+                {_bump("'lessons.status.' || COALESCE(NEW.status, '')", "1")}
+                {_bump("'lessons.revenue'",
+                       "(CASE WHEN NEW.status = 'completed' THEN COALESCE(NEW.cost, 0) ELSE 0 END)"
+                       " - (CASE WHEN OLD.status = 'completed' THEN COALESCE(OLD.cost, 0) ELSE 0 END)")}
+            END""",
+        # Триггеры домашних заданий
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_homework_insert AFTER INSERT ON homework BEGIN
+                {_bump("'homework'", "1")}
+                {_bump("'homework.completed'", "CASE WHEN NEW.is_completed = 1 THEN 1 ELSE 0 END")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_homework_delete AFTER DELETE ON homework BEGIN
+                {_bump("'homework'", "-1")}
+                {_bump("'homework.completed'", "CASE WHEN OLD.is_completed = 1 THEN -1 ELSE 0 END")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_homework_update AFTER UPDATE OF is_completed ON homework BEGIN
+                {_bump("'homework.completed'",
+                       "(CASE WHEN NEW.is_completed = 1 THEN 1 ELSE 0 END)"
+                       " - (CASE WHEN OLD.is_completed = 1 THEN 1 ELSE 0 END)")}
+            END""",
+        # Триггеры сообщений
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_messages_insert AFTER INSERT ON messages BEGIN
+                {_bump("'messages'", "1")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_messages_delete AFTER DELETE ON messages BEGIN
+                {_bump("'messages'", "-1")}
+            END""",
+        # Триггеры заявок
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_requests_insert AFTER INSERT ON student_requests BEGIN
+                {_bump("'requests.status.' || COALESCE(NEW.status, '')", "1")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_requests_delete AFTER DELETE ON student_requests BEGIN
+                {_bump("'requests.status.' || COALESCE(OLD.status, '')", "-1")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_stats_requests_status AFTER UPDATE OF status ON student_requests BEGIN
+                {_bump("'requests.status.' || COALESCE(OLD.status, '')", "-1")}
+                {_bump("'requests.status.' || COALESCE(NEW.status, '')", "1")}
+            END""",
+        # Начальные значения по существующим данным
+        rebuild_stats_counters,
+    ]),
+    (4, "Ключ переписки для пагинации сообщений", [
+        # Виртуальная генерируемая колонка: одна переписка — один диапазон индекса
+        """ALTER TABLE messages ADD COLUMN conversation_key TEXT
+           GENERATED ALWAYS AS (MIN(sender_id, recipient_id) || ':' || MAX(sender_id, recipient_id)) VIRTUAL""",
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_sent ON messages (conversation_key, sent_at)",
+        # Переписка больше не ищется по паре (sender_id, recipient_id)
+        "DROP INDEX IF EXISTS idx_messages_sender_recipient_sent",
+    ]),
+    (5, "Время начала урока в UTC (starts_at)", [
+        "ALTER TABLE lessons ADD COLUMN starts_at INTEGER",
+        _backfill_lesson_starts_at,
+        """CREATE INDEX IF NOT EXISTS idx_lessons_tutor_starts
+           ON lessons (tutor_id, starts_at, status, student_id)""",
+        """CREATE INDEX IF NOT EXISTS idx_lessons_student_starts
+           ON lessons (student_id, starts_at, status, tutor_id)""",
+        # Предстоящие уроки репетитора теперь выбираются по starts_at
+        "DROP INDEX IF EXISTS idx_lessons_tutor_date",
+    ]),
+    (6, "starts_at в часовом поясе репетитора, индекс напоминаний по starts_at", [
+        _backfill_lesson_starts_at_tutor_zone,
+        "CREATE INDEX IF NOT EXISTS idx_lessons_status_starts ON lessons (status, starts_at)",
+        "DROP INDEX IF EXISTS idx_lessons_status_date",
+    ]),
+    (7, "Хранилище состояний FSM", [
+        """CREATE TABLE IF NOT EXISTS fsm_sessions (
+               key TEXT PRIMARY KEY,
+               state TEXT,
+               data TEXT,
+               updated_at INTEGER NOT NULL
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated ON fsm_sessions (updated_at)",
+    ]),
+    (8, "Вложения ДЗ по содержимому (media)", [
+        # Одно вложение — одна строка: по file_unique_id Telegram или по хэшу содержимого
+        """CREATE TABLE IF NOT EXISTS media (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               file_unique_id TEXT UNIQUE,
+               content_hash TEXT UNIQUE,
+               content_type TEXT NOT NULL,
+               file_id TEXT,
+               content TEXT,
+               size INTEGER,
+               ref_count INTEGER NOT NULL DEFAULT 0,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        "ALTER TABLE homework ADD COLUMN media_id INTEGER REFERENCES media (id)",
+        # Индекс до переноса: пересчёт ref_count ищет ДЗ по media_id
+        "CREATE INDEX IF NOT EXISTS idx_homework_media ON homework (media_id)",
+        _move_homework_content_to_media,
+        # Число ссылок из ДЗ (для статистики дедупликации и очистки)
+        """CREATE TRIGGER IF NOT EXISTS trg_media_ref_insert AFTER INSERT ON homework
+           WHEN NEW.media_id IS NOT NULL BEGIN
+               UPDATE media SET ref_count = ref_count + 1 WHERE id = NEW.media_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_media_ref_delete AFTER DELETE ON homework
+           WHEN OLD.media_id IS NOT NULL BEGIN
+               UPDATE media SET ref_count = ref_count - 1 WHERE id = OLD.media_id;
+           END""",
+    ]),
+    (9, "Перенос истории в архив не меняет счётчики статистики", [
+        # Таблица, в которую пишет перенос: строка есть только внутри его транзакции
+        """CREATE TABLE IF NOT EXISTS archive_moving (
+               table_name TEXT PRIMARY KEY
+           )""",
+        "DROP TRIGGER IF EXISTS trg_stats_lessons_delete",
+        f"""CREATE TRIGGER trg_stats_lessons_delete AFTER DELETE ON lessons
+            WHEN NOT EXISTS (SELECT 1 FROM archive_moving WHERE table_name = 'lessons') BEGIN
+                {_bump("'lessons'", "-1")}
+                {_bump("'lessons.status.' || COALESCE(OLD.status, '')", "-1")}
+                {_bump("'lessons.revenue'", "CASE WHEN OLD.status = 'completed' THEN -COALESCE(OLD.cost, 0) ELSE 0 END")}
+            END""",
+        "DROP TRIGGER IF EXISTS trg_stats_messages_delete",
+        f"""CREATE TRIGGER trg_stats_messages_delete AFTER DELETE ON messages
+            WHEN NOT EXISTS (SELECT 1 FROM archive_moving WHERE table_name = 'messages') BEGIN
+                {_bump("'messages'", "-1")}
+            END""",
+    ]),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """Текущая версия схемы"""
+    cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return (await cursor.fetchone())[0]
+
+
+async def apply_migrations(db: aiosqlite.Connection) -> int:
+    """Применить все недостающие миграции, каждую в отдельной транзакции"""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.commit()
+
+    current = await get_schema_version(db)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            await db.execute("BEGIN")
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"❌ Ошибка миграции {version} ({description}): {e}")
+            raise
+        current = version
+        logger.info(f"✅ Применена миграция {version}: {description}")
+
+    return current
@@ -0,0 +1,214 @@
+import bisect
+import itertools
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+# Виды занятости
+LESSON = "lesson"
+SLOT = "slot"
+VACATION = "vacation"
+
+
+class Conflict(NamedTuple):
+    """Пересечение с существующей занятостью репетитора"""
+    kind: str
+    ref_id: Optional[int]
+    starts_at: int
+    ends_at: int
+    student_id: Optional[int] = None
+
+
+class _Track:
+    """Интервалы одинаковой длины одного репетитора, отсортированные по началу.
+
+    Поиск — бинарный, O(log n); вставка и удаление сдвигают хвост списка,
+    O(n), но это один memmove по предстоящим урокам одного репетитора.
+    """
+
+    __slots__ = ('starts', 'keys')
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.keys: List[Hashable] = []
+
+    def add(self, start: int, key: Hashable):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.keys.insert(i, key)
+
+    def remove(self, start: int, key: Hashable):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.keys[i] == key:
+                del self.starts[i]
+                del self.keys[i]
+                return
+            i += 1
+
+    def overlapping(self, start: int, end: int, duration: int) -> List[Tuple[int, Hashable]]:
+        """Интервалы [s, s + duration), пересекающие [start, end): s ∈ (start - duration, end)"""
+        i = bisect.bisect_right(self.starts, start - duration)
+        j = bisect.bisect_left(self.starts, end, lo=i)
+        return list(zip(self.starts[i:j], self.keys[i:j]))
+
+
+class ScheduleIndex:
+    """Индекс занятости репетиторов для проверки пересечений.
+
+    Уроки и свободные слоты одного репетитора хранятся отсортированными по
+    времени начала; длительность у всех одна, поэтому пересечения ищутся
+    двумя бинарными поисками — O(log n) независимо от числа уроков
+    (добавление и удаление — O(n), см. _Track).
+    Отпуска — слитые непересекающиеся интервалы. Индекс строится из базы
+    при запуске (Database.init_db) и содержит только предстоящую
+    занятость; дальше его обновляют методы записи Database.
+    """
+
+    def __init__(self, duration: int):
+        self.duration = duration
+        self._lessons: Dict[int, _Track] = {}
+        self._slots: Dict[int, _Track] = {}
+        self._vacations: Dict[int, List[Tuple[int, int]]] = {}
+        # ключ -> (репетитор, начало, студент)
+        self._lesson_info: Dict[Hashable, Tuple[int, int, Optional[int]]] = {}
+        self._slot_info: Dict[Hashable, Tuple[int, int]] = {}
+        self._reservations = itertools.count(1)
+        self.checks = 0
+        self.conflicts_found = 0
+
+    def clear(self):
+        self._lessons.clear()
+        self._slots.clear()
+        self._vacations.clear()
+        self._lesson_info.clear()
+        self._slot_info.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'tutors': len(self._lessons.keys() | self._slots.keys() | self._vacations.keys()),
+            'lessons': len(self._lesson_info),
+            'slots': len(self._slot_info),
+            'checks': self.checks,
+            'conflicts': self.conflicts_found,
+        }
+
+    # Изменение индекса (повторное добавление того же ключа ничего не меняет)
+    def add_lesson(self, lesson_id: Hashable, tutor_id: int, starts_at: int, student_id: Optional[int] = None):
+        if lesson_id in self._lesson_info or starts_at is None:
+            return
+        self._lessons.setdefault(tutor_id, _Track()).add(starts_at, lesson_id)
+        self._lesson_info[lesson_id] = (tutor_id, starts_at, student_id)
+
+    def remove_lesson(self, lesson_id: Hashable):
+        info = self._lesson_info.pop(lesson_id, None)
+        if info is not None:
+            tutor_id, starts_at, _ = info
+            self._lessons[tutor_id].remove(starts_at, lesson_id)
+
+    def reserve_lesson(self, tutor_id: int, starts_at: int, student_id: Optional[int] = None) -> Hashable:
+        """Занять время до появления id урока; ключ потом заменяется через confirm_lesson"""
+        key = ('reserved', next(self._reservations))
+        self.add_lesson(key, tutor_id, starts_at, student_id)
+        return key
+
+    def confirm_lesson(self, key: Hashable, lesson_id: int):
+        info = self._lesson_info.get(key)
+        if info is not None:
+            self.remove_lesson(key)
+            self.add_lesson(lesson_id, *info)
+
+    def add_slot(self, slot_id: Hashable, tutor_id: int, starts_at: int):
+        if slot_id in self._slot_info or starts_at is None:
+            return
+        self._slots.setdefault(tutor_id, _Track()).add(starts_at, slot_id)
+        self._slot_info[slot_id] = (tutor_id, starts_at)
+
+    def reserve_slot(self, tutor_id: int, starts_at: int) -> Hashable:
+        """Занять время слота до появления его id"""
+        key = ('reserved', next(self._reservations))
+        self.add_slot(key, tutor_id, starts_at)
+        return key
+
+    def confirm_slot(self, key: Hashable, slot_id: int):
+        info = self._slot_info.get(key)
+        if info is not None:
+            self.remove_slot(key)
+            self.add_slot(slot_id, *info)
+
+    def remove_slot(self, slot_id: Hashable):
+        info = self._slot_info.pop(slot_id, None)
+        if info is not None:
+            tutor_id, starts_at = info
+            self._slots[tutor_id].remove(starts_at, slot_id)
+
+    def add_vacation(self, tutor_id: int, start: int, end: int):
+        """Добавить отпуск; пересекающиеся и смежные отпуска сливаются"""
+        merged = []
+        for item_start, item_end in self._vacations.get(tutor_id, []):
+            if item_end < start or item_start > end:
+                merged.append((item_start, item_end))
+            else:
+                start, end = min(start, item_start), max(end, item_end)
+        merged.append((start, end))
+        merged.sort()
+        self._vacations[tutor_id] = merged
+
+    def set_vacations(self, tutor_id: int, intervals: Iterable[Tuple[int, int]]):
+        self._vacations.pop(tutor_id, None)
+        for start, end in intervals:
+            self.add_vacation(tutor_id, start, end)
+
+    def clear_tutor(self, tutor_id: int):
+        """Забыть всю занятость репетитора (перед повторной загрузкой)"""
+        for key in list(self._lessons.pop(tutor_id, _Track()).keys):
+            self._lesson_info.pop(key, None)
+        for key in list(self._slots.pop(tutor_id, _Track()).keys):
+            self._slot_info.pop(key, None)
+        self._vacations.pop(tutor_id, None)
+
+    # Проверки
+    def conflicts(self, tutor_id: int, starts_at: int, duration: Optional[int] = None,
+                  kinds: Tuple[str, ...] = (LESSON, VACATION)) -> List[Conflict]:
+        """Занятость репетитора, пересекающая [starts_at, starts_at + duration)"""
+        end = starts_at + (duration or self.duration)
+        result: List[Conflict] = []
+        if LESSON in kinds and tutor_id in self._lessons:
+            for start, key in self._lessons[tutor_id].overlapping(starts_at, end, self.duration):
+                result.append(Conflict(LESSON, key if isinstance(key, int) else None, start,
+                                       start + self.duration, self._lesson_info[key][2]))
+        if SLOT in kinds and tutor_id in self._slots:
+            for start, key in self._slots[tutor_id].overlapping(starts_at, end, self.duration):
+                result.append(Conflict(SLOT, key if isinstance(key, int) else None, start, start + self.duration))
+        vacations = self._vacations.get(tutor_id)
+        if VACATION in kinds and vacations:
+            i = bisect.bisect_right(vacations, (starts_at,))
+            # Отпуска не пересекаются: кандидаты — предыдущий и следующие до конца интервала
+            for k in range(max(i - 1, 0), len(vacations)):
+                vacation_start, vacation_end = vacations[k]
+                if vacation_start >= end:
+                    break
+                if vacation_end > starts_at:
+                    result.append(Conflict(VACATION, None, vacation_start, vacation_end))
+        self.checks += 1
+        if result:
+            self.conflicts_found += 1
+        return result
+
+    def check_many(self, items: Iterable[Tuple[int, int]], duration: Optional[int] = None,
+                   kinds: Tuple[str, ...] = (LESSON, VACATION)) -> List[List[Conflict]]:
+        """Проверить пачку (репетитор, начало): с индексом и между собой.
+
+        Элемент пачки, пересекающийся с более ранним бесконфликтным
+        элементом той же пачки, получает конфликт вида LESSON с ref_id=None.
+        """
+        duration = duration or self.duration
+        batch: Dict[int, _Track] = {}
+        result = []
+        for tutor_id, starts_at in items:
+            found = self.conflicts(tutor_id, starts_at, duration, kinds)
+            track = batch.setdefault(tutor_id, _Track())
+            for start, _ in track.overlapping(starts_at, starts_at + duration, duration):
+                found.append(Conflict(LESSON, None, start, start + duration))
+            if not found:
+                track.add(starts_at, None)
+            result.append(found)
+        return result
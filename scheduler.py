@@ -1,67 +1,255 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 from database import Database
 from notifications import notification_service
+import message_dispatcher
+from constants import LESSON_REMINDER_LEAD_MINUTES, REMINDER_GRACE_MINUTES
+from timezones import resolve_zone, timestamp_to_local, to_utc_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Виды напоминаний
+LESSON = "lesson"
+HOMEWORK = "homework"
+
 
 class ReminderScheduler:
-    """Планировщик напоминаний"""
-    
+    """Планировщик напоминаний.
+
+    Держит очередь с приоритетом по времени срабатывания. Очередь
+    заполняется из базы один раз при запуске и дальше обновляется по
+    событиям Database (add_lesson, cancel_lesson, assign_homework), а
+    планировщик спит ровно до ближайшего напоминания.
+
+    Время срабатывания хранится в UTC: уроки — по lessons.starts_at,
+    напоминания о ДЗ — по reminder_date/reminder_time в часовом поясе
+    студента. Время в тексте напоминания показывается в поясе получателя.
+    """
+
     def __init__(self, bot):
         self.bot = bot
         self.running = False
-    
+        # Куча (время срабатывания, порядковый номер, вид, id)
+        self._heap: List[Tuple[float, int, str, int]] = []
+        # Актуальное время срабатывания для (вид, id); записи кучи без соответствия устарели
+        self._due: Dict[Tuple[str, int], float] = {}
+        self._payloads: Dict[Tuple[str, int], dict] = {}
+        # Сколько записей кучи устарело (перенесённые и отменённые напоминания)
+        self._stale = 0
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._listeners = {
+            'lesson_added': self._on_lesson_added,
+            'lesson_cancelled': self._on_lesson_cancelled,
+            'homework_assigned': self._on_homework_assigned,
+            'lessons_generated': self._on_lessons_generated,
+        }
+
     async def start(self):
         """Запуск планировщика"""
         self.running = True
-        logger.info("🔔 Планировщик напоминаний запущен")
-        
+        for event, callback in self._listeners.items():
+            Database.add_listener(event, callback)
+        await self.load()
+        logger.info(f"🔔 Планировщик напоминаний запущен ({len(self._due)} напоминаний в очереди)")
+
         while self.running:
             try:
-                await self.check_lesson_reminders()
-                await self.check_homework_reminders()
-                # Проверяем каждые 5 минут
-                await asyncio.sleep(300)
+                delay = self._next_delay()
+                if delay is None or delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._fire_due()
             except Exception as e:
                 logger.error(f"❌ Ошибка в планировщике: {e}")
-                await asyncio.sleep(60)
-    
+                await asyncio.sleep(1)
+
     async def stop(self):
         """Остановка планировщика"""
         self.running = False
+        for event, callback in self._listeners.items():
+            Database.remove_listener(event, callback)
+        self._wakeup.set()
         logger.info("🔔 Планировщик напоминаний остановлен")
-    
-    async def check_lesson_reminders(self):
-        """Проверка напоминаний об уроках"""
+
+    async def load(self):
+        """Загрузить будущие напоминания из базы"""
+        for lesson in await Database.get_scheduled_lessons_since(int(time.time())):
+            self._schedule_lesson(*lesson)
+        # Берём и вчерашние даты: в восточных поясах «сегодня» наступает раньше
+        since = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+        for homework in await Database.get_pending_homework_reminders(since):
+            self._schedule_homework(*homework)
+
+    # Работа с очередью
+    def _push(self, kind: str, item_id: int, due: float, payload: dict):
+        """Добавить или перенести напоминание"""
+        if due < time.time() - REMINDER_GRACE_MINUTES * 60:
+            return
+        key = (kind, item_id)
+        previous = self._due.get(key)
+        self._due[key] = due
+        self._payloads[key] = payload
+        if previous == due:
+            return
+        if previous is not None:
+            self._stale += 1
+            self._compact()
+        heapq.heappush(self._heap, (due, next(self._counter), kind, item_id))
+        # Будим цикл, если новое напоминание раньше текущего ожидания
+        if self._heap[0][2:] == key:
+            self._wakeup.set()
+
+    def _discard(self, kind: str, item_id: int):
+        """Убрать напоминание (запись в куче будет пропущена)"""
+        key = (kind, item_id)
+        if self._due.pop(key, None) is not None:
+            self._stale += 1
+            self._compact()
+        self._payloads.pop(key, None)
+
+    def _compact(self):
+        """Пересобрать кучу без устаревших записей, когда их больше половины.
+
+        Иначе при частых переносах и отменах куча растёт без предела:
+        устаревшая запись уходит, только дойдя до вершины.
+        """
+        if self._stale <= 64 or self._stale * 2 <= len(self._heap):
+            return
+        live, seen = [], set()
+        for entry in self._heap:
+            key = entry[2:]
+            if self._due.get(key) == entry[0] and key not in seen:
+                seen.add(key)
+                live.append(entry)
+        heapq.heapify(live)
+        self._heap = live
+        self._stale = 0
+
+    def _next_delay(self) -> Optional[float]:
+        """Секунд до ближайшего напоминания или None, если очередь пуста"""
+        while self._heap:
+            due, _, kind, item_id = self._heap[0]
+            if self._due.get((kind, item_id)) != due:
+                heapq.heappop(self._heap)
+                self._stale -= 1
+                continue
+            return due - time.time()
+        return None
+
+    async def _fire_due(self):
+        """Отправить все наступившие напоминания"""
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            due, _, kind, item_id = heapq.heappop(self._heap)
+            key = (kind, item_id)
+            if self._due.get(key) != due:
+                self._stale -= 1
+                continue
+            payload = self._payloads.pop(key, None)
+            del self._due[key]
+            if kind == LESSON:
+                await self.send_lesson_reminder(item_id, payload)
+            else:
+                await self.send_homework_reminder(item_id, payload)
+
+    # Обработчики событий базы данных
+    def _schedule_lesson(self, lesson_id, student_id, tutor_id, starts_at, subject):
+        now = time.time()
+        if starts_at is None or starts_at <= now:
+            return
+        # Урок ещё не начался — напоминаем сразу, даже если время напоминания прошло
+        # (после перезапуска или для урока, добавленного меньше чем за час)
+        due = max(starts_at - LESSON_REMINDER_LEAD_MINUTES * 60, now)
+        self._push(LESSON, lesson_id, due, {
+            'student_id': student_id,
+            'tutor_id': tutor_id,
+            'starts_at': starts_at,
+            'subject': subject,
+        })
+
+    def _schedule_homework(self, homework_id, student_id, tutor_id, description, reminder_date, reminder_time,
+                           tz_name):
+        due = to_utc_timestamp(reminder_date, reminder_time, resolve_zone(tz_name))
+        if due is None:
+            return
+        self._push(HOMEWORK, homework_id, due, {
+            'student_id': student_id,
+            'tutor_id': tutor_id,
+            'description': description,
+        })
+
+    def _on_lesson_added(self, lesson_id, student_id, tutor_id, starts_at, subject):
+        self._schedule_lesson(lesson_id, student_id, tutor_id, starts_at, subject)
+
+    def _on_lesson_cancelled(self, lesson_id, tutor_id=None):
+        self._discard(LESSON, lesson_id)
+
+    def _on_homework_assigned(self, homework_id, student_id, tutor_id, description, reminder_date, reminder_time):
+        # Пояс студента берётся из кэша профилей — отдельной задачей, обработчик события синхронный
+        asyncio.ensure_future(self._schedule_homework_for_student(
+            homework_id, student_id, tutor_id, description, reminder_date, reminder_time
+        ))
+
+    async def _schedule_homework_for_student(self, homework_id, student_id, tutor_id, description,
+                                             reminder_date, reminder_time):
+        user = await Database.get_user(student_id)
+        self._schedule_homework(homework_id, student_id, tutor_id, description, reminder_date, reminder_time,
+                                user[5] if user else None)
+
+    def _on_lessons_generated(self, tutor_id=None, student_id=None):
+        # Пакетная генерация не возвращает id уроков — догружаем их одним запросом
+        asyncio.ensure_future(self._reload_lessons(tutor_id, student_id))
+
+    async def _reload_lessons(self, tutor_id, student_id):
+        lessons = await Database.get_scheduled_lessons_since(int(time.time()), tutor_id=tutor_id,
+                                                             student_id=student_id)
+        for lesson in lessons:
+            if (LESSON, lesson[0]) not in self._due:
+                self._schedule_lesson(*lesson)
+
+    # Отправка напоминаний
+    async def _send(self, chat_id: int, text: str):
+        """Отправить через диспетчер сообщений, если он запущен"""
+        if message_dispatcher.message_dispatcher is not None:
+            await message_dispatcher.message_dispatcher.send_message(chat_id, text)
+        else:
+            await self.bot.send_message(chat_id, text)
+
+    async def send_lesson_reminder(self, lesson_id: int, payload: dict):
+        """Напоминание об уроке студенту и репетитору"""
         try:
-            # Получаем уроки на ближайший час
-            now = datetime.now()
-            reminder_time = now + timedelta(hours=1)
-            
-            # Здесь должна быть логика получения уроков на определенное время
-            # Пока что заглушка
-            logger.debug("🔍 Проверка напоминаний об уроках")
-            
+            # Урок мог быть отменён в обход cancel_lesson
+            lesson = await Database.get_lesson_by_id(lesson_id)
+            if not lesson or lesson[6] != 'scheduled':
+                return
+            subject = payload.get('subject') or "урок"
+            for chat_id in (payload['student_id'], payload['tutor_id']):
+                local = timestamp_to_local(payload['starts_at'], await Database.get_user_zone(chat_id))
+                text = f"🔔 Напоминание: {subject} — {local.strftime('%Y-%m-%d')} в {local.strftime('%H:%M')}"
+                await self._send(chat_id, text)
         except Exception as e:
-            logger.error(f"❌ Ошибка проверки напоминаний об уроках: {e}")
-    
-    async def check_homework_reminders(self):
-        """Проверка напоминаний о домашних заданиях"""
+            logger.error(f"❌ Ошибка отправки напоминания об уроке {lesson_id}: {e}")
+
+    async def send_homework_reminder(self, homework_id: int, payload: dict):
+        """Напоминание о домашнем задании студенту"""
         try:
-            # Получаем ДЗ с напоминаниями на сегодня
-            now = datetime.now()
-            today = now.strftime('%Y-%m-%d')
-            current_time = now.strftime('%H:%M')
-            
-            # Здесь должна быть логика получения ДЗ с напоминаниями
-            # Пока что заглушка
-            logger.debug("🔍 Проверка напоминаний о ДЗ")
-            
+            homework = await Database.get_homework_by_id(homework_id)
+            if not homework or homework[9]:
+                return
+            text = f"📚 Напоминание о домашнем задании: {payload.get('description') or 'без описания'}"
+            await self._send(payload['student_id'], text)
         except Exception as e:
-            logger.error(f"❌ Ошибка проверки напоминаний о ДЗ: {e}")
+            logger.error(f"❌ Ошибка отправки напоминания о ДЗ {homework_id}: {e}")
 
 
 # Глобальный экземпляр планировщика
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from constants import (BOT_TOKEN, BOT_MODE, BOT_WORKERS, WORKER_STATS_INTERVAL, SEND_GLOBAL_RATE,
+                       WEBHOOK_MAX_IN_FLIGHT)
+from database import Database
+from db_metrics import query_metrics
+from webhook import UpdateProcessor, WebhookServer, update_user_id
+
+logger = logging.getLogger(__name__)
+
+# События изменения данных, повторяемые в остальных воркерах: их слушают
+# планировщик напоминаний (только в воркере 0) и кэш свободных окон
+REPLICATED_EVENTS = ('lesson_added', 'lesson_cancelled', 'homework_assigned', 'lessons_generated', 'slot_added',
+                     'vacation_added')
+# Изменения профилей — сбрасываются в кэшах всех воркеров
+CACHE_EVENTS = ('user_changed', 'tutor_changed')
+POLL_TIMEOUT = 30
+
+
+def _get(source, timeout: float = 1.0):
+    """Блокирующее чтение очереди процесса с таймаутом (для run_in_executor)"""
+    try:
+        return source.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+def worker_for(user_id: Optional[int], workers: int) -> int:
+    """Номер воркера для пользователя: все его апдейты (и состояние FSM) в одном процессе"""
+    return user_id % workers if user_id is not None else 0
+
+
+class _Worker:
+    """Процесс-обработчик: свой Dispatcher, пул соединений и хранилище FSM"""
+
+    def __init__(self, index: int, workers: int, inbound, outbound):
+        self.index = index
+        self.workers = workers
+        self.inbound = inbound
+        self.outbound = outbound
+        self._replaying = False
+
+    def _forward(self, event: str):
+        def listener(**payload):
+            # Событие, пришедшее из другого воркера, обратно не пересылается
+            if not self._replaying:
+                self.outbound.put(('event', self.index, event, payload))
+        return listener
+
+    def _apply_event(self, event: str, payload: dict):
+        """Применить событие другого воркера"""
+        self._replaying = True
+        try:
+            if event == 'user_changed':
+                Database.invalidate_profile_cache(user_id=payload['user_id'])
+            elif event == 'tutor_changed':
+                Database.invalidate_profile_cache(tutor_id=payload['tutor_id'])
+            Database.replay_event(event, **payload)
+        finally:
+            self._replaying = False
+
+    async def run(self):
+        # Роутеры и сервисы бота импортируются уже в процессе воркера
+        from app import create_bot, create_dispatcher
+        from archive import archive_job
+        from availability import availability_engine
+        from fsm_storage import SQLiteStorage
+        from message_dispatcher import init_message_dispatcher
+        from notifications import init_notification_service
+        from scheduler import init_scheduler
+
+        bot = create_bot()
+        await Database.init_db()
+        storage = SQLiteStorage()
+        dp = create_dispatcher(storage)
+        init_notification_service(bot)
+        # Лимит Bot API общий на бота — делим его между воркерами
+        dispatcher = init_message_dispatcher(bot, global_rate=SEND_GLOBAL_RATE / self.workers)
+        dispatcher.start()
+
+        scheduler = scheduler_task = None
+        if self.index == 0:
+            scheduler = init_scheduler(bot)
+            scheduler_task = asyncio.create_task(scheduler.start())
+            # Перенос в архив — одна задача на все процессы
+            archive_job.start()
+        availability_engine.start()
+        forwarders = {event: self._forward(event) for event in REPLICATED_EVENTS + CACHE_EVENTS}
+        for event, listener in forwarders.items():
+            Database.add_listener(event, listener)
+
+        processor = UpdateProcessor(bot, dp, WEBHOOK_MAX_IN_FLIGHT)
+        reporter = asyncio.create_task(self._report(processor, dispatcher))
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        logger.info(f"👷 Воркер {self.index} запущен")
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await loop.run_in_executor(None, _get, self.inbound)
+                if message is None:
+                    continue
+                kind = message[0]
+                if kind == 'stop':
+                    break
+                if kind == 'update':
+                    await processor.submit(Update.model_validate(message[1], context={'bot': bot}))
+                elif kind == 'event':
+                    self._apply_event(message[1], message[2])
+        finally:
+            await processor.drain()
+            reporter.cancel()
+            for event, listener in forwarders.items():
+                Database.remove_listener(event, listener)
+            availability_engine.stop()
+            if scheduler is not None:
+                await scheduler.stop()
+                scheduler_task.cancel()
+                await archive_job.stop()
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+            await dispatcher.stop()
+            await storage.close()
+            await Database.close()
+            await bot.session.close()
+            logger.info(f"👷 Воркер {self.index} остановлен: обработано {processor.processed}")
+
+    async def _report(self, processor: UpdateProcessor, dispatcher):
+        last_processed, last_time = 0, time.monotonic()
+        while True:
+            await asyncio.sleep(WORKER_STATS_INTERVAL)
+            now = time.monotonic()
+            metrics = query_metrics.summary(top=0)
+            self.outbound.put(('stats', self.index, {
+                'processed': processor.processed,
+                'failed': processor.failed,
+                'in_flight': processor.in_flight,
+                'rate': round((processor.processed - last_processed) / (now - last_time), 2),
+                'db_calls': metrics['calls'],
+                'db_slow': metrics['slow_queries'],
+                'send_queue': dispatcher.queue_depth,
+                'heartbeat': time.time(),
+            }))
+            last_processed, last_time = processor.processed, now
+
+
+def _worker_main(index: int, workers: int, inbound, outbound):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+        force=True,
+    )
+    try:
+        asyncio.run(_Worker(index, workers, inbound, outbound).run())
+    except KeyboardInterrupt:
+        pass
+
+
+class _RoutingWebhook(WebhookServer):
+    """Вебхук супервизора: апдейты не обрабатываются, а передаются воркерам"""
+
+    def __init__(self, supervisor: 'Supervisor', bot: Bot, dp: Dispatcher):
+        super().__init__(bot, dp)
+        self.supervisor = supervisor
+
+    async def dispatch(self, update: Update):
+        self.supervisor.route(update)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'webhook': self.get_stats(), 'workers': self.supervisor.get_stats()})
+
+
+class Supervisor:
+    """Многопроцессный режим: один процесс получает апдейты, N воркеров их обрабатывают.
+
+    Апдейт уходит воркеру по id пользователя, поэтому апдейты одного
+    пользователя обрабатываются по порядку в одном процессе вместе с его
+    состоянием FSM. База SQLite общая (WAL, у каждого процесса свой пул).
+    События изменения данных (уроки, ДЗ, слоты, отпуска, профили) пересылаются
+    остальным воркерам: напоминания отправляет только воркер 0, а кэши
+    профилей и свободных окон есть в каждом. Упавший воркер перезапускается, его очередь
+    апдейтов сохраняется.
+    """
+
+    def __init__(self, workers: int = BOT_WORKERS):
+        self.workers = max(1, workers)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._outbound = self._ctx.Queue()
+        self._inbound = [self._ctx.Queue() for _ in range(self.workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._stats: List[Dict[str, Any]] = [{} for _ in range(self.workers)]
+        self._routed = [0] * self.workers
+        self._restarts = [0] * self.workers
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(target=_worker_main, name=f"worker-{index}",
+                                    args=(index, self.workers, self._inbound[index], self._outbound))
+        process.start()
+        self._processes[index] = process
+
+    def route(self, update: Update):
+        """Передать апдейт воркеру его пользователя"""
+        index = worker_for(update_user_id(update), self.workers)
+        self._inbound[index].put(('update', update.model_dump(mode='json', exclude_none=True, by_alias=True)))
+        self._routed[index] += 1
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Состояние воркеров: процесс, пульс, пропускная способность, очередь"""
+        now = time.time()
+        result = []
+        for index, process in enumerate(self._processes):
+            stats = self._stats[index]
+            heartbeat = stats.get('heartbeat')
+            alive = process is not None and process.is_alive()
+            result.append({
+                'worker': index,
+                'pid': process.pid if process else None,
+                'alive': alive,
+                'healthy': alive and heartbeat is not None and now - heartbeat < 3 * WORKER_STATS_INTERVAL,
+                'routed': self._routed[index],
+                'backlog': max(0, self._routed[index] - stats.get('processed', 0) - stats.get('failed', 0)),
+                'restarts': self._restarts[index],
+                **{key: value for key, value in stats.items() if key != 'heartbeat'},
+            })
+        return result
+
+    def _handle(self, message: tuple):
+        kind = message[0]
+        if kind == 'stats':
+            _, index, stats = message
+            self._stats[index] = stats
+        elif kind == 'event':
+            _, sender, event, payload = message
+            for index in range(self.workers):
+                if index != sender:
+                    self._inbound[index].put(('event', event, payload))
+
+    async def _read_outbound(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, _get, self._outbound)
+            if message is not None:
+                self._handle(message)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(WORKER_STATS_INTERVAL)
+            stats = self.get_stats()
+            for item in stats:
+                if not item['alive'] and not self._stopping:
+                    logger.error(f"❌ Воркер {item['worker']} завершился, перезапуск")
+                    self._restarts[item['worker']] += 1
+                    self._stats[item['worker']] = {}
+                    self._spawn(item['worker'])
+                elif item['alive'] and not item['healthy'] and item.get('processed') is not None:
+                    logger.warning(f"⚠️ Воркер {item['worker']} не присылает отчёты")
+            logger.info("👷 " + " | ".join(
+                f"#{item['worker']} {item.get('rate', 0)} апд/с, обработано {item.get('processed', 0)}, "
+                f"очередь {item['backlog']}" for item in stats
+            ))
+
+    async def _poll(self, bot: Bot, dp: Dispatcher):
+        """Long polling в супервизоре: апдейты только распределяются"""
+        allowed_updates = dp.resolve_used_update_types()
+        offset, backoff = None, 1
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT,
+                                                allowed_updates=allowed_updates)
+                backoff = 1
+            except Exception as e:
+                logger.error(f"❌ Ошибка получения апдейтов: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            for update in updates:
+                self.route(update)
+                offset = update.update_id + 1
+
+    async def run(self):
+        # Миграции применяются один раз до запуска воркеров
+        await Database.init_db()
+        await Database.close()
+        from app import create_dispatcher
+        bot = Bot(token=BOT_TOKEN)
+        # Диспетчер нужен только для списка используемых типов апдейтов
+        dp = create_dispatcher(None)
+
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"👑 Супервизор: {self.workers} воркеров, режим {BOT_MODE}")
+        tasks = [asyncio.create_task(self._read_outbound()), asyncio.create_task(self._monitor())]
+        try:
+            if BOT_MODE == "webhook":
+                await _RoutingWebhook(self, bot, dp).serve_forever()
+            else:
+                await self._poll(bot, dp)
+        finally:
+            self._stopping = True
+            for task in tasks:
+                task.cancel()
+            await self.stop()
+            await bot.session.close()
+
+    async def stop(self, timeout: float = 30):
+        """Остановить воркеры, дав им дообработать принятые апдейты"""
+        for queue in self._inbound:
+            queue.put(('stop',))
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"⚠️ Воркер {process.name} не остановился, завершаем принудительно")
+                process.terminate()
+        logger.info("👑 Супервизор остановлен")
+
+
+async def run_supervisor(workers: int = BOT_WORKERS):
+    await Supervisor(workers).run()
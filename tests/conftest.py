@@ -0,0 +1,35 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def run_db(tmp_path, monkeypatch):
+    """Выполнить корутину на чистой временной базе: run_db(lambda: coro())"""
+    monkeypatch.setattr(Database, '_db_path', str(tmp_path / 'bot_database.db'))
+    monkeypatch.setattr(Database, '_archive_path', str(tmp_path / 'bot_archive.db'))
+    monkeypatch.setattr(Database, '_pool', None)
+    monkeypatch.setattr(Database, '_lock', asyncio.Lock())
+    Database._schedule.clear()
+    Database._user_cache.clear()
+    Database._tutor_cache.clear()
+
+    def run(factory):
+        async def scenario():
+            await Database.init_db()
+            try:
+                return await factory()
+            finally:
+                await Database.close()
+        return asyncio.run(scenario())
+
+    yield run
+    Database._schedule.clear()
+    Database._user_cache.clear()
+    Database._tutor_cache.clear()
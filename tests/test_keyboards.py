@@ -0,0 +1,40 @@
+import asyncio
+
+import keyboards
+from constants import ROLES
+from database import Database
+
+
+def test_cached_keyboards_are_not_shared():
+    first = keyboards.get_main_menu_keyboard(ROLES["ADMIN"])
+    rows = len(first.keyboard)
+    first.keyboard.append([])
+    first.keyboard[0][0].text = "изменено"
+    second = keyboards.get_main_menu_keyboard(ROLES["ADMIN"])
+    assert len(second.keyboard) == rows
+    assert second.keyboard[0][0].text != "изменено"
+
+    inline = keyboards.get_admin_homework_content_keyboard()
+    inline.inline_keyboard.clear()
+    assert keyboards.get_admin_homework_content_keyboard().inline_keyboard
+
+
+def test_empty_tutor_list_is_not_cached(monkeypatch):
+    results = [[], [(1, "Анна", "anna", "Математика", 1000, None)]]
+
+    async def get_all_tutors():
+        return results.pop(0)
+
+    monkeypatch.setattr(Database, 'get_all_tutors', get_all_tutors)
+    monkeypatch.setattr(keyboards, '_tutors_keyboard', None)
+
+    async def scenario():
+        failed = await keyboards.get_tutors_keyboard()
+        loaded = await keyboards.get_tutors_keyboard()
+        loaded.inline_keyboard.clear()
+        cached = await keyboards.get_tutors_keyboard()
+        return failed, cached
+
+    failed, cached = asyncio.run(scenario())
+    assert failed.inline_keyboard[0][0].callback_data == "no_tutors"
+    assert cached.inline_keyboard[0][0].callback_data == "select_tutor_1"
@@ -0,0 +1,121 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from database import Database
+from timezones import to_utc_timestamp
+
+TUTOR, STUDENT, OTHER_STUDENT = 1, 2, 3
+
+
+async def _users():
+    await Database.add_user(TUTOR, "tutor", "Репетитор", role="admin", timezone="Europe/Berlin")
+    await Database.add_user(STUDENT, "student", "Студент", tutor_id=TUTOR)
+    await Database.add_user(OTHER_STUDENT, "other", "Другой студент", tutor_id=TUTOR)
+
+
+async def _tutor_lessons():
+    async with Database._acquire() as db:
+        cursor = await db.execute("SELECT student_id, lesson_time FROM lessons WHERE tutor_id = ? ORDER BY id",
+                                  (TUTOR,))
+        return await cursor.fetchall()
+
+
+def test_overlap_rejected_by_database_when_index_is_stale(run_db):
+    day = (date.today() + timedelta(days=3)).isoformat()
+
+    async def scenario():
+        await _users()
+        assert await Database.add_lesson(STUDENT, TUTOR, day, "18:00", "Математика")
+        # Другой воркер: его индекс занятости не знает об уроке 18:00
+        Database._schedule.clear()
+        assert not await Database.add_lesson(OTHER_STUDENT, TUTOR, day, "18:30", "Физика")
+        assert await Database.add_lesson(OTHER_STUDENT, TUTOR, day, "20:00", "Физика")
+        return await _tutor_lessons()
+
+    assert run_db(scenario) == [(STUDENT, "18:00"), (OTHER_STUDENT, "20:00")]
+
+
+def test_cancelled_lesson_does_not_block_database_check(run_db):
+    day = (date.today() + timedelta(days=3)).isoformat()
+
+    async def scenario():
+        await _users()
+        assert await Database.add_lesson(STUDENT, TUTOR, day, "18:00", "Математика")
+        async with Database._acquire() as db:
+            await db.execute("UPDATE lessons SET status = 'cancelled'")
+            await db.commit()
+        Database._schedule.clear()
+        assert await Database.add_lesson(OTHER_STUDENT, TUTOR, day, "18:00", "Физика")
+        return await _tutor_lessons()
+
+    assert run_db(scenario) == [(STUDENT, "18:00"), (OTHER_STUDENT, "18:00")]
+
+
+def _next_weekday(day_of_week):
+    today = datetime.now()
+    days_ahead = day_of_week - today.weekday()
+    if days_ahead <= 0:
+        days_ahead += 7
+    return (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+
+
+async def _insert_elsewhere(sql, params):
+    """Запись мимо индекса занятости — как из другого воркера"""
+    async with Database._acquire() as db:
+        await db.execute(sql, params)
+        await db.commit()
+
+
+def test_bulk_generation_skips_lessons_of_other_workers(run_db):
+    day = _next_weekday(2)
+
+    async def scenario():
+        await _users()
+        starts_at = to_utc_timestamp(day, "18:00", ZoneInfo("Europe/Berlin"))
+        await _insert_elsewhere(
+            "INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, starts_at) VALUES (?, ?, ?, ?, ?)",
+            (STUDENT, TUTOR, day, "18:00", starts_at)
+        )
+        assert await Database.add_standard_schedule(TUTOR, OTHER_STUDENT, 2, "18:30", "Физика")
+        assert await Database.add_standard_schedule(TUTOR, OTHER_STUDENT, 4, "18:00", "Физика")
+        first = await Database.generate_lessons_bulk(tutor_id=TUTOR, student_id=OTHER_STUDENT, weeks=1)
+        again = await Database.generate_lessons_bulk(tutor_id=TUTOR, student_id=OTHER_STUDENT, weeks=1)
+        # Созданный урок попал в индекс под своим id
+        blocked = await Database.add_lesson(STUDENT, TUTOR, _next_weekday(4), "18:15", "Математика")
+        return first, again, blocked, await _tutor_lessons()
+
+    first, again, blocked, lessons = run_db(scenario)
+    assert (first['rows_written'], first['conflicts']) == (1, 1)
+    # Повторная генерация не дублирует свой урок и снова не ставит чужое время
+    assert (again['rows_written'], again['conflicts']) == (0, 1)
+    assert not blocked
+    assert lessons == [(STUDENT, "18:00"), (OTHER_STUDENT, "18:00")]
+
+
+def test_slot_rejected_by_database_when_index_is_stale(run_db):
+    day = (date.today() + timedelta(days=3)).isoformat()
+    vacation_day = (date.today() + timedelta(days=5)).isoformat()
+
+    async def scenario():
+        await _users()
+        starts_at = to_utc_timestamp(day, "18:00", ZoneInfo("Europe/Berlin"))
+        await _insert_elsewhere(
+            "INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, starts_at) VALUES (?, ?, ?, ?, ?)",
+            (STUDENT, TUTOR, day, "18:00", starts_at)
+        )
+        await _insert_elsewhere(
+            "INSERT INTO available_slots (tutor_id, slot_date, slot_time) VALUES (?, ?, ?)",
+            (TUTOR, day, "12:00")
+        )
+        await _insert_elsewhere(
+            "INSERT INTO vacation_periods (tutor_id, start_date, end_date) VALUES (?, ?, ?)",
+            (TUTOR, vacation_day, vacation_day)
+        )
+        return [
+            await Database.add_available_slot(TUTOR, day, "18:30"),
+            await Database.add_available_slot(TUTOR, day, "12:30"),
+            await Database.add_available_slot(TUTOR, vacation_day, "10:00"),
+            await Database.add_available_slot(TUTOR, day, "14:00"),
+        ]
+
+    assert run_db(scenario) == [False, False, False, True]
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+
+from message_dispatcher import MessageDispatcher
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+def test_burst_to_one_chat_does_not_block_others():
+    async def scenario():
+        bot = FakeBot()
+        dispatcher = MessageDispatcher(bot, workers=2, global_rate=1000, per_chat_rate=5, per_chat_burst=1)
+        dispatcher.start()
+        started = time.monotonic()
+        for i in range(6):
+            await dispatcher.send_message(1, f"a{i}")
+        await asyncio.sleep(0.05)
+        assert await dispatcher.call('send_message', 2, text="b") == "b"
+        other_elapsed = time.monotonic() - started
+        await dispatcher.stop()
+        return bot.sent, other_elapsed
+
+    sent, other_elapsed = asyncio.run(scenario())
+    assert other_elapsed < 0.5
+    # Сообщения одного чата уходят по порядку и с его лимитом
+    burst = [item for item in sent if item[0] == 1]
+    assert [text for _, text, _ in burst] == [f"a{i}" for i in range(6)]
+    assert burst[-1][2] - burst[0][2] >= 0.9
+
+
+def test_stop_without_drain_fails_pending_calls():
+    async def scenario():
+        dispatcher = MessageDispatcher(FakeBot(), workers=1, global_rate=1000, per_chat_rate=1, per_chat_burst=1)
+        dispatcher.start()
+        await dispatcher.send_message(1, "first")
+        pending = asyncio.ensure_future(dispatcher.call('send_message', 1, text="second"))
+        await asyncio.sleep(0.05)
+        await dispatcher.stop(drain=False)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(pending, 1)
+        return dispatcher.queue_depth
+
+    assert asyncio.run(scenario()) == 0
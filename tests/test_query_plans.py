@@ -0,0 +1,100 @@
+import re
+import time
+
+import aiosqlite
+
+from database import Database
+
+HOT_TABLES = {'lessons', 'messages', 'homework', 'available_slots', 'student_requests', 'users', 'tutors'}
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+((?:archive\.)?(\w+))(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIAS = {'where', 'left', 'join', 'inner', 'on', 'order', 'group', 'union', 'limit'}
+
+
+async def _main_reads():
+    now = int(time.time())
+    await Database.get_lessons_between(now, now + 86400, tutor_id=1)
+    await Database.get_lessons_between(now, now + 86400, student_id=2, include_history=True)
+    await Database.get_student_upcoming_lessons(2)
+    await Database.get_tutor_upcoming_lessons(1)
+    await Database.get_lesson_by_id(1)
+    await Database.get_scheduled_lessons_since(now)
+    await Database.get_scheduled_lessons_since(now, tutor_id=1)
+    await Database.get_pending_homework_reminders('2026-01-01')
+    await Database.get_homework_for_student(2)
+    await Database.get_homework_by_id(1)
+    await Database.get_homework_for_tutor(1)
+    await Database.get_messages_page(2)
+    await Database.get_messages_page(2, cursor=('2026-01-01 00:00:00', 5), direction='newer')
+    await Database.get_conversation_page(1, 2, include_history=True)
+    await Database.get_recent_messages_for_user(2)
+    await Database.get_available_slots(1)
+    await Database.get_tutor_calendar(1, now, now + 7 * 86400, '2026-01-01', '2026-01-07')
+    async for _ in Database.iter_tutor_lessons(1, statuses=('completed',)):
+        pass
+    await Database.get_user(2)
+    await Database.get_tutor(1)
+    await Database.get_tutor_students(1)
+    await Database.get_tutor_students(1, include_archived=True)
+    await Database.get_student_tutor(2)
+    await Database.get_tutor_students_and_groups(1)
+    await Database.get_group_members(1)
+    await Database.get_student_requests_for_tutor(1)
+    await Database.get_student_request_by_id(1)
+    await Database.get_request_by_id(1)
+    async for _ in Database.iter_tutor_homework(1):
+        pass
+
+
+def _hot_names(sql):
+    """Имена и псевдонимы горячих таблиц в запросе, как их показывает EXPLAIN QUERY PLAN"""
+    names = set()
+    for qualified, table, alias in _TABLE_RE.findall(sql):
+        if table in HOT_TABLES:
+            names.add(qualified)
+            if alias and alias.lower() not in _NOT_ALIAS:
+                names.add(alias)
+    return names
+
+
+def _query_plans(run_db, monkeypatch, calls):
+    """Планы SELECT-запросов к горячим таблицам, выполненных calls(): (sql, имена таблиц, строки плана)"""
+    queries = []
+    execute = aiosqlite.Connection.execute
+
+    def recording_execute(self, sql, parameters=None):
+        if sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, tuple(parameters or ())))
+        return execute(self, sql, parameters)
+
+    async def scenario():
+        monkeypatch.setattr(aiosqlite.Connection, 'execute', recording_execute)
+        await calls()
+        monkeypatch.setattr(aiosqlite.Connection, 'execute', execute)
+        plans = []
+        async with Database._acquire() as db:
+            for sql, params in queries:
+                names = _hot_names(sql)
+                if not names:
+                    continue
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plans.append((' '.join(sql.split()), names, [row[3] for row in await cursor.fetchall()]))
+        return plans
+
+    return run_db(scenario)
+
+
+def test_main_reads_do_not_scan_hot_tables(run_db, monkeypatch):
+    plans = _query_plans(run_db, monkeypatch, _main_reads)
+    assert plans
+    scans = [(sql, detail) for sql, names, details in plans for detail in details
+             if detail.startswith('SCAN ') and detail.split()[1] in names]
+    assert not scans, scans
+
+
+def test_vacation_selects_lessons_by_tutor_range(run_db, monkeypatch):
+    async def calls():
+        await Database.apply_vacation_period(1, '2026-01-01', '2026-01-07', shift=True)
+
+    plans = _query_plans(run_db, monkeypatch, calls)
+    details = [detail for sql, _, plan in plans if sql.startswith('SELECT id, student_id') for detail in plan]
+    assert details and all('idx_lessons_tutor_starts' in detail for detail in details), details
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+
+scheduler = pytest.importorskip("scheduler")
+
+
+def test_lesson_inside_lead_time_is_reminded_immediately():
+    reminders = scheduler.ReminderScheduler(bot=None)
+    now = time.time()
+    reminders._schedule_lesson(1, 2, 3, int(now + 30 * 60), "Математика")
+    reminders._schedule_lesson(2, 2, 3, int(now - 60), "Математика")
+    assert now <= reminders._due[(scheduler.LESSON, 1)] <= time.time()
+    assert (scheduler.LESSON, 2) not in reminders._due
+
+
+def test_rescheduling_keeps_heap_bounded():
+    reminders = scheduler.ReminderScheduler(bot=None)
+    start = int(time.time()) + 7 * 86400
+    for step in range(5000):
+        reminders._schedule_lesson(step % 10, 2, 3, start + step, "Математика")
+    for lesson_id in range(5):
+        reminders._discard(scheduler.LESSON, lesson_id)
+    assert len(reminders._due) == 5
+    assert len(reminders._heap) <= 2 * 64 + 10
+
+
+def test_due_reminders_fire_once_after_reschedule():
+    reminders = scheduler.ReminderScheduler(bot=None)
+    fired = []
+
+    async def send_lesson_reminder(lesson_id, payload):
+        fired.append(lesson_id)
+
+    reminders.send_lesson_reminder = send_lesson_reminder
+    now = time.time()
+    reminders._push(scheduler.LESSON, 1, now - 1, {})
+    reminders._push(scheduler.LESSON, 1, now + 3600, {})
+    reminders._push(scheduler.LESSON, 1, now - 1, {})
+    reminders._push(scheduler.LESSON, 2, now - 2, {})
+    asyncio.run(reminders._fire_due())
+    assert fired == [2, 1]
+    assert reminders._next_delay() is None
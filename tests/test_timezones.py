@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from constants import LESSON_REMINDER_LEAD_MINUTES
+from database import Database
+from timezones import local_to_timestamp, resolve_zone, timestamp_to_local, to_utc_timestamp
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+
+def _utc(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.mark.parametrize("local, expected", [
+    # Весенний переход 29.03.2026: 02:00 CET -> 03:00 CEST
+    (datetime(2026, 3, 29, 1, 59), _utc(2026, 3, 29, 0, 59)),
+    # Пропущенный час — со смещением до перехода
+    (datetime(2026, 3, 29, 2, 30), _utc(2026, 3, 29, 1, 30)),
+    (datetime(2026, 3, 29, 3, 0), _utc(2026, 3, 29, 1, 0)),
+    # Осенний переход 25.10.2026: 03:00 CEST -> 02:00 CET
+    (datetime(2026, 10, 25, 1, 30), _utc(2026, 10, 24, 23, 30)),
+    # Неоднозначное время — первое из двух (ещё летнее)
+    (datetime(2026, 10, 25, 2, 30), _utc(2026, 10, 25, 0, 30)),
+    (datetime(2026, 10, 25, 3, 0), _utc(2026, 10, 25, 2, 0)),
+])
+def test_local_to_timestamp_across_berlin_transitions(local, expected):
+    assert local_to_timestamp(local, BERLIN) == expected
+
+
+@pytest.mark.parametrize("ts, expected", [
+    (_utc(2026, 3, 29, 0, 59), datetime(2026, 3, 29, 1, 59)),
+    (_utc(2026, 3, 29, 1, 0), datetime(2026, 3, 29, 3, 0)),
+    # Оба прохода 02:30 в ночь осеннего перехода
+    (_utc(2026, 10, 25, 0, 30), datetime(2026, 10, 25, 2, 30)),
+    (_utc(2026, 10, 25, 1, 30), datetime(2026, 10, 25, 2, 30)),
+    (_utc(2026, 10, 25, 2, 0), datetime(2026, 10, 25, 3, 0)),
+])
+def test_timestamp_to_local_across_berlin_transitions(ts, expected):
+    assert timestamp_to_local(ts, BERLIN) == expected
+
+
+def test_round_trip_outside_transition_hour():
+    for hour in (0, 1, 3, 4, 12, 23):
+        for day in ("2026-03-29", "2026-10-25"):
+            local = datetime.strptime(f"{day} {hour:02d}:15", '%Y-%m-%d %H:%M')
+            assert timestamp_to_local(local_to_timestamp(local, BERLIN), BERLIN) == local
+
+
+def test_half_hour_transition_within_hour():
+    # Australia/Lord_Howe 04.10.2026: 02:00 +10:30 -> 02:30 +11:00, смещение меняется внутри часа
+    zone = ZoneInfo("Australia/Lord_Howe")
+    before = datetime(2026, 10, 4, 2, 15)
+    after = datetime(2026, 10, 4, 2, 45)
+    assert local_to_timestamp(before, zone) == int(before.replace(tzinfo=zone).timestamp())
+    assert local_to_timestamp(after, zone) == int(after.replace(tzinfo=zone).timestamp())
+    assert timestamp_to_local(local_to_timestamp(after, zone), zone) == after
+
+
+def test_lesson_starts_at_in_tutor_zone_across_transitions(run_db):
+    tutor, student = 1, 2
+
+    async def scenario():
+        await Database.add_user(tutor, "tutor", "Репетитор", role="admin", timezone="Europe/Berlin")
+        await Database.add_user(student, "student", "Студент", tutor_id=tutor)
+        assert await Database.add_lesson(student, tutor, "2027-03-28", "02:30", "Математика")
+        assert await Database.add_lesson(student, tutor, "2027-10-31", "02:30", "Математика")
+        async with Database._acquire() as db:
+            cursor = await db.execute("SELECT starts_at FROM lessons WHERE tutor_id = ? ORDER BY starts_at", (tutor,))
+            return [row[0] for row in await cursor.fetchall()]
+
+    assert run_db(scenario) == [_utc(2027, 3, 28, 1, 30), _utc(2027, 10, 31, 0, 30)]
+
+
+def test_reminders_scheduled_in_utc_across_transitions():
+    scheduler = pytest.importorskip("scheduler")
+    reminders = scheduler.ReminderScheduler(bot=None)
+    spring = to_utc_timestamp("2027-03-28", "03:30", BERLIN)
+    autumn = to_utc_timestamp("2027-10-31", "02:30", BERLIN)
+    reminders._schedule_lesson(1, 2, 3, spring, "Математика")
+    reminders._schedule_lesson(2, 2, 3, autumn, "Математика")
+    # Напоминание за час до урока — по UTC, а не по местным часам
+    assert reminders._due[(scheduler.LESSON, 1)] == _utc(2027, 3, 28, 1, 30) - LESSON_REMINDER_LEAD_MINUTES * 60
+    assert reminders._due[(scheduler.LESSON, 2)] == _utc(2027, 10, 31, 0, 30) - LESSON_REMINDER_LEAD_MINUTES * 60
+
+    reminders._schedule_homework(5, 2, 3, "ДЗ", "2027-03-28", "02:30", "Europe/Berlin")
+    reminders._schedule_homework(6, 2, 3, "ДЗ", "2027-10-31", "03:00", "Europe/Berlin")
+    assert reminders._due[(scheduler.HOMEWORK, 5)] == _utc(2027, 3, 28, 1, 30)
+    assert reminders._due[(scheduler.HOMEWORK, 6)] == _utc(2027, 10, 31, 2, 0)
+    assert resolve_zone("Europe/Berlin") is resolve_zone("Europe/Berlin")
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+
+from database import Database
+from timezones import to_utc_timestamp
+
+TUTOR, STUDENT = 1, 2
+
+
+def _mondays(count):
+    today = date.today()
+    first = today + timedelta(days=7 - today.weekday())
+    return [(first + timedelta(weeks=i)).isoformat() for i in range(count)]
+
+
+async def _weekly_lessons(count=6):
+    await Database.add_user(TUTOR, "tutor", "Репетитор", role="admin", timezone="Europe/Berlin")
+    await Database.add_user(STUDENT, "student", "Студент", tutor_id=TUTOR)
+    days = _mondays(count)
+    for day in days:
+        assert await Database.add_lesson(STUDENT, TUTOR, day, "18:00", "Математика")
+    return days
+
+
+def test_weekly_lesson_is_shifted_past_same_students_next_lesson(run_db):
+    async def scenario():
+        days = await _weekly_lessons()
+        vacation_day = days[2]
+        result = await Database.apply_vacation_period(TUTOR, vacation_day, vacation_day, "Болезнь", shift=True)
+        lessons = await Database.get_lessons_between(0, 2 ** 62, tutor_id=TUTOR)
+        return days, result, lessons
+
+    days, result, lessons = run_db(scenario)
+    assert result['cancelled'] == []
+    assert len(result['shifted']) == 1
+    next_day = (date.fromisoformat(days[2]) + timedelta(days=1)).isoformat()
+    assert sorted((row[3], row[4]) for row in lessons) == sorted(
+        [(day, "18:00") for day in days if day != days[2]] + [(next_day, "18:00")]
+    )
+
+
+def test_vacation_without_shift_cancels_lessons(run_db):
+    async def scenario():
+        days = await _weekly_lessons(3)
+        return await Database.apply_vacation_period(TUTOR, days[0], days[1], shift=False)
+
+    result = run_db(scenario)
+    assert len(result['cancelled']) == 2
+    assert result['shifted'] == []
+
+
+def test_shift_skips_day_taken_by_another_worker(run_db):
+    async def scenario():
+        days = await _weekly_lessons(2)
+        vacation_day = days[0]
+        next_day = (date.fromisoformat(vacation_day) + timedelta(days=1)).isoformat()
+        # Урок другого студента, записанный другим воркером: индекс этого процесса о нём не знает
+        async with Database._acquire() as db:
+            await db.execute(
+                "INSERT INTO lessons (student_id, tutor_id, lesson_date, lesson_time, starts_at) VALUES (?, ?, ?, ?, ?)",
+                (3, TUTOR, next_day, "18:00", to_utc_timestamp(next_day, "18:00", ZoneInfo("Europe/Berlin")))
+            )
+            await db.commit()
+        result = await Database.apply_vacation_period(TUTOR, vacation_day, vacation_day, shift=True)
+        return vacation_day, result
+
+    vacation_day, result = run_db(scenario)
+    assert len(result['shifted']) == 1
+    expected = (date.fromisoformat(vacation_day) + timedelta(days=2)).isoformat()
+    assert result['shifted'][0][4] == to_utc_timestamp(expected, "18:00", ZoneInfo("Europe/Berlin"))
@@ -0,0 +1,102 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from constants import DEFAULT_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ZONE = ZoneInfo(DEFAULT_TIMEZONE)
+
+# Смещения вида "UTC+3", "GMT-05:30", "+3", "МСК+2"
+_OFFSET_RE = re.compile(r'^(UTC|GMT|МСК|MSK)?\s*([+-])\s*(\d{1,2})(?::?(\d{2}))?$', re.IGNORECASE)
+_MOSCOW_ALIASES = {'мск', 'msk', 'москва', 'moscow'}
+
+
+@lru_cache(maxsize=512)
+def resolve_zone(name: Optional[str]) -> tzinfo:
+    """Часовой пояс по значению users.timezone (IANA-имя или смещение от UTC/МСК).
+
+    Результат кэшируется: строка разбирается один раз на всё время работы.
+    """
+    if not name or not name.strip():
+        return DEFAULT_ZONE
+    value = name.strip()
+    if value.lower() in _MOSCOW_ALIASES:
+        return ZoneInfo("Europe/Moscow")
+
+    match = _OFFSET_RE.match(value)
+    if match:
+        base, sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if sign == '-':
+            offset = -offset
+        if base and base.lower() in ('мск', 'msk'):
+            offset += timedelta(hours=3)
+        try:
+            return timezone(offset)
+        except ValueError:
+            pass
+    else:
+        try:
+            return ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+
+    logger.warning(f"⚠️ Неизвестный часовой пояс '{value}', используется {DEFAULT_TIMEZONE}")
+    return DEFAULT_ZONE
+
+
+@lru_cache(maxsize=65536)
+def _utc_offset_seconds(zone: tzinfo, year: int, month: int, day: int, hour: int, minute: int) -> int:
+    """Смещение пояса от UTC для локальной минуты (кэшируется по минутам).
+
+    Переходы бывают не только на границе часа (Australia/Lord_Howe
+    переводит часы на 30 минут в 02:00, исторические переходы — в
+    произвольную минуту), а внутри одной минуты смещение постоянно.
+    """
+    return int(datetime(year, month, day, hour, minute, tzinfo=zone).utcoffset().total_seconds())
+
+
+def local_to_timestamp(local: datetime, zone: tzinfo = None) -> int:
+    """Наивное локальное время в поясе zone -> UNIX-время (UTC).
+
+    Несуществующее время (пропущенный при переходе час) трактуется со
+    смещением до перехода, неоднозначное — как первое из двух.
+    """
+    zone = zone or DEFAULT_ZONE
+    offset = _utc_offset_seconds(zone, local.year, local.month, local.day, local.hour, local.minute)
+    naive_utc = (local - datetime(1970, 1, 1)).total_seconds()
+    return int(naive_utc - offset)
+
+
+def timestamp_to_local(ts: float, zone: tzinfo = None) -> datetime:
+    """UNIX-время -> наивное локальное время в поясе zone"""
+    return datetime.fromtimestamp(ts, tz=zone or DEFAULT_ZONE).replace(tzinfo=None)
+
+
+def parse_local_datetime(date_str: str, time_str: Optional[str]) -> Optional[datetime]:
+    """Разобрать дату и время из TEXT-колонок (YYYY-MM-DD, HH:MM)"""
+    try:
+        return datetime.strptime(f"{date_str} {time_str or '00:00'}", '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return None
+
+
+def to_utc_timestamp(date_str: str, time_str: Optional[str], zone: tzinfo = None) -> Optional[int]:
+    """Локальные дата и время в поясе zone -> UNIX-время (UTC, секунды)"""
+    local = parse_local_datetime(date_str, time_str)
+    if local is None:
+        return None
+    return local_to_timestamp(local, zone)
+
+
+def local_date_bounds(start_date: str, end_date: str, zone: tzinfo = None) -> Optional[Tuple[int, int]]:
+    """Период дат (включительно) в поясе zone -> [начало первого дня, конец последнего) в UNIX-времени"""
+    first, last = parse_local_datetime(start_date, None), parse_local_datetime(end_date, None)
+    if first is None or last is None:
+        return None
+    return local_to_timestamp(first, zone), local_to_timestamp(last + timedelta(days=1), zone)
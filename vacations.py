@@ -0,0 +1,64 @@
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import message_dispatcher
+from database import Database
+from timezones import timestamp_to_local
+
+logger = logging.getLogger(__name__)
+
+
+def _when(ts: int, zone) -> str:
+    local = timestamp_to_local(ts, zone)
+    return f"{local.strftime('%Y-%m-%d')} в {local.strftime('%H:%M')}"
+
+
+async def build_vacation_notices(result: Dict[str, Any], start_date: str, end_date: str,
+                                 reason: str = None) -> List[Tuple[int, str]]:
+    """Одно сообщение на студента со всеми его отменёнными и перенесёнными уроками"""
+    affected: Dict[int, Dict[str, list]] = {}
+    for kind in ('cancelled', 'shifted'):
+        for item in result.get(kind, ()):
+            affected.setdefault(item[1], {'cancelled': [], 'shifted': []})[kind].append(item)
+
+    header = f"🏖 Репетитор в отпуске с {start_date} по {end_date}"
+    if reason:
+        header += f" ({reason})"
+    messages = []
+    for student_id, items in affected.items():
+        zone = await Database.get_user_zone(student_id)
+        lines = [header + "."]
+        if items['cancelled']:
+            lines.append("\n❌ Отменены уроки:")
+            lines += [f"• {_when(old, zone)} — {subject or 'урок'}" for _, _, subject, old, _ in items['cancelled']]
+        if items['shifted']:
+            lines.append("\n🔁 Перенесены уроки:")
+            lines += [f"• {_when(old, zone)} → {_when(new, zone)} — {subject or 'урок'}"
+                      for _, _, subject, old, new in items['shifted']]
+        messages.append((student_id, "\n".join(lines)))
+    return messages
+
+
+async def apply_vacation(tutor_id: int, start_date: str, end_date: str, reason: str = None,
+                         shift: bool = False) -> Dict[str, Any]:
+    """Записать отпуск репетитора, отменить или перенести уроки и уведомить студентов.
+
+    Изменения в базе — одна транзакция (Database.apply_vacation_period),
+    уведомления ставятся в очередь диспетчера сообщений одной пачкой.
+    """
+    result = await Database.apply_vacation_period(tutor_id, start_date, end_date, reason, shift=shift)
+    if not result:
+        return result
+    started = time.perf_counter()
+    messages = await build_vacation_notices(result, start_date, end_date, reason)
+    dispatcher = message_dispatcher.message_dispatcher
+    if dispatcher is not None:
+        result['notified'] = await dispatcher.send_many(messages)
+    else:
+        result['notified'] = 0
+        if messages:
+            logger.warning(f"⚠️ Диспетчер сообщений не запущен, {len(messages)} уведомлений об отпуске не отправлены")
+    logger.info(f"🏖 Уведомления об отпуске репетитора {tutor_id}: {result['notified']} студентам "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+    return result
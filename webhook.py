@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from constants import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                       WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_DEDUPE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Окно последних update_id: повторная доставка апдейта не обрабатывается"""
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self._order: Deque[int] = deque()
+        self._seen: Set[int] = set()
+
+    def seen(self, update_id: int) -> bool:
+        """True, если апдейт уже был; иначе запоминает его"""
+        if update_id in self._seen:
+            return True
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.size:
+            self._seen.discard(self._order.popleft())
+        return False
+
+
+def update_user_id(update: Update) -> Optional[int]:
+    """Пользователь (или чат), от которого пришёл апдейт"""
+    event = update.event
+    user = getattr(event, 'from_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, 'chat', None)
+    return chat.id if chat is not None else None
+
+
+class UpdateProcessor:
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+    Одновременно обрабатывается не больше max_in_flight апдейтов: submit()
+    ждёт свободного места. Апдейты одного пользователя выполняются по
+    порядку, чтобы состояние FSM не перемешивалось.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT):
+        self.bot = bot
+        self.dp = dp
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiters: Dict[int, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, update: Update):
+        """Поставить апдейт в обработку (ждёт, если все места заняты)"""
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Дождаться всех принятых апдейтов"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _process(self, update: Update):
+        key = update_user_id(update)
+        try:
+            if key is None:
+                await self._feed(update)
+                return
+            lock = self._chat_locks.setdefault(key, asyncio.Lock())
+            self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+            try:
+                async with lock:
+                    await self._feed(update)
+            finally:
+                self._chat_waiters[key] -= 1
+                if not self._chat_waiters[key]:
+                    del self._chat_waiters[key]
+                    del self._chat_locks[key]
+        finally:
+            self._slots.release()
+
+    async def _feed(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Ошибка обработки апдейта {update.update_id}: {e}")
+
+
+class WebhookServer:
+    """Приём апдейтов через вебхук вместо long polling.
+
+    Апдейт подтверждается Telegram сразу после постановки в обработку
+    (UpdateProcessor); пока все места заняты, новые запросы ждут, и
+    Telegram притормаживает доставку. Повторы Telegram (тот же update_id)
+    отбрасываются.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, url: str = WEBHOOK_URL, path: str = WEBHOOK_PATH,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, secret: Optional[str] = WEBHOOK_SECRET,
+                 max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT, dedupe_size: int = WEBHOOK_DEDUPE_SIZE):
+        self.bot = bot
+        self.dp = dp
+        self.url = url.rstrip('/') + path if url else None
+        self.path = path
+        self.host = host
+        self.port = port
+        # Без явного секрета генерируем свой: чужие запросы на путь вебхука отклоняются
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.processor = UpdateProcessor(bot, dp, max_in_flight)
+        self._dedupe = UpdateDeduplicator(dedupe_size)
+        self._runner: Optional[web.AppRunner] = None
+        self.received = 0
+        self.duplicates = 0
+        self.started_at = time.time()
+
+    def get_stats(self) -> dict:
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'processed': self.processor.processed,
+            'failed': self.processor.failed,
+            'in_flight': self.processor.in_flight,
+            'max_in_flight': self.processor.max_in_flight,
+            'uptime': round(time.time() - self.started_at, 1),
+        }
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/health', self.handle_health)
+        return app
+
+    async def start(self):
+        """Поднять HTTP-сервер и зарегистрировать вебхук в Telegram"""
+        if not self.url:
+            raise RuntimeError("Для режима вебхука нужен WEBHOOK_URL")
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp)
+        await self.bot.set_webhook(
+            self.url,
+            secret_token=self.secret,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"🌐 Вебхук {self.url} (сервер {self.host}:{self.port}, "
+                    f"до {self.processor.max_in_flight} апдейтов в работе)")
+
+    async def stop(self):
+        """Перестать принимать апдейты и дождаться уже принятых"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.processor.drain()
+        await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp)
+        logger.info(f"🌐 Вебхук остановлен: {self.get_stats()}")
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != self.secret:
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except Exception as e:
+            logger.error(f"❌ Некорректный апдейт вебхука: {e}")
+            # 200, чтобы Telegram не повторял заведомо битый апдейт
+            return web.Response()
+        self.received += 1
+        if self._dedupe.seen(update.update_id):
+            self.duplicates += 1
+            return web.Response()
+        await self.dispatch(update)
+        return web.Response()
+
+    async def dispatch(self, update: Update):
+        """Передать апдейт в обработку"""
+        await self.processor.submit(update)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запуск бота в режиме вебхука (до отмены задачи)"""
+    await WebhookServer(bot, dp).serve_forever()
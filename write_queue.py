@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ('sql', 'params', 'future')
+
+    def __init__(self, sql: str, params: Sequence[Any], future: asyncio.Future):
+        self.sql = sql
+        self.params = params
+        self.future = future
+
+
+class GroupCommitQueue:
+    """Очередь вставок с групповой фиксацией.
+
+    Вставки, пришедшие в пределах window секунд, выполняются одной
+    транзакцией (один fsync вместо одного на запрос); каждый вызывающий
+    получает свой lastrowid. Ошибка одной вставки откатывает только её
+    (SAVEPOINT), остальные фиксируются. Очередь ограничена max_pending —
+    при переполнении вызывающие ждут (обратное давление).
+    """
+
+    def __init__(self, acquire: Callable, window: float = 0.005, max_batch: int = 256,
+                 max_pending: int = 5000):
+        self._acquire = acquire
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        # Очередь и обработчик создаются при первой вставке в текущем цикле событий
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': self.pending,
+            'batches': self.batches,
+            'writes': self.writes,
+            'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def insert(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Выполнить вставку в ближайшей групповой транзакции и вернуть lastrowid"""
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Write(sql, params, future))
+        return await future
+
+    async def close(self):
+        """Дописать всё из очереди и остановить обработчик"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+
+    async def _collect(self) -> List[_Write]:
+        """Первая запись и всё, что успело прийти за окно группировки"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.error(f"❌ Ошибка групповой записи ({len(batch)} вставок): {e}")
+                for write in batch:
+                    if not write.future.done():
+                        write.future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: List[_Write]):
+        results: List[Tuple[_Write, Any, Optional[Exception]]] = []
+        async with self._acquire() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            for write in batch:
+                await db.execute("SAVEPOINT group_write")
+                try:
+                    cursor = await db.execute(write.sql, write.params)
+                    await db.execute("RELEASE group_write")
+                    results.append((write, cursor.lastrowid, None))
+                except Exception as e:
+                    await db.execute("ROLLBACK TO group_write")
+                    await db.execute("RELEASE group_write")
+                    results.append((write, None, e))
+            await db.commit()
+
+        self.batches += 1
+        self.writes += len(batch)
+        for write, rowid, error in results:
+            if write.future.done():
+                continue
+            if error is not None:
+                write.future.set_exception(error)
+            else:
+                write.future.set_result(rowid)